@@ -6,8 +6,12 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from api import startup_check
-from api.routes import billing, internal, kdm, proof, upload_stream, verify
-from api.utils.db import DB
+from api.routes import billing, internal, jobs, kdm, proof, upload_stream, verify
+from api.utils.db import close_pool, pool_stats, session
+from api.utils.job_reaper import REAPER
+from api.utils.kdm_crypto import ENGINE as KDM_ENGINE
+from api.utils.proof_batch import BATCHER
+from api.utils.queue_events import stop_listener
 
 
 class ErrorResponse(BaseModel):
@@ -67,18 +71,41 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
 
 
 @app.get("/healthz")
-async def healthz() -> dict[str, str]:
-    # Basic health + DB connectivity check
+def healthz() -> dict[str, Any]:
+    # Basic health + DB connectivity check (pooled; never opens a fresh connection)
     try:
-        db = DB()
-        with db.conn.cursor() as cur:
-            cur.execute("SELECT 1;")
-            cur.fetchone()
+        with session(timeout=2) as db:
+            with db.conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+                cur.fetchone()
         db_status = "ok"
     except Exception:
         db_status = "error"
 
-    return {"ok": "true" if db_status == "ok" else "false", "db": db_status}
+    return {
+        "ok": "true" if db_status == "ok" else "false",
+        "db": db_status,
+        "pool": pool_stats(),
+    }
+
+
+@app.on_event("startup")
+def _startup() -> None:
+    # Requeue jobs whose worker stopped heartbeating; retry ingest
+    # verifications that hit a transient S3 error
+    REAPER.add_sweep(upload_stream.retry_errored_uploads)
+    REAPER.start()
+    # Seal Merkle proof batches on their time window (and any left OPEN)
+    BATCHER.start()
+
+
+@app.on_event("shutdown")
+def _shutdown() -> None:
+    REAPER.stop()
+    BATCHER.stop()
+    KDM_ENGINE.close()
+    stop_listener()
+    close_pool()
 
 
 # Router registration
@@ -86,9 +113,11 @@ app.include_router(upload_stream.router)
 app.include_router(proof.router)
 app.include_router(internal.router)
 app.include_router(internal.router, prefix="/jobs")
+app.include_router(jobs.router, prefix="/jobs")
+# kdm before verify: GET /{ref} would otherwise swallow GET /kdms
+app.include_router(kdm.router)
 app.include_router(verify.router)
 app.include_router(billing.router)
-app.include_router(kdm.router)
 
 
 @app.get("/")
@@ -1,56 +1,88 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 import os
-from api.utils.db import DB
+import time
+from api.utils import job_reaper
+from api.utils.db import DB, get_db, session
+from api.utils.job_repo import JOB_REPO
+from api.utils.queue_events import get_listener
 
 router = APIRouter(prefix="/internal", tags=["internal"])
 
-db = DB()
 WORKER_TOKEN = os.getenv("WORKER_TOKEN", "dev-worker-token")
+MAX_CLAIM_BATCH = int(os.getenv("QD_MAX_CLAIM_BATCH", "32"))
+MAX_LONG_POLL_S = float(os.getenv("QD_MAX_LONG_POLL_S", "30"))
+LONG_POLL_RECHECK_S = float(os.getenv("QD_LONG_POLL_RECHECK_S", "5"))
+
+
+def _require_worker_id(worker_id: Optional[str]) -> str:
+    # leases are fenced on the holder's id; without one a report could not be told apart
+    if not worker_id:
+        raise HTTPException(400, "missing X-Worker-Id")
+    return worker_id
+
+
+def _claim(max_jobs: int, worker_id: str):
+    with session() as db:
+        return db.claim_jobs(max_jobs, worker_id)
 
 
 @router.post("/next-job")
-def next_job(x_worker_token: Optional[str] = Header(None)):
+async def next_job(
+    max_jobs: Optional[int] = Query(None, ge=1, le=MAX_CLAIM_BATCH),
+    wait: float = Query(0, ge=0, description="long-poll seconds (capped at QD_MAX_LONG_POLL_S)"),
+    x_worker_token: Optional[str] = Header(None),
+    x_worker_id: Optional[str] = Header(None),
+):
+    """Claim QUEUED jobs for a worker (SELECT ... FOR UPDATE SKIP LOCKED).
+
+    Without max_jobs the legacy single-job shape is returned; with max_jobs
+    the response is a list of up to that many claimed jobs. With wait > 0 an
+    empty queue parks the request (no DB connection held) until a
+    jobs_queued notification arrives or the wait elapses; longer waits are
+    clamped to QD_MAX_LONG_POLL_S rather than rejected. Claimed jobs are
+    leased to X-Worker-Id (required) and must be kept alive via /heartbeat.
+    """
     if x_worker_token != WORKER_TOKEN:
         raise HTTPException(401, "bad worker token")
+    _require_worker_id(x_worker_id)
+    wait = min(wait, MAX_LONG_POLL_S)
 
-    # NOTE:
-    # For production, replace with SELECT ... FOR UPDATE SKIP LOCKED.
-    # Here we just pick the first queued job.
-    with db.conn.cursor() as cur:
-        cur.execute(
-            """
-            select job_id, profile
-            from jobs
-            where status='QUEUED'
-            order by created_at
-            limit 1
-            """
-        )
-        row = cur.fetchone()
-
-        if not row:
-            return ("", 204)
-
-        job_id, profile = row
-
-        # mark job as processing
-        cur.execute(
-            """
-            update jobs
-            set status='PROCESSING', updated_at=now()
-            where job_id=%s
-            """,
-            (job_id,)
-        )
-
-        return {"job_id": job_id, "profile": profile}
+    listener = get_listener() if wait > 0 else None
+    deadline = time.monotonic() + wait
+    while True:
+        seen = listener.generation if listener else 0
+        rows = await run_in_threadpool(_claim, max_jobs or 1, x_worker_id)
+        remaining = deadline - time.monotonic()
+        if rows or listener is None or remaining <= 0:
+            break
+        # Recheck periodically even without a notification (listener down,
+        # deferred jobs becoming due).
+        await listener.wait(seen, min(remaining, LONG_POLL_RECHECK_S))
+
+    jobs = [
+        {"job_id": job_id, "profile": profile, "customer_id": str(customer_id)}
+        for job_id, profile, customer_id in rows
+    ]
+
+    if max_jobs is not None:
+        return jobs
+    if not jobs:
+        return ("", 204)
+    return jobs[0]
 
 
 @router.post("/update-job")
-def update_job(body: dict, x_worker_token: Optional[str] = Header(None)):
+def update_job(
+    body: dict,
+    x_worker_token: Optional[str] = Header(None),
+    x_worker_id: Optional[str] = Header(None),
+    db: DB = Depends(get_db),
+):
     if x_worker_token != WORKER_TOKEN:
         raise HTTPException(401, "bad worker token")
+    worker_id = _require_worker_id(x_worker_id)
 
     job_id = body.get("job_id")
     manifest = body.get("manifest")
@@ -60,8 +92,48 @@ def update_job(body: dict, x_worker_token: Optional[str] = Header(None)):
         raise HTTPException(400, "missing job_id")
 
     try:
-        db.update_job(job_id, manifest, status)
+        updated = db.update_job(job_id, manifest, status, worker_id)
     except Exception:
         raise HTTPException(404, "job not found")
+    if not updated:
+        # unknown job, or the lease moved to another worker after a reap
+        raise HTTPException(409, "job not found or lease lost")
+    JOB_REPO.invalidate(job_id)
 
     return {"ok": True}
+
+
+@router.post("/heartbeat")
+def heartbeat(
+    body: dict,
+    x_worker_token: Optional[str] = Header(None),
+    x_worker_id: Optional[str] = Header(None),
+    db: DB = Depends(get_db),
+):
+    """Extend the leases of a worker's in-flight jobs (job_id or job_ids).
+
+    Returns the subset still leased to the caller (X-Worker-Id); anything
+    missing was reaped and requeued.
+    """
+    if x_worker_token != WORKER_TOKEN:
+        raise HTTPException(401, "bad worker token")
+    worker_id = _require_worker_id(x_worker_id)
+
+    job_ids = body.get("job_ids") or ([body["job_id"]] if body.get("job_id") else [])
+    if not job_ids:
+        raise HTTPException(400, "missing job_id(s)")
+
+    return {"ok": True, "jobs": db.touch_jobs(job_ids, worker_id)}
+
+
+@router.post("/reap")
+def reap(x_worker_token: Optional[str] = Header(None)):
+    """Run one expired-lease sweep now (cron / ops hook)."""
+    if x_worker_token != WORKER_TOKEN:
+        raise HTTPException(401, "bad worker token")
+
+    rows = job_reaper.sweep()
+    return {
+        "ok": True,
+        "reaped": [{"job_id": j, "status": st, "attempts": n} for j, st, n in rows],
+    }
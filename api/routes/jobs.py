@@ -1,22 +1,28 @@
 """
 QuickDCP jobs router
-- In-memory job registry (replace with DB in production)
-- Create job (/jobs/render)
+- Jobs live in Postgres via the shared job repository (api.utils.job_repo)
+- Create job (/jobs/render), or many at once (/jobs/render:batch)
+- Submissions over the cost guard (api.utils.cost_guard) are rejected
 - Get job status or manifest (/jobs/{job_id})
-- List jobs (/jobs)
-- Worker internal endpoints: next-job, update-job (token guarded)
-- Manifest remains locked until TSA proof OK (via proof_store)
+- List jobs (/jobs): keyset-paginated, filterable, with a fields= projection
+- Scoped to the X-QD-Customer of the caller (require_auth)
+- Worker endpoints (next-job, update-job, heartbeat) live in api.routes.internal
+- Manifest remains locked until TSA proof OK (via the proof store)
 """
 from __future__ import annotations
 
 import os
 import secrets
-from typing import Dict, Optional, List, Literal
+from datetime import datetime
+from typing import Any, Dict, Optional, List, Tuple
 
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 
-from api.utils.proof_store import load as proof_load
+from api.utils import cost_guard
+from api.utils.auth import require_auth
+from api.utils.job_repo import JOB_REPO, LIST_FIELDS, JobExistsError, UnknownCustomerError
+from api.utils.proof_backend import STORE
 
 router = APIRouter()
 
@@ -41,78 +47,114 @@ class RenderResponse(BaseModel):
     status: str
 
 
-class JobSummary(BaseModel):
-    job_id: str
-    status: str
+class JobPage(BaseModel):
+    items: List[Dict[str, Any]] = Field(description="job_id plus the requested fields (default: status)")
+    next_cursor: Optional[str] = Field(default=None, description="Pass as cursor= for the next page; null on the last page")
 
 
-class ManifestQC(BaseModel):
-    audio_lufs: Optional[float] = None
-    video_issues: Optional[int] = None
-    subtitle_sync_ms: Optional[int] = None
+class RenderBatchRequest(BaseModel):
+    jobs: List[RenderRequest] = Field(min_length=1)
 
 
-class Manifest(BaseModel):
-    job_id: str
-    profile: dict = Field(default_factory=dict)
-    outputs: dict = Field(default_factory=dict)
-    qc: ManifestQC = Field(default_factory=ManifestQC)
-    proof: dict = Field(default_factory=dict)
+class RenderBatchItem(BaseModel):
+    job_id: Optional[str] = None
+    status: str = Field(description="QUEUED, or REJECTED with `error` set")
+    error: Optional[str] = None
 
 
-class WorkerNextResponse(BaseModel):
-    job_id: Optional[str] = None
-    profile: Optional[dict] = None
-    status: str = "EMPTY"
+class RenderBatchResponse(BaseModel):
+    created: int
+    results: List[RenderBatchItem] = Field(description="One entry per submitted job, in request order")
 
 
-class WorkerUpdateRequest(BaseModel):
-    job_id: str
-    manifest: Manifest
-    status: Literal["PASS", "FAIL", "PROCESSING", "QUEUED"] = Field(default="PASS")
+MAX_LIST_LIMIT = 500
+# Jobs accepted by one /render:batch call
+RENDER_BATCH_MAX = int(os.getenv("RENDER_BATCH_MAX", "500"))
 
 
-# ----------------------------------------------------------------------------
-# In-memory store (replace with DB)
-# ----------------------------------------------------------------------------
-JOBS: Dict[str, Dict] = {}
-WORKER_TOKEN = os.getenv("WORKER_TOKEN", "dev-worker-token")
+def _prepare(req: RenderRequest) -> Tuple[str, Dict[str, Any]]:
+    """(job_id, profile) for a render request; ValueError if over the cost guard."""
+    job_id = req.job_id or secrets.token_hex(6).upper()
+    profile = (
+        req.profile.model_dump() if isinstance(req.profile, BaseModel) else req.profile
+    ) or {}
+    if req.input_key:
+        # workers only see the profile when they claim a job
+        profile["input_key"] = req.input_key
+    if not cost_guard.allowed(profile):
+        raise ValueError(f"estimated cost exceeds {cost_guard.MAX_COST:g} EUR")
+    return job_id, profile
 
 
 # ----------------------------------------------------------------------------
-# Public API (auth applied at router include in main.py)
+# Public API (auth: require_auth, jobs scoped to X-QD-Customer)
 # ----------------------------------------------------------------------------
 @router.post("/render", response_model=RenderResponse)
-def render_job(req: RenderRequest):
+def render_job(req: RenderRequest, auth: Dict[str, str] = Depends(require_auth)):
     """
     Create a job and set it to QUEUED.
     Worker will pick it up via /internal/next-job.
     """
-    job_id = req.job_id or secrets.token_hex(6).upper()
-    if job_id in JOBS:
+    try:
+        job_id, profile = _prepare(req)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+
+    try:
+        JOB_REPO.create(job_id, auth["customer"], profile)
+    except JobExistsError:
         raise HTTPException(409, "job_id already exists")
-
-    JOBS[job_id] = {
-        "status": "QUEUED",
-        "profile": (
-            req.profile.model_dump() if isinstance(req.profile, BaseModel) else req.profile
-        ) or {},
-        "input_key": req.input_key,
-        "manifest": {"job_id": job_id, "proof": {}},
-    }
+    except UnknownCustomerError:
+        raise HTTPException(403, "unknown customer")
     return RenderResponse(job_id=job_id, status="QUEUED")
 
 
+@router.post("/render:batch", response_model=RenderBatchResponse)
+def render_jobs(req: RenderBatchRequest, auth: Dict[str, str] = Depends(require_auth)):
+    """
+    Create up to RENDER_BATCH_MAX jobs in one call (one multi-row insert).
+    Each job is accepted or rejected on its own: over the cost guard,
+    a job_id repeated in the batch, or an existing job_id.
+    """
+    if len(req.jobs) > RENDER_BATCH_MAX:
+        raise HTTPException(413, f"at most {RENDER_BATCH_MAX} jobs per batch")
+
+    results: List[RenderBatchItem] = []
+    todo: List[Tuple[int, str, Dict[str, Any]]] = []
+    seen = set()
+    for i, r in enumerate(req.jobs):
+        try:
+            job_id, profile = _prepare(r)
+        except ValueError as e:
+            results.append(RenderBatchItem(job_id=r.job_id, status="REJECTED", error=str(e)))
+            continue
+        if job_id in seen:
+            results.append(RenderBatchItem(job_id=job_id, status="REJECTED", error="duplicate job_id in batch"))
+            continue
+        seen.add(job_id)
+        results.append(RenderBatchItem(job_id=job_id, status="QUEUED"))
+        todo.append((i, job_id, profile))
+
+    try:
+        created = JOB_REPO.create_many(auth["customer"], [(j, p) for _, j, p in todo])
+    except UnknownCustomerError:
+        raise HTTPException(403, "unknown customer")
+    for (i, _, _), ok in zip(todo, created):
+        if not ok:
+            results[i] = RenderBatchItem(job_id=results[i].job_id, status="REJECTED", error="job_id already exists")
+    return RenderBatchResponse(created=sum(created), results=results)
+
+
 @router.get("/{job_id}")
-def job_status(job_id: str):
+def job_status(job_id: str, auth: Dict[str, str] = Depends(require_auth)):
     """
     Return job status if not proven; unlock manifest only after TSA OK.
     """
-    j = JOBS.get(job_id)
+    j = JOB_REPO.get(job_id, auth["customer"])
     if not j:
         raise HTTPException(404, "job not found")
 
-    rec = proof_load(job_id)
+    rec = STORE.load(job_id)
     if not rec or not rec.get("tsa_ok", False):
         # Still locked – only expose status
         return {"job_id": job_id, "status": j.get("status", "PENDING")}
@@ -120,51 +162,31 @@ def job_status(job_id: str):
     return j["manifest"]
 
 
-@router.get("", response_model=List[JobSummary])
-def list_jobs():
+@router.get("", response_model=JobPage)
+def list_jobs(
+    limit: int = Query(50, ge=1, le=MAX_LIST_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    status: Optional[str] = Query(None, description="comma-separated statuses, e.g. QUEUED,PROCESSING"),
+    created_after: Optional[datetime] = Query(None, description="created_at >= (ISO 8601)"),
+    created_before: Optional[datetime] = Query(None, description="created_at < (ISO 8601)"),
+    fields: Optional[str] = Query(None, description=f"comma-separated, from: {', '.join(LIST_FIELDS)}"),
+    auth: Dict[str, str] = Depends(require_auth),
+):
     """
-    List all jobs with their statuses (demo only, no paging).
-    """
-    return [JobSummary(job_id=jid, status=j["status"]) for jid, j in JOBS.items()]
-
-
-# ----------------------------------------------------------------------------
-# Internal worker API (token guarded via header)
-# ----------------------------------------------------------------------------
-@router.post("/internal/next-job", response_model=WorkerNextResponse)
-def next_job(x_worker_token: Optional[str] = Header(None)):
+    List the caller's jobs, newest first, one keyset page at a time.
     """
-    Worker pulls the next QUEUED job.
-    """
-    if x_worker_token != WORKER_TOKEN:
-        raise HTTPException(401, "bad token")
-
-    for jid, j in JOBS.items():
-        if j.get("status") == "QUEUED":
-            j["status"] = "PROCESSING"
-            return WorkerNextResponse(
-                job_id=jid,
-                profile=j.get("profile", {}),
-                status="PROCESSING",
-            )
-    return WorkerNextResponse(status="EMPTY")
-
-
-@router.post("/internal/update-job")
-def update_job(body: WorkerUpdateRequest, x_worker_token: Optional[str] = Header(None)):
-    """
-    Worker marks job as PASS/FAIL and stores manifest.
-    """
-    if x_worker_token != WORKER_TOKEN:
-        raise HTTPException(401, "bad token")
-
-    jid = body.job_id
-    if jid not in JOBS:
-        raise HTTPException(404, "job not found")
-
-    # Coerce Pydantic Manifest -> dict
-    JOBS[jid]["manifest"] = (
-        body.manifest.model_dump() if isinstance(body.manifest, BaseModel) else body.manifest
-    )
-    JOBS[jid]["status"] = body.status
-    return {"ok": True}
+    statuses = [x.strip() for x in status.split(",") if x.strip()] if status else None
+    cols = [x.strip() for x in fields.split(",") if x.strip()] if fields else None
+    try:
+        items, nxt = JOB_REPO.list(
+            auth["customer"],
+            limit=limit,
+            cursor=cursor,
+            statuses=statuses,
+            created_after=created_after,
+            created_before=created_before,
+            fields=cols,
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return JobPage(items=items, next_cursor=nxt)
@@ -2,44 +2,96 @@
 QuickDCP KDM router (fixed)
 - Issues stub KDM records and attaches them to the job manifest
 - Enforces max 60-day validity window
-- Accepts multiple cinema certificates
+- Accepts multiple cinema certificates, as PEM or as the fingerprint of a
+  certificate in the registry (/certs, api.utils.kdm_certs)
+- Batch issuance for wide releases (/issue/batch): kdms rows via COPY,
+  tracked in kdm_batches, results streamed back as NDJSON (api.utils.kdm_batch)
 - Provides list endpoint to inspect KDMs for a job
-NOTE: This is a non-cryptographic stub for MVP. In production, replace issuance
-with real KDM XML generation, key wrapping, and TSA timestamping.
+- KDM listing from the kdms table (/kdms): keyset-paginated by
+  (valid_until, id), filterable by job, device CN, batch and validity
+  window; /kdms/expiring answers "what expires in the next N hours"
+  across the caller's jobs without loading manifests
+- KDM XML comes from the engine in api.utils.kdm_crypto: KDM_ENGINE=stub
+  (default) issues records only; KDM_ENGINE=crypto wraps the content keys
+  per certificate (RSA-OAEP), signs the XML and stores it in the vault bucket
 """
 from __future__ import annotations
 
-import hashlib
+import json
+import os
 import uuid
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field, field_validator
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator, model_validator
 
-from api.routes.jobs import JOBS
+from api.utils import kdm_batch, kdm_certs
+from api.utils.auth import require_auth
+from api.utils.db import session
+from api.utils.job_repo import JOB_REPO, decode_cursor, encode_cursor
+from api.utils.kdm_certs import CERT_REGISTRY
+from api.utils.kdm_crypto import ENGINE, CertInfo, ContentKey, KDMContext, KDMCryptoError, Recipient
 
 router = APIRouter()
 
 MAX_DAYS = 60
+# Cinemas accepted by one /issue/batch call
+KDM_BATCH_MAX = int(os.getenv("KDM_BATCH_MAX", "20000"))
+MAX_LIST_LIMIT = 500
+# Upper bound for /kdms/expiring?within_hours=
+MAX_EXPIRING_HOURS = MAX_DAYS * 24
 
 # ---------------------------------------------------------------------------
 # Models
 # ---------------------------------------------------------------------------
 class CinemaCert(BaseModel):
-    cn: Optional[str] = Field(default=None, description="Common Name of the cinema device")
-    cert_pem: str = Field(description="Cinema certificate PEM text")
+    cn: Optional[str] = Field(default=None, description="Common Name of the cinema device; defaults to the certificate CN")
+    cert_pem: Optional[str] = Field(default=None, description="Cinema certificate PEM text")
+    cert_fingerprint: Optional[str] = Field(default=None, description="Fingerprint of a registered certificate (POST /certs)")
 
     @field_validator("cert_pem")
     @classmethod
-    def _trim(cls, v: str) -> str:
-        return v.strip()
+    def _trim(cls, v: Optional[str]) -> Optional[str]:
+        return v.strip() if v is not None else None
+
+    @field_validator("cert_fingerprint")
+    @classmethod
+    def _lower(cls, v: Optional[str]) -> Optional[str]:
+        return v.strip().lower() if v is not None else None
+
+    @model_validator(mode="after")
+    def _one_cert(self) -> "CinemaCert":
+        if bool(self.cert_pem) == bool(self.cert_fingerprint):
+            raise ValueError("provide exactly one of cert_pem or cert_fingerprint")
+        return self
+
+class CertRegisterRequest(BaseModel):
+    certs: List[str] = Field(description="Certificate PEMs, each optionally followed by its chain")
+
+class CertRecord(BaseModel):
+    cert_fingerprint: str
+    cn: Optional[str] = None
+    subject: Optional[str] = None
+    issuer: Optional[str] = None
+    serial: Optional[str] = None
+    not_before: Optional[datetime] = None
+    not_after: Optional[datetime] = None
+    error: Optional[str] = None
+
+class ContentKeyIn(BaseModel):
+    key_id: str = Field(description="Key UUID, as in the CPL")
+    key_type: str = Field(default="MDIK", description="MDIK, MDAK, MDSK, FMIK, FMAK or MDEK")
+    key_hex: str = Field(description="AES-128 content key, 32 hex chars")
 
 class KDMIssueRequest(BaseModel):
     job_id: str
     cinemas: List[CinemaCert]
     key_id: Optional[str] = Field(default=None, description="Content key identifier (UUID hex)")
     cpl_id: Optional[str] = Field(default=None, description="Composition Playlist UUID")
+    content_keys: Optional[List[ContentKeyIn]] = Field(default=None, description="Keys to wrap (required with KDM_ENGINE=crypto)")
+    title: Optional[str] = Field(default=None, description="ContentTitleText; defaults to job_id")
     valid_from: Optional[datetime] = Field(default=None, description="UTC start time; default now")
     valid_until: Optional[datetime] = Field(default=None, description="UTC end time; mutually exclusive with days")
     days: Optional[int] = Field(default=14, description=f"Validity window in days (max {MAX_DAYS})")
@@ -52,6 +104,20 @@ class KDMIssueRequest(BaseModel):
             raise ValueError(f"days must be 1..{MAX_DAYS}")
         return v
 
+class KDMBatchRequest(KDMIssueRequest):
+    label: Optional[str] = Field(default=None, description="e.g. Festival delivery wave 1")
+    created_by: Optional[str] = Field(default=None, description="operator or system issuing the batch")
+
+class KDMBatchStatus(BaseModel):
+    batch_id: str
+    job_id: str
+    label: str
+    created_by: Optional[str] = None
+    total_kdms: int
+    status: str
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
 class KDMRecord(BaseModel):
     kdm_id: str
     cn: str
@@ -61,12 +127,21 @@ class KDMRecord(BaseModel):
     key_id: str
     cpl_id: Optional[str] = None
     delivered: bool = False
+    vault_key: Optional[str] = None
 
 class KDMIssueResponse(BaseModel):
     job_id: str
     kdm_count: int
     kdms: List[KDMRecord]
 
+class KDMListItem(KDMRecord):
+    job_id: str
+    batch_id: Optional[str] = None
+
+class KDMPage(BaseModel):
+    items: List[KDMListItem]
+    next_cursor: Optional[str] = Field(default=None, description="Pass as cursor= for the next page; null on the last page")
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -77,9 +152,59 @@ def _iso(dt: datetime) -> str:
     return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
-def _fpem(pem: str) -> str:
-    """Return a short fingerprint of a PEM (sha256 hex)."""
-    return hashlib.sha256(pem.encode("utf-8")).hexdigest()
+def _cert_record(fp: str, cert: Optional[CertInfo], err: Optional[str] = None) -> CertRecord:
+    if cert is None:
+        return CertRecord(cert_fingerprint=fp, error=err)
+    return CertRecord(
+        cert_fingerprint=fp,
+        cn=cert.cn,
+        subject=cert.subject,
+        issuer=cert.issuer,
+        serial=str(cert.serial),
+        not_before=cert.not_before,
+        not_after=cert.not_after,
+    )
+
+
+def _window(body: KDMIssueRequest) -> Tuple[datetime, datetime]:
+    """Resolve (valid_from, valid_until) and enforce the MAX_DAYS window."""
+    start = body.valid_from or datetime.now(timezone.utc)
+    if body.valid_until and body.days is not None:
+        raise HTTPException(400, "Provide either valid_until or days, not both")
+    if body.valid_until is None:
+        days = body.days or 14
+        if days > MAX_DAYS:
+            raise HTTPException(400, f"days cannot exceed {MAX_DAYS}")
+        return start, start + timedelta(days=days)
+    end = body.valid_until
+    delta = end - start
+    if delta.total_seconds() <= 0:
+        raise HTTPException(400, "valid_until must be after valid_from")
+    if delta > timedelta(days=MAX_DAYS):
+        raise HTTPException(400, f"valid window cannot exceed {MAX_DAYS} days")
+    return start, end
+
+def _engine_ctx(body: KDMIssueRequest, start: datetime, end: datetime) -> KDMContext:
+    """Engine input for a request; 400 if the configured engine cannot issue it."""
+    try:
+        keys = tuple(
+            ContentKey(str(uuid.UUID(k.key_id)), k.key_type, bytes.fromhex(k.key_hex))
+            for k in body.content_keys or ()
+        )
+    except ValueError:
+        raise HTTPException(400, "content_keys need a UUID key_id and a hex key_hex")
+    ctx = KDMContext(body.job_id, body.cpl_id, body.title or body.job_id, keys, start, end, datetime.now(timezone.utc))
+    try:
+        ENGINE.check(ctx)
+    except KDMCryptoError as e:
+        raise HTTPException(400, str(e))
+    return ctx
+
+
+def _key_id(body: KDMIssueRequest) -> str:
+    if body.key_id:
+        return body.key_id
+    return body.content_keys[0].key_id if body.content_keys else str(uuid.uuid4())
 
 # ---------------------------------------------------------------------------
 # Routes
@@ -87,38 +212,29 @@ def _fpem(pem: str) -> str:
 @router.post("/issue", response_model=KDMIssueResponse)
 def issue_kdm(body: KDMIssueRequest):
     job_id = body.job_id
-    j = JOBS.get(job_id)
+    j = JOB_REPO.get(job_id)
     if not j:
         raise HTTPException(404, "job not found")
     if not body.cinemas:
         raise HTTPException(400, "cinemas is required and cannot be empty")
 
-    # Resolve validity window
-    start = body.valid_from or datetime.now(timezone.utc)
-    if body.valid_until and body.days is not None:
-        raise HTTPException(400, "Provide either valid_until or days, not both")
-    if body.valid_until is None:
-        days = body.days or 14
-        if days > MAX_DAYS:
-            raise HTTPException(400, f"days cannot exceed {MAX_DAYS}")
-        end = start + timedelta(days=days)
-    else:
-        end = body.valid_until
-        delta = end - start
-        if delta.total_seconds() <= 0:
-            raise HTTPException(400, "valid_until must be after valid_from")
-        if delta > timedelta(days=MAX_DAYS):
-            raise HTTPException(400, f"valid window cannot exceed {MAX_DAYS} days")
+    start, end = _window(body)
+    ctx = _engine_ctx(body, start, end)
+    key_id = _key_id(body)
 
-    key_id = body.key_id or str(uuid.uuid4())
+    # certificates come from the registry; inline PEMs are registered on first use
+    resolved = CERT_REGISTRY.resolve([(c.cert_pem, c.cert_fingerprint) for c in body.cinemas], strict=ENGINE.name != "stub")
+    for fp, (_, err) in resolved:
+        if err:
+            raise HTTPException(400, f"{fp}: {err}")
 
     kdms: List[KDMRecord] = []
-    for c in body.cinemas:
-        cn = c.cn or "CINEMA-UNKNOWN"
+    for c, (fp, (cert, _)) in zip(body.cinemas, resolved):
+        cn = c.cn or (cert and cert.cn) or "CINEMA-UNKNOWN"
         rec = KDMRecord(
             kdm_id=str(uuid.uuid4()),
             cn=cn,
-            cert_fingerprint=_fpem(c.cert_pem),
+            cert_fingerprint=fp,
             valid_from=_iso(start),
             valid_until=_iso(end),
             key_id=key_id,
@@ -127,18 +243,118 @@ def issue_kdm(body: KDMIssueRequest):
         )
         kdms.append(rec)
 
-    # Attach to manifest
-    manifest = j.setdefault("manifest", {})
-    klist = manifest.setdefault("kdm", [])
+    recips = [
+        Recipient(r.kdm_id, r.cn, c.cert_pem or "", r.cert_fingerprint, cert)
+        for r, c, (_, (cert, _)) in zip(kdms, body.cinemas, resolved)
+    ]
+    # atomic: a bad recipient rejects the request before anything reaches the vault
+    results = list(ENGINE.issue(ctx, recips, atomic=True))
+    for kdm_id, _, err in results:
+        if err:
+            raise HTTPException(400, f"{kdm_id}: {err}")
+    vault = {kdm_id: vault_key for kdm_id, vault_key, _ in results}
     for r in kdms:
-        klist.append(r.model_dump())
+        r.vault_key = vault[r.kdm_id]
+
+    # Attach to manifest (appended in the DB, so concurrent issues don't clobber each other)
+    JOB_REPO.append_kdms(job_id, [r.model_dump() for r in kdms])
 
     return KDMIssueResponse(job_id=job_id, kdm_count=len(kdms), kdms=kdms)
 
 
+@router.post("/issue/batch")
+def issue_kdm_batch(body: KDMBatchRequest):
+    """
+    Issue one KDM per cinema for a wide release. The response is NDJSON:
+    a "batch" line, one "kdm" line per KDM as its chunk commits, and a
+    final "complete" or "failed" line. GET /issue/batch/{batch_id} reports
+    the batch afterwards.
+    """
+    j = JOB_REPO.get(body.job_id)
+    if not j:
+        raise HTTPException(404, "job not found")
+    if not body.cinemas:
+        raise HTTPException(400, "cinemas is required and cannot be empty")
+    if len(body.cinemas) > KDM_BATCH_MAX:
+        raise HTTPException(413, f"at most {KDM_BATCH_MAX} cinemas per batch")
+    start, end = _window(body)
+    ctx = _engine_ctx(body, start, end)
+
+    try:
+        events = kdm_batch.issue(
+            body.job_id,
+            j["customer"],
+            [(c.cn, c.cert_pem, c.cert_fingerprint) for c in body.cinemas],
+            ctx,
+            key_id=_key_id(body),
+            label=body.label,
+            created_by=body.created_by,
+        )
+    except LookupError:
+        raise HTTPException(404, "job not found")
+    return StreamingResponse(
+        (json.dumps(e, separators=(",", ":")) + "\n" for e in events),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/certs", response_model=List[CertRecord])
+def register_certs(body: CertRegisterRequest):
+    """
+    Register cinema certificates so issue requests can reference them by
+    cert_fingerprint. Returns one record per PEM, in order; a certificate
+    that cannot be used (unreadable, non-RSA key, broken chain) gets an
+    error instead and is not stored. Registering again is a no-op.
+    """
+    if not body.certs:
+        raise HTTPException(400, "certs is required and cannot be empty")
+    if len(body.certs) > KDM_BATCH_MAX:
+        raise HTTPException(413, f"at most {KDM_BATCH_MAX} certificates per call")
+    pems = [p.strip() for p in body.certs]
+    fps = kdm_certs.fingerprints(pems)
+    return [_cert_record(fp, c, err) for fp, (c, err) in zip(fps, CERT_REGISTRY.register(pems, fps))]
+
+
+@router.get("/certs/{fingerprint}", response_model=CertRecord)
+def get_cert(fingerprint: str):
+    fp = fingerprint.lower()
+    cert = CERT_REGISTRY.get(fp)
+    if cert is None:
+        raise HTTPException(404, "certificate not found")
+    return _cert_record(fp, cert)
+
+
+@router.get("/issue/batch/{batch_id}", response_model=KDMBatchStatus)
+def kdm_batch_status(batch_id: str):
+    try:
+        uuid.UUID(batch_id)
+    except ValueError:
+        raise HTTPException(404, "batch not found")
+    with session() as db:
+        b = db.kdm_batch_get(batch_id)
+    if not b:
+        raise HTTPException(404, "batch not found")
+    return KDMBatchStatus(**b)
+
+
+def _kdm_record(r: Dict) -> Dict:
+    """kdms row (db.kdms_for_job / kdms_page) -> KDMRecord fields."""
+    return dict(
+        kdm_id=str(r["kdm_id"]),
+        cn=r["cn"],
+        cert_fingerprint=r["cert_fingerprint"] or "",
+        valid_from=_iso(r["valid_from"]),
+        valid_until=_iso(r["valid_until"]),
+        key_id=r["key_id"] or "",
+        cpl_id=r["cpl_id"],
+        delivered=r["delivered"],
+        vault_key=r["vault_key"],
+    )
+
+
 @router.get("/list/{job_id}", response_model=List[KDMRecord])
 def list_kdms(job_id: str):
-    j = JOBS.get(job_id)
+    j = JOB_REPO.get(job_id)
     if not j:
         raise HTTPException(404, "job not found")
     out = []
@@ -148,4 +364,73 @@ def list_kdms(job_id: str):
         except Exception:
             # ignore malformed entries in MVP
             continue
-    return out
\ No newline at end of file
+    # batch-issued KDMs live in the kdms table only; /issue writes both
+    seen = {r.kdm_id for r in out}
+    with session() as db:
+        rows = db.kdms_for_job(job_id)
+    for r in rows:
+        if str(r["kdm_id"]) not in seen:
+            out.append(KDMRecord(**_kdm_record(r)))
+    return out
+
+
+def _page(customer: str, limit: int, cursor: Optional[str], **filters) -> KDMPage:
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    batch_id = filters.get("batch_id")
+    if batch_id:
+        try:
+            uuid.UUID(batch_id)
+        except ValueError:
+            raise HTTPException(400, "batch_id must be a UUID")
+    with session(customer) as db:
+        # one extra row tells us whether another page exists
+        rows = db.kdms_page(customer, limit + 1, after=after, **filters)
+    nxt = encode_cursor(rows[limit - 1]["_key"]) if len(rows) > limit else None
+    items = [
+        KDMListItem(**_kdm_record(r), job_id=r["job_id"], batch_id=r["batch_id"])
+        for r in rows[:limit]
+    ]
+    return KDMPage(items=items, next_cursor=nxt)
+
+
+@router.get("/kdms", response_model=KDMPage)
+def list_kdms_page(
+    job_id: Optional[str] = Query(None, description="only this job's KDMs"),
+    cn: Optional[str] = Query(None, description="device CN (exact)"),
+    batch_id: Optional[str] = Query(None, description="only KDMs of this /issue/batch batch"),
+    valid_until_from: Optional[datetime] = Query(None, description="valid_until >= (ISO 8601)"),
+    valid_until_to: Optional[datetime] = Query(None, description="valid_until < (ISO 8601)"),
+    limit: int = Query(50, ge=1, le=MAX_LIST_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    auth: Dict[str, str] = Depends(require_auth),
+):
+    """
+    The caller's KDMs, soonest valid_until first, one keyset page at a time.
+    """
+    return _page(
+        auth["customer"], limit, cursor,
+        job_id=job_id, cn=cn, batch_id=batch_id,
+        valid_until_from=valid_until_from, valid_until_to=valid_until_to,
+    )
+
+
+@router.get("/kdms/expiring", response_model=KDMPage)
+def list_kdms_expiring(
+    within_hours: int = Query(48, ge=1, le=MAX_EXPIRING_HOURS),
+    cn: Optional[str] = Query(None, description="device CN (exact)"),
+    limit: int = Query(50, ge=1, le=MAX_LIST_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    auth: Dict[str, str] = Depends(require_auth),
+):
+    """
+    KDMs across all of the caller's jobs that are still valid but expire
+    within the next `within_hours`, soonest first.
+    """
+    now = datetime.now(timezone.utc)
+    return _page(
+        auth["customer"], limit, cursor,
+        cn=cn, valid_until_from=now, valid_until_to=now + timedelta(hours=within_hours),
+    )
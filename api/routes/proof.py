@@ -1,24 +1,27 @@
 """
 QuickDCP proof router (fixed)
 - Deterministic TSQ generation from canonicalized job manifest (sha256)
-- TSA acknowledgment and OpenSSL verification
-- Persist proof state per job_id using proof_store
+- TSA acknowledgment and RFC-3161 verification (in-process, see api.utils.tsa)
+- Optional Merkle batching: many manifest hashes share one TSQ/TSR over the
+  tree root; each job keeps its inclusion path (see api.utils.proof_batch)
+- Persist proof state per job_id in the configured proof store
+  (api.utils.proof_backend: file | postgres | memory, optional LRU)
 - Status endpoint to inspect current proof record
-Requirements: openssl available in runtime image.
+Requirements: openssl only for TSA_MODE=openssl|crosscheck.
 """
 from __future__ import annotations
 
 from base64 import b64encode, b64decode
-import subprocess
-import tempfile
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from pydantic import BaseModel, Field
 
-from api.routes.jobs import JOBS
+from api.utils.job_repo import JOB_REPO
 from api.utils.manifest import sha256_manifest
-from api.utils.proof_store import init as proof_init, load as proof_load, save as proof_save
+from api.utils.proof_batch import BATCH_ENABLED, BATCHER, ack_batch
+from api.utils.proof_backend import STORE
+from api.utils.tsa import OpenSSLNotFound, TSAVerifyError, build_tsq, verify_tsr
 
 router = APIRouter()
 
@@ -27,11 +30,14 @@ router = APIRouter()
 # ---------------------------------------------------------------------------
 class ProofInitReq(BaseModel):
     job_id: str = Field(description="Target job id")
+    batch: Optional[bool] = Field(default=None, description="Merkle-batch this proof (default: env TSA_BATCH)")
 
 class ProofInitRes(BaseModel):
     job_id: str
     manifest_sha256: str
-    tsq_der: str = Field(description="Base64-encoded TSQ in DER format")
+    tsq_der: Optional[str] = Field(default=None, description="Base64-encoded TSQ in DER format (unbatched only)")
+    batch_id: Optional[str] = None
+    leaf_index: Optional[int] = None
 
 class ProofAckReq(BaseModel):
     job_id: str
@@ -43,75 +49,118 @@ class ProofStatusRes(BaseModel):
     status: str
     manifest_sha256: str
     tsa_ok: bool
+    batch_id: Optional[str] = None
+    leaf_index: Optional[int] = None
+    merkle_root: Optional[str] = None
+    merkle_path: Optional[List[str]] = None
+
+class BatchAckReq(BaseModel):
+    tsr_base64: str = Field(description="Base64-encoded TSR (DER) over the batch root")
+    tsa_cert_pem: Optional[str] = Field(default=None, description="Optional CA bundle to verify against")
+
+class BatchRes(BaseModel):
+    batch_id: str
+    status: str = Field(description="OPEN, SEALED or TSA_OK")
+    size: int
+    merkle_root: Optional[str] = None
+    tsq_der: Optional[str] = Field(default=None, description="Base64 TSQ over the root (once sealed)")
+    created_at: Optional[str] = None
+    sealed_at: Optional[str] = None
+    tsa_at: Optional[str] = None
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _openssl_ts_query_hex_digest(sha_hex: str) -> bytes:
-    """Return a TSQ (DER) for a given hex SHA-256 digest using openssl."""
+def _tsq_for_digest(sha_hex: str) -> bytes:
+    """Return a TSQ (DER) for a given hex SHA-256 digest."""
+    try:
+        return build_tsq(sha_hex)
+    except OpenSSLNotFound:
+        raise HTTPException(500, "openssl not found in runtime")
+    except (RuntimeError, ValueError) as e:
+        raise HTTPException(500, f"TSQ build failed: {e}")
+
+
+def _verify_tsr(tsr_der: bytes, sha_hex: str, ca_pem: Optional[str]) -> None:
+    """Verify TSR against the TSQ for sha_hex; raise HTTPException on failure."""
     try:
-        return subprocess.check_output([
-            "openssl", "ts", "-query",
-            "-sha256", "-digest", sha_hex,
-            "-cert", "-no_nonce", "-outform", "DER",
-        ])
-    except FileNotFoundError:
+        verify_tsr(tsr_der, sha_hex, ca_pem)
+    except TSAVerifyError as e:
+        raise HTTPException(400, f"TSA verify failed: {e}")
+    except OpenSSLNotFound:
         raise HTTPException(500, "openssl not found in runtime")
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(500, f"openssl ts -query failed: {e}")
-
-
-def _openssl_ts_verify(tsr_der: bytes, tsq_der: bytes, ca_pem: Optional[str]) -> None:
-    """Verify TSR against TSQ using openssl; raise HTTPException on failure."""
-    with tempfile.TemporaryDirectory() as d:
-        tsr_p = f"{d}/resp.tsr"
-        tsq_p = f"{d}/req.tsq"
-        with open(tsr_p, "wb") as f:
-            f.write(tsr_der)
-        with open(tsq_p, "wb") as f:
-            f.write(tsq_der)
-
-        cmd = ["openssl", "ts", "-verify", "-in", tsr_p, "-queryfile", tsq_p]
-        if ca_pem:
-            ca_p = f"{d}/tsa.pem"
-            with open(ca_p, "w", encoding="utf-8") as f:
-                f.write(ca_pem)
-            cmd.extend(["-CAfile", ca_p])
-        try:
-            out = subprocess.run(cmd, capture_output=True, text=True)
-        except FileNotFoundError:
-            raise HTTPException(500, "openssl not found in runtime")
-        if out.returncode != 0:
-            raise HTTPException(400, f"TSA verify failed: {out.stderr.strip() or out.stdout.strip()}")
+
+def _store_call(fn, *args):
+    """Run a proof store write; the Postgres store only knows jobs it has rows for."""
+    try:
+        return fn(*args)
+    except LookupError:
+        raise HTTPException(404, "job not found")
+
+
+def _status_res(job_id: str, rec: dict) -> ProofStatusRes:
+    return ProofStatusRes(
+        job_id=job_id,
+        status=rec.get("status", "PENDING"),
+        manifest_sha256=rec.get("manifest_sha256", ""),
+        tsa_ok=bool(rec.get("tsa_ok")),
+        batch_id=rec.get("batch_id"),
+        leaf_index=rec.get("leaf_index"),
+        merkle_root=rec.get("merkle_root"),
+        merkle_path=rec.get("merkle_path"),
+    )
+
+
+def _batch_res(batch: dict) -> BatchRes:
+    return BatchRes(
+        batch_id=batch["batch_id"],
+        status=batch["status"],
+        size=batch.get("size", len(batch.get("leaves", []))),  # open batches store only a count
+        merkle_root=batch.get("merkle_root"),
+        tsq_der=batch.get("tsq_der"),
+        created_at=batch.get("created_at"),
+        sealed_at=batch.get("sealed_at"),
+        tsa_at=batch.get("tsa_at"),
+    )
 
 # ---------------------------------------------------------------------------
 # Routes
 # ---------------------------------------------------------------------------
 @router.post("/init", response_model=ProofInitRes)
 def init_proof(body: ProofInitReq):
-    j = JOBS.get(body.job_id)
+    j = JOB_REPO.get(body.job_id)
     if not j:
         raise HTTPException(404, "job not found")
 
     # Hash canonical manifest; this allows TSQ creation even before TSA ack
     sha_hex = sha256_manifest(j["manifest"])
-    tsq_der = _openssl_ts_query_hex_digest(sha_hex)
+
+    if BATCH_ENABLED if body.batch is None else body.batch:
+        # One TSQ per batch root; the TSQ is available from /batch/{id} once sealed
+        batch_id, leaf_index = _store_call(BATCHER.add, body.job_id, sha_hex)
+        return ProofInitRes(job_id=body.job_id, manifest_sha256=sha_hex, batch_id=batch_id, leaf_index=leaf_index)
+
+    tsq_der = _tsq_for_digest(sha_hex)
 
     # Persist record skeleton
-    proof_init(body.job_id, sha_hex)
+    rec = _store_call(STORE.init, body.job_id, sha_hex)
+    if "batch_id" in rec:
+        for k in ("batch_id", "leaf_index", "merkle_root", "merkle_path"):
+            rec.pop(k, None)
+        rec.update(status="PENDING", tsa_ok=False)
+        _store_call(STORE.save, body.job_id, rec)
 
     return ProofInitRes(job_id=body.job_id, manifest_sha256=sha_hex, tsq_der=b64encode(tsq_der).decode())
 
 
 @router.post("/ack/tsa", response_model=ProofStatusRes)
 def ack_tsa(body: ProofAckReq):
-    rec = proof_load(body.job_id)
+    rec = STORE.load(body.job_id)
     if not rec:
         raise HTTPException(404, "init first")
-
-    # Recreate TSQ deterministically from stored manifest hash
-    tsq_der = _openssl_ts_query_hex_digest(rec["manifest_sha256"])  # determinism guard
+    if rec.get("batch_id"):
+        raise HTTPException(409, f"proof is batched; ack batch {rec['batch_id']} instead")
 
     tsr_der = None
     try:
@@ -119,19 +168,57 @@ def ack_tsa(body: ProofAckReq):
     except Exception:
         raise HTTPException(400, "tsr_base64 is not valid base64")
 
-    _openssl_ts_verify(tsr_der, tsq_der, body.tsa_cert_pem)
+    # Imprint is checked against the TSQ deterministically rebuilt from the stored hash
+    _verify_tsr(tsr_der, rec["manifest_sha256"], body.tsa_cert_pem)
 
     # Mark verified
     rec["tsa_ok"] = True
     rec["status"] = "TSA_OK"
-    proof_save(body.job_id, rec)
+    _store_call(STORE.save, body.job_id, rec)
 
     return ProofStatusRes(job_id=body.job_id, status=rec["status"], manifest_sha256=rec["manifest_sha256"], tsa_ok=True)
 
 
 @router.get("/status/{job_id}", response_model=ProofStatusRes)
 def proof_status(job_id: str):
-    rec = proof_load(job_id)
+    rec = STORE.load(job_id)
     if not rec:
         raise HTTPException(404, "no proof")
-    return ProofStatusRes(job_id=job_id, status=rec.get("status", "PENDING"), manifest_sha256=rec.get("manifest_sha256", ""), tsa_ok=bool(rec.get("tsa_ok")))
+    return _status_res(job_id, rec)
+
+
+@router.get("/batch/{batch_id}", response_model=BatchRes)
+def batch_status(batch_id: str):
+    batch = STORE.load_batch(batch_id)
+    if not batch:
+        raise HTTPException(404, "no batch")
+    return _batch_res(batch)
+
+
+@router.post("/batch/{batch_id}/ack", response_model=BatchRes)
+def batch_ack(batch_id: str, body: BatchAckReq):
+    """Attach the TSR for a sealed batch; every member proof becomes TSA_OK."""
+    try:
+        tsr_der = b64decode(body.tsr_base64)
+    except Exception:
+        raise HTTPException(400, "tsr_base64 is not valid base64")
+    try:
+        batch = ack_batch(batch_id, tsr_der, body.tsa_cert_pem)
+    except KeyError:
+        raise HTTPException(404, "no batch")
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+    except TSAVerifyError as e:
+        raise HTTPException(400, f"TSA verify failed: {e}")
+    except OpenSSLNotFound:
+        raise HTTPException(500, "openssl not found in runtime")
+    return _batch_res(batch)
+
+
+@router.get("/batch/{batch_id}/tsr")
+def batch_tsr(batch_id: str):
+    """Raw TSR (DER) for a timestamped batch, for offline verification."""
+    batch = STORE.load_batch(batch_id)
+    if not batch or not batch.get("tsr_base64"):
+        raise HTTPException(404, "no TSR for batch")
+    return Response(content=b64decode(batch["tsr_base64"]), media_type="application/timestamp-reply")
@@ -1,9 +1,19 @@
 """
 QuickDCP upload router (fixed)
-- S3 multipart upload: init, presign part URLs, complete
+- S3 multipart upload: init, presign part URLs (single or batched), complete
+- List uploaded parts so clients can resume an interrupted upload
 - Defaults to bucket from env S3_BUCKET_INGEST
 - SHA256 checksum flow (client must send x-amz-checksum-sha256 when PUTting parts)
 - Optional HEAD endpoint to verify final object exists
+- Ingest verification: full-file SHA-256 confirmed from S3 (ranged, parallel,
+  fixed memory) and recorded in the job manifest
+- The sha256 claimed at /init or /complete is stored (ingest_uploads, owned
+  by the uploading customer) and /complete starts verification
+  automatically; the owner's jobs whose input_key is that upload are not
+  claimed until it is VERIFIED, and fail on a mismatch. Verifications that
+  end in ERROR are retried by the job reaper (retry_errored_uploads).
+  POST /upload/verify re-runs verification on demand; a sha256 sent there
+  is only compared and reported, never stored.
 
 Auth is enforced by main.py include (require_auth).
 """
@@ -14,14 +24,21 @@ from typing import List, Optional
 
 import boto3
 from botocore.exceptions import ClientError
-from fastapi import APIRouter, Form, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Form, Header, HTTPException, Request
 from pydantic import BaseModel, Field
 
+from api.utils.db import session
+from api.utils.ingest_verify import IngestVerifyError, verify_object
+from api.utils.job_repo import JOB_REPO
+
 router = APIRouter()
 
 REGION = os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
 BUCKET_INGEST = os.getenv("S3_BUCKET_INGEST", "quickdcp-ingest")
 S3 = boto3.client("s3", region_name=REGION)
+PRESIGN_EXPIRES = 3600
+MAX_PRESIGN_BATCH = int(os.getenv("QD_MAX_PRESIGN_BATCH", "1000"))
+MAX_PART_NUMBER = 10000  # S3 multipart limit
 
 # ---------------------------------------------------------------------------
 # Models
@@ -30,11 +47,28 @@ class InitRes(BaseModel):
     upload_id: str
     key: str
     size: int
-    sha256: str
+    sha256: Optional[str] = None
 
 class PartSignRes(BaseModel):
     url: str
 
+class PartsSignReq(BaseModel):
+    key: str
+    upload_id: str
+    part_numbers: Optional[List[int]] = Field(default=None, description="explicit part numbers")
+    start: Optional[int] = Field(default=None, description="first part number of a range")
+    end: Optional[int] = Field(default=None, description="last part number of a range (inclusive)")
+
+class SignedPart(BaseModel):
+    part_number: int
+    url: str
+
+class PartsSignRes(BaseModel):
+    key: str
+    upload_id: str
+    expires_in: int
+    parts: List[SignedPart]
+
 class CompletePart(BaseModel):
     ETag: str
     PartNumber: int
@@ -43,6 +77,23 @@ class CompleteReq(BaseModel):
     key: str
     upload_id: str
     parts: List[CompletePart]
+    sha256: Optional[str] = Field(default=None, description="client full-file SHA-256 (hex), if hashed while streaming")
+
+class UploadedPart(BaseModel):
+    PartNumber: int
+    ETag: str
+    Size: Optional[int] = None
+    ChecksumSHA256: Optional[str] = None
+
+class ListPartsRes(BaseModel):
+    key: str
+    upload_id: str
+    parts: List[UploadedPart]
+
+class VerifyReq(BaseModel):
+    key: str
+    sha256: Optional[str] = Field(default=None, description="claimed full-file SHA-256 (hex) to check against")
+    job_id: Optional[str] = Field(default=None, description="record the result under this job's manifest.ingest")
 
 class HeadRes(BaseModel):
     key: str
@@ -56,10 +107,13 @@ class HeadRes(BaseModel):
 def init_upload(
     filename: str = Form(...),
     size: int = Form(...),
-    sha256: str = Form(...),
+    sha256: Optional[str] = Form(None),
+    x_qd_customer: str = Header(..., alias="X-QD-Customer"),
 ):
     """Start a multipart upload and return UploadId + object key.
     Client will PUT parts to presigned URLs with x-amz-checksum-sha256.
+    sha256 may be omitted by clients that hash in the same pass as the
+    upload and send it with /complete instead.
     """
     if not filename:
         raise HTTPException(400, "filename is required")
@@ -72,19 +126,15 @@ def init_upload(
         )
     except ClientError as e:
         raise HTTPException(500, f"s3 init failed: {e}")
+    with session() as db:
+        db.ingest_upload_init(key, r["UploadId"], size, sha256, x_qd_customer)
     return InitRes(upload_id=r["UploadId"], key=key, size=size, sha256=sha256)
 
 
-@router.post("/part", response_model=PartSignRes)
-def sign_part(
-    key: str = Form(...),
-    upload_id: str = Form(...),
-    part_number: int = Form(...),
-):
-    if not key or not upload_id or not part_number:
-        raise HTTPException(400, "key, upload_id, and part_number are required")
+def _presign_part(key: str, upload_id: str, part_number: int) -> str:
+    """Presign one upload_part URL (local HMAC, no S3 round trip)."""
     try:
-        url = S3.generate_presigned_url(
+        return S3.generate_presigned_url(
             "upload_part",
             Params={
                 "Bucket": BUCKET_INGEST,
@@ -93,15 +143,97 @@ def sign_part(
                 "PartNumber": int(part_number),
                 "ChecksumAlgorithm": "SHA256",
             },
-            ExpiresIn=3600,
+            ExpiresIn=PRESIGN_EXPIRES,
         )
     except ClientError as e:
         raise HTTPException(500, f"s3 presign failed: {e}")
-    return PartSignRes(url=url)
+
+
+@router.post("/part", response_model=PartSignRes)
+def sign_part(
+    key: str = Form(...),
+    upload_id: str = Form(...),
+    part_number: int = Form(...),
+):
+    if not key or not upload_id or not part_number:
+        raise HTTPException(400, "key, upload_id, and part_number are required")
+    return PartSignRes(url=_presign_part(key, upload_id, part_number))
+
+
+@router.post("/parts", response_model=PartsSignRes)
+def sign_parts(body: PartsSignReq):
+    """Presign many parts in one round trip (list or start..end range)."""
+    if not body.key or not body.upload_id:
+        raise HTTPException(400, "key and upload_id are required")
+    if body.part_numbers is not None:
+        numbers = sorted(set(body.part_numbers))
+    elif body.start is not None and body.end is not None:
+        if body.end < body.start:
+            raise HTTPException(400, "end must be >= start")
+        if body.end - body.start + 1 > MAX_PRESIGN_BATCH:
+            raise HTTPException(400, f"at most {MAX_PRESIGN_BATCH} parts per request")
+        numbers = list(range(body.start, body.end + 1))
+    else:
+        raise HTTPException(400, "provide part_numbers or start and end")
+
+    if not numbers:
+        raise HTTPException(400, "no part numbers requested")
+    if len(numbers) > MAX_PRESIGN_BATCH:
+        raise HTTPException(400, f"at most {MAX_PRESIGN_BATCH} parts per request")
+    if numbers[0] < 1 or numbers[-1] > MAX_PART_NUMBER:
+        raise HTTPException(400, f"part numbers must be 1..{MAX_PART_NUMBER}")
+
+    return PartsSignRes(
+        key=body.key,
+        upload_id=body.upload_id,
+        expires_in=PRESIGN_EXPIRES,
+        parts=[SignedPart(part_number=n, url=_presign_part(body.key, body.upload_id, n)) for n in numbers],
+    )
+
+
+@router.get("/parts/{upload_id}", response_model=ListPartsRes)
+def list_parts(upload_id: str, key: str):
+    """Parts S3 already holds for an open multipart upload (resume support)."""
+    parts: List[UploadedPart] = []
+    marker = 0
+    try:
+        while True:
+            r = S3.list_parts(
+                Bucket=BUCKET_INGEST,
+                Key=key,
+                UploadId=upload_id,
+                MaxParts=1000,
+                PartNumberMarker=marker,
+            )
+            for p in r.get("Parts", []):
+                parts.append(UploadedPart(
+                    PartNumber=p["PartNumber"],
+                    ETag=p["ETag"].strip('"'),
+                    Size=p.get("Size"),
+                    ChecksumSHA256=p.get("ChecksumSHA256"),
+                ))
+            if not r.get("IsTruncated"):
+                break
+            marker = r["NextPartNumberMarker"]
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code == "NoSuchUpload":
+            raise HTTPException(404, "upload not found (completed or aborted)")
+        raise HTTPException(500, f"s3 list parts failed: {e}")
+    return ListPartsRes(key=key, upload_id=upload_id, parts=parts)
 
 
 @router.post("/complete")
-async def complete(request: Request):
+async def complete(
+    request: Request,
+    background: BackgroundTasks,
+    x_qd_customer: str = Header(..., alias="X-QD-Customer"),
+):
+    """Complete the multipart upload and start ingest verification.
+
+    Verification runs after the response; until it records VERIFIED, jobs
+    using this key are not handed to workers.
+    """
     try:
         data = CompleteReq(**(await request.json()))
     except Exception:
@@ -117,7 +249,17 @@ async def complete(request: Request):
         )
     except ClientError as e:
         raise HTTPException(500, f"s3 complete failed: {e}")
-    return {"ok": True, "key": data.key}
+
+    with session() as db:
+        upload = db.ingest_upload_complete(data.key, data.sha256, x_qd_customer)
+    if upload is not None:
+        background.add_task(_auto_verify, data.key)
+    return {
+        "ok": True,
+        "key": data.key,
+        "sha256": upload["claimed_sha256"] if upload else data.sha256,
+        "verification": "pending" if upload else None,
+    }
 
 
 @router.get("/head", response_model=HeadRes)
@@ -131,3 +273,109 @@ def head(key: str):
         if code in {"404", "NoSuchKey"}:
             return HeadRes(key=key, exists=False)
         raise HTTPException(500, f"s3 head failed: {e}")
+
+
+def verify_upload(key: str, previous: Optional[dict] = None) -> dict:
+    """Verify an ingest object and record the outcome (upload row + owner's queued jobs).
+
+    The object is checked against the sha256 claimed at /init or /complete;
+    only that stored claim decides VERIFIED / MISMATCH. Raises like
+    verify_object; the upload is then marked ERROR (retried later, see
+    retry_errored_uploads) so it stays gated meanwhile.
+    """
+    with session() as db:
+        upload = db.ingest_upload_get(key)
+    expected = upload["claimed_sha256"] if upload else None
+    if upload:
+        previous = previous or upload["ingest"]
+    try:
+        rec = verify_object(S3, BUCKET_INGEST, key, expected, previous=previous)
+    except (IngestVerifyError, ClientError) as e:
+        if upload:
+            with session() as db:
+                touched = db.ingest_upload_result(key, "ERROR", {"key": key, "error": str(e)})
+            for job_id in touched:
+                JOB_REPO.invalidate(job_id)
+        raise
+    if not upload:
+        return rec
+    status = "MISMATCH" if rec.get("match") is False else "VERIFIED"
+    with session() as db:
+        touched = db.ingest_upload_result(key, status, rec)
+    for job_id in touched:
+        JOB_REPO.invalidate(job_id)
+    return rec
+
+
+def _against(rec: dict, sha256: str) -> dict:
+    """rec re-compared with a caller's sha256 (reported only, never stored on the upload)."""
+    return {**rec, "claimed_sha256": sha256.lower(), "match": rec["sha256"] == sha256.lower()}
+
+
+def _auto_verify(key: str) -> None:
+    """Background verification started by /complete (and by retries)."""
+    try:
+        rec = verify_upload(key)
+    except Exception as e:
+        print(f"[ingest] verify failed for {key}: {e}")
+        return
+    if rec.get("match") is False:
+        print(f"[ingest] sha256 mismatch for {key}: {rec['sha256']} != {rec['claimed_sha256']}")
+
+
+def retry_errored_uploads(limit: int = 10) -> List[str]:
+    """Re-run verifications that ended in ERROR and are due (job reaper hook)."""
+    with session() as db:
+        keys = db.ingest_uploads_due(limit)
+    for key in keys:
+        print(f"[ingest] retrying verification of {key}")
+        _auto_verify(key)
+    return keys
+
+
+@router.post("/verify")
+def verify_ingest(
+    body: VerifyReq,
+    x_qd_customer: Optional[str] = Header(None, alias="X-QD-Customer"),
+):
+    """Confirm the object's full-file SHA-256 from S3 and record it on the job.
+
+    Runs in the threadpool; no DB connection is held while the object is read.
+    The upload and its owner's queued jobs are updated from the check against
+    the sha256 claimed at /init or /complete (see verify_upload). A sha256 in
+    the body is compared with the digest for this response and the job_id
+    record only. Responds 409 if the digest differs from the sha256 checked
+    (the verified digest is still recorded).
+    """
+    if not body.key:
+        raise HTTPException(400, "key is required")
+
+    previous = None
+    if body.job_id:
+        if not x_qd_customer:
+            raise HTTPException(400, "X-QD-Customer is required with job_id")
+        job = JOB_REPO.get(body.job_id, x_qd_customer)
+        if not job:
+            raise HTTPException(404, "job not found")
+        previous = job["manifest"].get("ingest")
+
+    try:
+        rec = verify_upload(body.key, previous=previous)
+    except IngestVerifyError as e:
+        raise HTTPException(422, str(e))
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code in {"404", "NoSuchKey"}:
+            raise HTTPException(404, "object not found")
+        raise HTTPException(500, f"s3 verify failed: {e}")
+    if body.sha256:
+        rec = _against(rec, body.sha256)
+
+    if body.job_id:
+        with session(x_qd_customer) as db:
+            db.record_ingest(body.job_id, rec)
+        JOB_REPO.invalidate(body.job_id)
+
+    if rec.get("match") is False:
+        raise HTTPException(409, {"error": "sha256 mismatch", "ingest": rec})
+    return {"ok": True, "ingest": rec}
@@ -2,56 +2,146 @@
 Public verification endpoints (fixed)
 
 Allows anyone to check the status of a QuickDCP proof by job_id or by
-manifest SHA-256 (hex). Uses the local file-backed proof_store.
+manifest SHA-256 (hex). Reads the configured proof store
+(api.utils.proof_backend).
+
+Merkle-batched proofs are only VALID if the stored inclusion path leads from
+the manifest hash to the batch root and that root carries a verified TSR;
+the response includes everything needed to re-check it offline
+(ops/verify_offline.sh --sha <manifest_sha256> --path ... --tsr ...).
+
+HTTP caching
+------------
+Responses carry a strong ETag (SHA-256 of the JSON body) and honour
+If-None-Match with 304. VALID results get
+`Cache-Control: public, max-age=VERIFY_VALID_MAX_AGE` and PENDING results
+`max-age=VERIFY_PENDING_MAX_AGE`. A VALID proof is not final: /proof/init
+for the same job resets it to PENDING/BATCHED, so VALID responses are not
+marked immutable and their max-age bounds how long a reset goes unseen.
+Recently verified refs are also kept in an in-process LRU (same lifetimes)
+so bursts and CDN misses don't reach the proof store.
+
+Environment
+-----------
+VERIFY_VALID_MAX_AGE     seconds for VALID responses (default 60)
+VERIFY_PENDING_MAX_AGE   seconds for PENDING responses (default 5)
+VERIFY_CACHE_SIZE        in-process LRU entries (default 4096, 0 = off)
 """
 from __future__ import annotations
 
-from typing import Optional
+import hashlib
+import os
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel, Field
 
-from api.utils import proof_store
+from api.utils.proof_backend import STORE
+from api.utils.lru import TTLCache
+from api.utils.merkle import verify_inclusion
 
 router = APIRouter()
 
+VALID_MAX_AGE = int(os.getenv("VERIFY_VALID_MAX_AGE", "60"))
+PENDING_MAX_AGE = int(os.getenv("VERIFY_PENDING_MAX_AGE", "5"))
+CACHE_SIZE = int(os.getenv("VERIFY_CACHE_SIZE", "4096"))
+
+# ref -> (body, etag, cache_control)
+_CACHE = TTLCache(maxsize=CACHE_SIZE, ttl=PENDING_MAX_AGE) if CACHE_SIZE > 0 else None
+
 
 class VerifyResponse(BaseModel):
     status: str = Field(description="PENDING or VALID")
     job_id: Optional[str] = None
     manifest_sha256: Optional[str] = None
+    batch_id: Optional[str] = None
+    leaf_index: Optional[int] = None
+    merkle_root: Optional[str] = None
+    merkle_path: Optional[List[str]] = None
+    tsr_base64: Optional[str] = Field(default=None, description="Batch TSR over merkle_root (DER, base64)")
 
 
-@router.get("/{ref}", response_model=VerifyResponse)
-def verify(ref: str):
+def _response(rec: dict) -> VerifyResponse:
+    if not rec.get("batch_id"):
+        return VerifyResponse(
+            status="VALID" if rec.get("tsa_ok") else "PENDING",
+            job_id=rec.get("job_id"),
+            manifest_sha256=rec.get("manifest_sha256"),
+        )
+
+    # leaf -> root (inclusion path) -> TSR (verified when the batch was acked)
+    root = rec.get("merkle_root")
+    batch = STORE.load_batch(rec["batch_id"]) or {}
+    valid = bool(
+        rec.get("tsa_ok")
+        and root
+        and batch.get("status") == "TSA_OK"
+        and batch.get("merkle_root") == root
+        and verify_inclusion(rec.get("manifest_sha256", ""), rec.get("merkle_path") or [], root)
+    )
+    return VerifyResponse(
+        status="VALID" if valid else "PENDING",
+        job_id=rec.get("job_id"),
+        manifest_sha256=rec.get("manifest_sha256"),
+        batch_id=rec["batch_id"],
+        leaf_index=rec.get("leaf_index"),
+        merkle_root=root,
+        merkle_path=rec.get("merkle_path"),
+        tsr_base64=batch.get("tsr_base64") if valid else None,
+    )
+
+
+def _lookup(ref: str) -> VerifyResponse:
     """Verify by job_id or manifest SHA-256.
 
     1) Try to load a proof record by job_id (exact match)
-    2) If not found, scan known records and return the one whose
-       manifest_sha256 equals `ref` (case-insensitive)
+    2) If not found, look `ref` up in the manifest_sha256 index
+       (case-insensitive); one file read, independent of store size
     """
     # 1) As job_id
-    rec = proof_store.load(ref)
+    rec = STORE.load(ref)
     if rec:
-        return VerifyResponse(
-            status="VALID" if rec.get("tsa_ok") else "PENDING",
-            job_id=rec.get("job_id"),
-            manifest_sha256=rec.get("manifest_sha256"),
-        )
+        return _response(rec)
 
     # 2) As manifest sha
-    ref_hex = ref.lower()
-    try:
-        for jid in proof_store.list_ids():
-            r = proof_store.load(jid)
-            if r and str(r.get("manifest_sha256", "")).lower() == ref_hex:
-                return VerifyResponse(
-                    status="VALID" if r.get("tsa_ok") else "PENDING",
-                    job_id=r.get("job_id"),
-                    manifest_sha256=r.get("manifest_sha256"),
-                )
-    except Exception:
-        # fall through to 404
-        pass
+    jid = STORE.find_by_sha(ref)
+    if jid:
+        r = STORE.load(jid)
+        if r:
+            return _response(r)
 
     raise HTTPException(404, "not found")
+
+
+def _render(res: VerifyResponse) -> Tuple[bytes, str, str]:
+    body = res.model_dump_json().encode()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    max_age = VALID_MAX_AGE if res.status == "VALID" else PENDING_MAX_AGE
+    cc = f"public, max-age={max_age}"
+    return body, etag, cc
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+
+@router.get("/{ref}", response_model=VerifyResponse)
+def verify(ref: str, request: Request):
+    """Verify by job_id or manifest SHA-256 (see _lookup), with HTTP caching."""
+    hit = _CACHE.get(ref) if _CACHE is not None else None
+    if hit is None:
+        res = _lookup(ref)
+        hit = _render(res)
+        if _CACHE is not None:
+            _CACHE.set(ref, hit, ttl=VALID_MAX_AGE if res.status == "VALID" else PENDING_MAX_AGE)
+
+    body, etag, cc = hit
+    headers = {"ETag": etag, "Cache-Control": cc}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -10,7 +10,7 @@ def estimate_job_cost(profile: dict) -> float:
     You can replace this with actual GPU/CPU/time estimation.
     """
     minutes = float(profile.get("minutes", 10))
-    res = profile.get("res", "2K")
+    res = profile.get("res") or "2K"
 
     # simple multiplier
     res_factor = 1.0 if res == "2K" else 2.0
@@ -1,14 +1,46 @@
 import os
 import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
 import psycopg
+from psycopg import sql
+from fastapi import Header
+from psycopg_pool import ConnectionPool
 
 DB_URL = os.getenv("DATABASE_URL")
 
+# Pool sizing (per API process)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Job claiming
+DEFAULT_MAX_CONCURRENT = int(os.getenv("QD_DEFAULT_MAX_CONCURRENT_JOBS", "2"))
+CLAIM_SCAN_FACTOR = int(os.getenv("QD_CLAIM_SCAN_FACTOR", "4"))
+
+# Job leases
+JOB_LEASE_S = int(os.getenv("QD_JOB_LEASE_S", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("QD_JOB_MAX_ATTEMPTS", "5"))
+REQUEUE_BACKOFF_S = int(os.getenv("QD_REQUEUE_BACKOFF_S", "30"))
+REQUEUE_BACKOFF_MAX_S = int(os.getenv("QD_REQUEUE_BACKOFF_MAX_S", "3600"))
+
+# Ingest verification retries (uploads whose verification ended in ERROR)
+INGEST_VERIFY_ATTEMPTS = int(os.getenv("QD_INGEST_VERIFY_ATTEMPTS", "5"))
+INGEST_RETRY_S = int(os.getenv("QD_INGEST_RETRY_S", "30"))
+
 
 class DB:
-    def __init__(self):
+    def __init__(self, conn: Optional[psycopg.Connection] = None):
+        # Pooled use: wrap a connection checked out by session()
+        if conn is not None:
+            self.conn = conn
+            return
+
         # Robust connection with retry: Postgres may not be ready when API starts
-        import time
         from psycopg import OperationalError
 
         last_err = None
@@ -43,13 +75,18 @@ class DB:
             self.set_customer(customer_code)
             cur.execute(
                 """
-                insert into jobs(job_id, customer_id, status, profile, manifest)
+                insert into jobs(job_id, customer_id, status, profile, manifest, priority)
                 values (
                     %s,
-                    qd_customer_id(),
+                    qd.qd_customer_id(),
                     'QUEUED',
                     %s,
-                    %s
+                    %s,
+                    coalesce(
+                        (select default_priority from queue_configs
+                         where customer_id = qd.qd_customer_id()),
+                        0
+                    )
                 )
                 on conflict(job_id)
                 do update set profile = excluded.profile
@@ -64,6 +101,191 @@ class DB:
             row = cur.fetchone()
             return row[0]
 
+    def insert_job(self, job_id: str, customer_code: str, profile: dict) -> Optional[str]:
+        """Create a QUEUED job; never touches an existing one.
+
+        Returns "created", "exists", or None when the customer is unknown.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                insert into jobs(job_id, customer_id, status, profile, manifest, priority)
+                select %s, c.id, 'QUEUED', %s, %s,
+                       coalesce(
+                           (select default_priority from queue_configs q
+                            where q.customer_id = c.id),
+                           0
+                       )
+                from customers c
+                where c.code = %s
+                on conflict(job_id) do nothing
+                returning id
+                """,
+                (
+                    job_id,
+                    json.dumps(profile),
+                    json.dumps({"job_id": job_id, "proof": {}}),
+                    customer_code,
+                )
+            )
+            if cur.fetchone():
+                return "created"
+            cur.execute("select 1 from customers where code=%s", (customer_code,))
+            return "exists" if cur.fetchone() else None
+
+    def insert_jobs(self, customer_code: str, jobs: Sequence[Tuple[str, dict]]) -> Optional[List[str]]:
+        """Create many QUEUED jobs in one multi-row insert; existing ids are left alone.
+
+        `jobs` is [(job_id, profile)]. Returns the job_ids actually created,
+        or None when the customer is unknown.
+        """
+        if not jobs:
+            return []
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                insert into jobs(job_id, customer_id, status, profile, manifest, priority)
+                select t.job_id, c.id, 'QUEUED', t.profile,
+                       jsonb_build_object('job_id', t.job_id, 'proof', '{}'::jsonb),
+                       coalesce(
+                           (select default_priority from queue_configs q
+                            where q.customer_id = c.id),
+                           0
+                       )
+                from customers c,
+                     unnest(%s::text[], %s::jsonb[]) as t(job_id, profile)
+                where c.code = %s
+                on conflict(job_id) do nothing
+                returning job_id
+                """,
+                (
+                    [j for j, _ in jobs],
+                    [json.dumps(p) for _, p in jobs],
+                    customer_code,
+                )
+            )
+            created = [r[0] for r in cur.fetchall()]
+            if created:
+                return created
+            cur.execute("select 1 from customers where code=%s", (customer_code,))
+            return [] if cur.fetchone() else None
+
+    def get_job_record(self, job_id: str) -> Optional[dict]:
+        """Job row as a dict, with the owning customer's code."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                select j.status, j.profile, j.manifest, c.code, j.created_at, j.updated_at
+                from jobs j
+                join customers c on c.id = j.customer_id
+                where j.job_id=%s
+                """,
+                (job_id,)
+            )
+            row = cur.fetchone()
+            if not row:
+                return None
+            return {
+                "job_id": job_id,
+                "status": row[0],
+                "profile": row[1] or {},
+                "manifest": row[2] or {},
+                "customer": row[3],
+                "created_at": row[4],
+                "updated_at": row[5],
+            }
+
+    def list_jobs(
+        self,
+        customer_code: str,
+        limit: int = 50,
+        fields: Sequence[str] = ("job_id", "status"),
+        statuses: Optional[Sequence[str]] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, str]] = None,
+    ) -> List[dict]:
+        """One keyset page of a customer's jobs, newest first.
+
+        Ordered by (created_at, id) desc; `after` is the (created_at, id) of
+        the last row of the previous page, so every page is an index range
+        scan on jobs_customer_created_idx / jobs_customer_status_created_idx
+        no matter how deep. `fields` must be pre-validated column names.
+        Each row also carries "_key" = (created_at, id) for the next cursor.
+        """
+        where = [sql.SQL("j.customer_id = (select id from customers where code = %s)")]
+        params: List[Any] = [customer_code]
+        if statuses:
+            where.append(sql.SQL("j.status = any(%s)"))
+            params.append(list(statuses))
+        if created_after:
+            where.append(sql.SQL("j.created_at >= %s"))
+            params.append(created_after)
+        if created_before:
+            where.append(sql.SQL("j.created_at < %s"))
+            params.append(created_before)
+        if after:
+            where.append(sql.SQL("(j.created_at, j.id) < (%s, %s::uuid)"))
+            params.extend(after)
+        params.append(limit)
+
+        q = sql.SQL(
+            """
+            select {cols}, j.created_at, j.id
+            from jobs j
+            where {where}
+            order by j.created_at desc, j.id desc
+            limit %s
+            """
+        ).format(
+            cols=sql.SQL(", ").join(sql.SQL("j.") + sql.Identifier(f) for f in fields),
+            where=sql.SQL(" and ").join(where),
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(q, params)
+            out = []
+            for row in cur.fetchall():
+                d = dict(zip(fields, row[: len(fields)]))
+                d["_key"] = (row[-2], str(row[-1]))
+                out.append(d)
+            return out
+
+    def append_job_kdms(self, job_id: str, kdms: List[dict]) -> bool:
+        """Append KDM records to manifest.kdm (no read-modify-write) and to the kdms table."""
+        payload = json.dumps(kdms)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                update jobs
+                set manifest=jsonb_set(
+                        coalesce(manifest, '{}'::jsonb),
+                        '{kdm}',
+                        coalesce(manifest->'kdm', '[]'::jsonb) || %s::jsonb
+                    ),
+                    updated_at=now()
+                where job_id=%s
+                """,
+                (payload, job_id)
+            )
+            if cur.rowcount == 0:
+                return False
+            # the table copy is what GET /kdms pages through
+            cur.execute(
+                """
+                insert into kdms(id, job_id, device_cn, cert_fingerprint, key_id, cpl_id,
+                                 valid_from, valid_until, delivered, vault_key)
+                select (r->>'kdm_id')::uuid, j.id, r->>'cn', r->>'cert_fingerprint',
+                       r->>'key_id', r->>'cpl_id',
+                       (r->>'valid_from')::timestamptz, (r->>'valid_until')::timestamptz,
+                       coalesce((r->>'delivered')::boolean, false), r->>'vault_key'
+                from jobs j, jsonb_array_elements(%s::jsonb) r
+                where j.job_id = %s
+                on conflict (id) do nothing
+                """,
+                (payload, job_id)
+            )
+            return True
+
     def get_job(self, job_id: str, customer_code: str):
         with self.conn.cursor() as cur:
             self.set_customer(customer_code)
@@ -73,18 +295,384 @@ class DB:
             )
             return cur.fetchone()
 
-    def update_job(self, job_id: str, manifest: dict, status: str):
+    def update_job(
+        self,
+        job_id: str,
+        manifest: Optional[dict],
+        status: str,
+        worker_id: Optional[str] = None,
+    ) -> bool:
+        """Set status (and manifest unless None); releases the lease.
+
+        Only a PROCESSING job can be finished, and with worker_id only by
+        its current lease holder: once the reaper has requeued or
+        dead-lettered the job (clearing leased_by) or another worker has
+        re-claimed it, a late report from the old holder matches nothing.
+        Returns False when no row matched.
+        """
         with self.conn.cursor() as cur:
             cur.execute(
                 """
                 update jobs
-                set manifest=%s,
+                set manifest=coalesce(%s::jsonb, manifest),
                     status=%s,
+                    leased_by=null,
+                    lease_expires_at=null,
+                    updated_at=now()
+                where job_id=%s
+                  and status='PROCESSING'
+                  and (%s::text is null or leased_by=%s)
+                """,
+                (
+                    json.dumps(manifest) if manifest is not None else None,
+                    status,
+                    job_id,
+                    worker_id,
+                    worker_id,
+                )
+            )
+            return cur.rowcount > 0
+
+    def record_ingest(self, job_id: str, ingest: dict) -> bool:
+        """Store an ingest verification record under manifest.ingest."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                update jobs
+                set manifest=jsonb_set(coalesce(manifest, '{}'::jsonb), '{ingest}', %s::jsonb),
                     updated_at=now()
                 where job_id=%s
                 """,
-                (json.dumps(manifest), status, job_id)
+                (json.dumps(ingest), job_id)
             )
+            return cur.rowcount > 0
+
+    UPLOAD_COLUMNS = ("key", "upload_id", "size", "claimed_sha256", "status", "ingest")
+
+    def ingest_upload_init(self, key: str, upload_id: str, size: int, sha256: Optional[str], customer_code: str):
+        """Register (or restart) a customer's upload; its jobs are unclaimable until verified."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                insert into ingest_uploads(key, upload_id, size, claimed_sha256, customer_id)
+                values (%s, %s, %s, %s, (select id from customers where code = %s))
+                on conflict (key) do update
+                set upload_id = excluded.upload_id,
+                    size = excluded.size,
+                    claimed_sha256 = excluded.claimed_sha256,
+                    customer_id = excluded.customer_id,
+                    status = 'PENDING',
+                    ingest = null,
+                    attempts = 0,
+                    retry_at = null,
+                    updated_at = now()
+                """,
+                (key, upload_id, size, sha256.lower() if sha256 else None, customer_code),
+            )
+
+    def ingest_upload_complete(self, key: str, sha256: Optional[str], customer_code: str) -> Optional[dict]:
+        """Record the sha256 sent with /complete (if any); returns the upload row.
+
+        Only the customer that started the upload may change its claim.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"""
+                update ingest_uploads
+                set claimed_sha256 = coalesce(%s, claimed_sha256),
+                    status = 'PENDING',
+                    attempts = 0,
+                    retry_at = null,
+                    updated_at = now()
+                where key = %s
+                  and (customer_id is null or customer_id = (select id from customers where code = %s))
+                returning {", ".join(self.UPLOAD_COLUMNS)}
+                """,
+                (sha256.lower() if sha256 else None, key, customer_code),
+            )
+            row = cur.fetchone()
+            return dict(zip(self.UPLOAD_COLUMNS, row)) if row else None
+
+    def ingest_upload_get(self, key: str) -> Optional[dict]:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"select {', '.join(self.UPLOAD_COLUMNS)} from ingest_uploads where key = %s",
+                (key,),
+            )
+            row = cur.fetchone()
+            return dict(zip(self.UPLOAD_COLUMNS, row)) if row else None
+
+    def ingest_upload_result(self, key: str, status: str, ingest: dict) -> List[str]:
+        """Store a verification outcome and copy it to the owner's QUEUED jobs using the key.
+
+        status is VERIFIED or MISMATCH (checked against the stored claim) or
+        ERROR. ERROR schedules a retry after QD_INGEST_RETRY_S, doubling per
+        attempt; after QD_INGEST_VERIFY_ATTEMPTS the upload is FAILED. On
+        MISMATCH or FAILED the jobs are failed; on VERIFIED they become
+        claimable and long-polling workers are woken. Returns the job ids
+        touched.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                update ingest_uploads
+                set status = case
+                        when %(status)s <> 'ERROR' then %(status)s
+                        when attempts + 1 >= %(max_attempts)s then 'FAILED'
+                        else 'ERROR'
+                    end,
+                    attempts = case when %(status)s = 'ERROR' then attempts + 1 else 0 end,
+                    retry_at = case
+                        when %(status)s = 'ERROR' and attempts + 1 < %(max_attempts)s
+                        then now() + make_interval(secs => %(retry)s * power(2, attempts))
+                    end,
+                    ingest = %(ingest)s::jsonb,
+                    updated_at = now()
+                where key = %(key)s
+                returning status, customer_id
+                """,
+                {
+                    "status": status,
+                    "max_attempts": INGEST_VERIFY_ATTEMPTS,
+                    "retry": INGEST_RETRY_S,
+                    "ingest": json.dumps(ingest),
+                    "key": key,
+                },
+            )
+            row = cur.fetchone()
+            if row is None:
+                return []
+            status, owner = row
+            # keys are global; only the uploader's jobs follow its verification
+            cur.execute(
+                """
+                update jobs
+                set manifest = jsonb_set(coalesce(manifest, '{}'::jsonb), '{ingest}', %s::jsonb),
+                    status = case when %s in ('MISMATCH', 'FAILED') then 'FAIL' else status end,
+                    updated_at = now()
+                where (profile->>'input_key') = %s
+                  and status = 'QUEUED'
+                  and (%s::uuid is null or customer_id = %s)
+                returning job_id
+                """,
+                (json.dumps(ingest), status, key, owner, owner),
+            )
+            job_ids = [r[0] for r in cur.fetchall()]
+            if status == "VERIFIED" and job_ids:
+                cur.execute("select pg_notify('jobs_queued', '')")
+            return job_ids
+
+    def ingest_uploads_due(self, limit: int = 10) -> List[str]:
+        """Keys of ERROR uploads whose retry is due; each is pushed back by a
+        lease (QD_INGEST_RETRY_S) so concurrent sweeps do not repeat it."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                with due as (
+                    select key
+                    from ingest_uploads
+                    where status = 'ERROR'
+                      and retry_at <= now()
+                    order by retry_at
+                    limit %s
+                    for update skip locked
+                )
+                update ingest_uploads u
+                set retry_at = now() + make_interval(secs => %s)
+                from due
+                where u.key = due.key
+                returning u.key
+                """,
+                (limit, INGEST_RETRY_S),
+            )
+            return [r[0] for r in cur.fetchall()]
+
+    def touch_jobs(self, job_ids: List[str], worker_id: str) -> List[str]:
+        """Heartbeat: extend worker_id's leases on PROCESSING jobs; return those held.
+
+        Only lease_expires_at changes (not updated_at), so the jobs audit
+        trigger skips heartbeats.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                update jobs
+                set lease_expires_at=now() + make_interval(secs => %s)
+                where job_id = any(%s)
+                  and status='PROCESSING'
+                  and leased_by=%s
+                returning job_id
+                """,
+                (JOB_LEASE_S, list(job_ids), worker_id)
+            )
+            return [r[0] for r in cur.fetchall()]
+
+    def claim_jobs(self, max_jobs: int = 1, worker_id: Optional[str] = None):
+        """Atomically move up to max_jobs QUEUED jobs to PROCESSING.
+
+        Two statements in one transaction. The first computes per-customer
+        PROCESSING counts once, picks the customers below their
+        queue_configs.max_concurrent_jobs among the next candidates, and
+        takes a transaction-scoped advisory lock per customer (customers
+        another claimer holds are skipped, like SKIP LOCKED rows). The second
+        runs after the locks, so its snapshot sees every committed claim for
+        those customers: candidates are locked with SKIP LOCKED and the
+        per-customer ranking trims the batch to the remaining slots, so the
+        cap holds under concurrent claimers.
+        Each claimed job gets a JOB_LEASE_S lease for worker_id and one more
+        attempt; jobs in requeue backoff (available_at) are skipped, as are
+        jobs whose input_key is an /upload that has not been VERIFIED yet.
+        Returns [(job_id, profile, customer_id), ...] in claim order.
+        """
+        params = {
+            "n": max_jobs,
+            "scan": max_jobs * max(1, CLAIM_SCAN_FACTOR),
+            "default_max": DEFAULT_MAX_CONCURRENT,
+            "worker": worker_id,
+            "lease": JOB_LEASE_S,
+        }
+        open_customers = """
+            running as (
+                select customer_id, count(*) as n
+                from jobs
+                where status = 'PROCESSING'
+                group by customer_id
+            ),
+            open_jobs as (
+                select q.id, q.customer_id, q.priority, q.created_at,
+                       coalesce(c.max_concurrent_jobs, %(default_max)s) - coalesce(r.n, 0) as slots
+                from jobs q
+                left join running r on r.customer_id = q.customer_id
+                left join queue_configs c on c.customer_id = q.customer_id
+                where q.status = 'QUEUED'
+                  and (q.available_at is null or q.available_at <= now())
+                  and coalesce(r.n, 0) < coalesce(c.max_concurrent_jobs, %(default_max)s)
+                  and not exists (
+                      select 1 from ingest_uploads u
+                      where u.key = q.profile->>'input_key'
+                        and (u.customer_id is null or u.customer_id = q.customer_id)
+                        and u.status <> 'VERIFIED'
+                  )
+            )
+        """
+        with self.conn.transaction(), self.conn.cursor() as cur:
+            cur.execute(
+                "with "
+                + open_customers
+                + """
+                select customer_id from (
+                    select distinct customer_id from (
+                        select customer_id from open_jobs
+                        order by priority desc, created_at
+                        limit %(scan)s
+                    ) head
+                ) t
+                where pg_try_advisory_xact_lock(hashtext('qd.claim'), hashtext(customer_id::text))
+                """,
+                params,
+            )
+            customers = [r[0] for r in cur.fetchall()]
+            if not customers:
+                return []
+            cur.execute(
+                "with "
+                + open_customers
+                + """,
+                candidates as (
+                    select o.id, o.slots from open_jobs o
+                    where o.customer_id = any(%(customers)s)
+                    order by o.priority desc, o.created_at
+                    limit %(scan)s
+                ),
+                locked as (
+                    select q.id, q.customer_id, q.priority, q.created_at, k.slots
+                    from jobs q
+                    join candidates k on k.id = q.id
+                    where q.status = 'QUEUED'
+                    for update of q skip locked
+                ),
+                ranked as (
+                    select
+                        l.id,
+                        l.priority,
+                        l.created_at,
+                        row_number() over (
+                            partition by l.customer_id
+                            order by l.priority desc, l.created_at
+                        ) as rn,
+                        l.slots
+                    from locked l
+                ),
+                picked as (
+                    select id from ranked
+                    where rn <= slots
+                    order by priority desc, created_at
+                    limit %(n)s
+                )
+                update jobs j
+                set status = 'PROCESSING',
+                    leased_by = %(worker)s,
+                    lease_expires_at = now() + make_interval(secs => %(lease)s),
+                    attempts = j.attempts + 1,
+                    available_at = null,
+                    updated_at = now()
+                from picked
+                where j.id = picked.id
+                returning j.job_id, j.profile, j.customer_id, j.priority, j.created_at
+                """,
+                {**params, "customers": customers},
+            )
+            rows = cur.fetchall()
+            # RETURNING order is unspecified; restore claim order
+            rows.sort(key=lambda r: (-r[3], r[4]))
+            return [(r[0], r[1], r[2]) for r in rows]
+
+    def reap_expired_leases(self, limit: int = 100):
+        """Requeue (with backoff) or dead-letter jobs whose lease expired.
+
+        Walks jobs_lease_expiry_idx oldest-first and touches at most `limit`
+        rows, so one sweep costs the same however large the table is.
+        Returns [(job_id, new_status, attempts), ...].
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                with expired as (
+                    select id
+                    from jobs
+                    where status = 'PROCESSING'
+                      and lease_expires_at < now()
+                    order by lease_expires_at
+                    limit %(limit)s
+                    for update skip locked
+                )
+                update jobs j
+                set status = case
+                        when j.attempts >= %(max_attempts)s then 'DEAD'
+                        else 'QUEUED'
+                    end,
+                    available_at = case
+                        when j.attempts >= %(max_attempts)s then null
+                        else now() + make_interval(secs => least(
+                            %(backoff_max)s,
+                            %(backoff)s * power(2, greatest(j.attempts - 1, 0))
+                        ))
+                    end,
+                    leased_by = null,
+                    lease_expires_at = null,
+                    updated_at = now()
+                from expired
+                where j.id = expired.id
+                returning j.job_id, j.status, j.attempts
+                """,
+                {
+                    "limit": limit,
+                    "max_attempts": JOB_MAX_ATTEMPTS,
+                    "backoff": REQUEUE_BACKOFF_S,
+                    "backoff_max": REQUEUE_BACKOFF_MAX_S,
+                },
+            )
+            return cur.fetchall()
 
     # ---------------------------------------------------------
     # PROOFS
@@ -133,6 +721,23 @@ class DB:
                 "fp_verified": row[4],
             }
 
+    def proof_find_by_sha(self, sha: str):
+        """job_id of the newest proof with this manifest hash (proofs_manifest_sha256_idx)."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                select j.job_id
+                from proofs p
+                join jobs j on j.id = p.job_id
+                where p.manifest_sha256 = %s
+                order by p.updated_at desc
+                limit 1
+                """,
+                (sha.lower(),)
+            )
+            row = cur.fetchone()
+            return row[0] if row else None
+
     def proof_update_tsa_ok(self, job_id: str):
         with self.conn.cursor() as cur:
             cur.execute(
@@ -162,3 +767,402 @@ class DB:
                 """,
                 (proof_id, verified, job_id)
             )
+
+    # Full proof records (api.utils.proof_backend.PostgresProofStore)
+    def proof_load(self, job_id: str) -> Optional[dict]:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                select p.record, p.status, p.manifest_sha256, p.tsa_ok,
+                       p.fp_proof_id, p.fp_verified
+                from proofs p
+                join jobs j on j.id = p.job_id
+                where j.job_id=%s
+                """,
+                (job_id,)
+            )
+            row = cur.fetchone()
+            if not row:
+                return None
+
+            rec = dict(row[0] or {})
+            rec.update(job_id=job_id, status=row[1], manifest_sha256=row[2], tsa_ok=row[3])
+            if row[4] is not None:
+                rec.update(fp_proof_id=row[4], fp_verified=row[5])
+            return rec
+
+    def proof_save(self, job_id: str, record: dict) -> bool:
+        """Upsert a full proof record; False if the job does not exist."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                insert into proofs(job_id, manifest_sha256, status, tsa_ok, batch_id, record)
+                select id, %s, %s, %s, %s, %s
+                from jobs
+                where job_id=%s
+                on conflict(job_id)
+                do update set
+                    manifest_sha256 = excluded.manifest_sha256,
+                    status = excluded.status,
+                    tsa_ok = excluded.tsa_ok,
+                    batch_id = excluded.batch_id,
+                    record = excluded.record,
+                    updated_at = now()
+                returning id
+                """,
+                (
+                    record.get("manifest_sha256", ""),
+                    record.get("status", "PENDING"),
+                    bool(record.get("tsa_ok")),
+                    record.get("batch_id"),
+                    json.dumps(record),
+                    job_id,
+                )
+            )
+            return cur.fetchone() is not None
+
+    def proof_delete(self, job_id: str) -> bool:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "delete from proofs where job_id = (select id from jobs where job_id=%s)",
+                (job_id,)
+            )
+            return cur.rowcount > 0
+
+    def proof_list_ids(self, after: Optional[str] = None, limit: int = 1000) -> List[str]:
+        """Keyset page of job_ids that have a proof, ordered by job_id."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                select j.job_id
+                from proofs p
+                join jobs j on j.id = p.job_id
+                where %s::text is null or j.job_id > %s
+                order by j.job_id
+                limit %s
+                """,
+                (after, after, limit)
+            )
+            return [r[0] for r in cur.fetchall()]
+
+    def proof_batch_load(self, batch_id: str) -> Optional[dict]:
+        with self.conn.cursor() as cur:
+            cur.execute("select record from proof_batches where batch_id=%s", (batch_id,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    def proof_batch_save(self, batch: dict):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                insert into proof_batches(batch_id, status, record)
+                values (%s, %s, %s)
+                on conflict(batch_id)
+                do update set
+                    status = excluded.status,
+                    record = excluded.record,
+                    updated_at = now()
+                """,
+                (batch["batch_id"], batch.get("status", "OPEN"), json.dumps(batch))
+            )
+
+    def proof_batch_members(self, batch_id: str) -> List[dict]:
+        """Proof records of a batch's members (proofs_batch_idx)."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                select j.job_id, p.record, p.status, p.manifest_sha256
+                from proofs p
+                join jobs j on j.id = p.job_id
+                where p.batch_id = %s
+                """,
+                (batch_id,)
+            )
+            return [
+                {**(r[1] or {}), "job_id": r[0], "status": r[2], "manifest_sha256": r[3]}
+                for r in cur.fetchall()
+            ]
+
+    def proof_batch_ids(self, status: Optional[str] = None) -> List[str]:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                select batch_id from proof_batches
+                where %s::text is null or status = %s
+                order by batch_id
+                """,
+                (status, status)
+            )
+            return [r[0] for r in cur.fetchall()]
+
+    # ---------------------------------------------------------
+    # KDMS
+    # ---------------------------------------------------------
+    KDM_COLUMNS = (
+        "id", "job_id", "batch_id", "device_cn", "cert_fingerprint",
+        "key_id", "cpl_id", "valid_from", "valid_until", "vault_key",
+    )
+
+    def kdm_batch_create(self, job_id: str, label: str, created_by: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """New draft kdm_batches row for a job; (batch id, job uuid) or None if no such job."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                insert into kdm_batches(customer_id, job_id, label, created_by)
+                select j.customer_id, j.id, %s, %s
+                from jobs j
+                where j.job_id = %s
+                returning id, job_id
+                """,
+                (label, created_by, job_id)
+            )
+            row = cur.fetchone()
+            return (str(row[0]), str(row[1])) if row else None
+
+    def kdm_batch_set_status(self, batch_id: str, status: str):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                update kdm_batches
+                set status = %s,
+                    completed_at = case when %s in ('complete', 'failed') then now() end
+                where id = %s
+                """,
+                (status, status, batch_id)
+            )
+
+    def kdm_batch_get(self, batch_id: str) -> Optional[dict]:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                select b.id, j.job_id, b.label, b.created_by, b.total_kdms, b.status,
+                       b.created_at, b.completed_at
+                from kdm_batches b
+                join jobs j on j.id = b.job_id
+                where b.id = %s
+                """,
+                (batch_id,)
+            )
+            row = cur.fetchone()
+            if not row:
+                return None
+            keys = ("batch_id", "job_id", "label", "created_by", "total_kdms", "status", "created_at", "completed_at")
+            d = dict(zip(keys, row))
+            d["batch_id"] = str(d["batch_id"])
+            return d
+
+    def kdm_copy(self, batch_id: Optional[str], rows: Sequence[Sequence[Any]]) -> int:
+        """COPY kdms rows (KDM_COLUMNS order) and add them to the batch's total_kdms, if any."""
+        with self.conn.cursor() as cur:
+            with cur.copy(f"copy kdms ({', '.join(self.KDM_COLUMNS)}) from stdin") as cp:
+                for r in rows:
+                    cp.write_row(r)
+            if batch_id is not None:
+                cur.execute(
+                    "update kdm_batches set total_kdms = total_kdms + %s where id = %s",
+                    (len(rows), batch_id)
+                )
+        return len(rows)
+
+    def kdms_for_job(self, job_id: str) -> List[dict]:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                select k.id, k.device_cn, k.cert_fingerprint, k.valid_from, k.valid_until,
+                       k.key_id, k.cpl_id, k.delivered, k.batch_id, k.vault_key
+                from kdms k
+                join jobs j on j.id = k.job_id
+                where j.job_id = %s
+                order by k.created_at, k.id
+                """,
+                (job_id,)
+            )
+            keys = ("kdm_id", "cn", "cert_fingerprint", "valid_from", "valid_until",
+                    "key_id", "cpl_id", "delivered", "batch_id", "vault_key")
+            return [dict(zip(keys, r)) for r in cur.fetchall()]
+
+    def kdms_page(
+        self,
+        customer_code: str,
+        limit: int = 50,
+        job_id: Optional[str] = None,
+        cn: Optional[str] = None,
+        batch_id: Optional[str] = None,
+        valid_until_from: Optional[datetime] = None,
+        valid_until_to: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, str]] = None,
+    ) -> List[dict]:
+        """One keyset page of a customer's KDMs, soonest valid_until first.
+
+        Ordered by (valid_until, id); `after` is the (valid_until, id) of the
+        last row of the previous page. With job_id the scan runs on
+        kdms_job_valid_until_idx, otherwise on kdms_valid_until_idx. Rows
+        carry "_key" = (valid_until, id) for the next cursor.
+        """
+        where = [sql.SQL("j.customer_id = (select id from customers where code = %s)")]
+        params: List[Any] = [customer_code]
+        if job_id:
+            where.append(sql.SQL("j.job_id = %s"))
+            params.append(job_id)
+        if cn:
+            where.append(sql.SQL("k.device_cn = %s"))
+            params.append(cn)
+        if batch_id:
+            where.append(sql.SQL("k.batch_id = %s::uuid"))
+            params.append(batch_id)
+        if valid_until_from:
+            where.append(sql.SQL("k.valid_until >= %s"))
+            params.append(valid_until_from)
+        if valid_until_to:
+            where.append(sql.SQL("k.valid_until < %s"))
+            params.append(valid_until_to)
+        if after:
+            where.append(sql.SQL("(k.valid_until, k.id) > (%s, %s::uuid)"))
+            params.extend(after)
+        params.append(limit)
+
+        q = sql.SQL(
+            """
+            select k.id, j.job_id, k.device_cn, k.cert_fingerprint, k.valid_from, k.valid_until,
+                   k.key_id, k.cpl_id, k.delivered, k.batch_id, k.vault_key
+            from kdms k
+            join jobs j on j.id = k.job_id
+            where {where}
+            order by k.valid_until, k.id
+            limit %s
+            """
+        ).format(where=sql.SQL(" and ").join(where))
+        keys = ("kdm_id", "job_id", "cn", "cert_fingerprint", "valid_from", "valid_until",
+                "key_id", "cpl_id", "delivered", "batch_id", "vault_key")
+        with self.conn.cursor() as cur:
+            cur.execute(q, params)
+            out = []
+            for row in cur.fetchall():
+                d = dict(zip(keys, row))
+                d["kdm_id"] = str(d["kdm_id"])
+                d["batch_id"] = str(d["batch_id"]) if d["batch_id"] else None
+                d["_key"] = (d["valid_until"], d["kdm_id"])
+                out.append(d)
+            return out
+
+    CERT_COLUMNS = (
+        "fingerprint", "cn", "subject", "issuer", "serial",
+        "not_before", "not_after", "public_key_der",
+    )
+
+    def kdm_certs_get(self, fingerprints: Sequence[str]) -> List[dict]:
+        """Registered certificates among `fingerprints` (CERT_COLUMNS, no PEM); serial as text."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"select {', '.join(self.CERT_COLUMNS)} from kdm_certificates where fingerprint = any(%s)",
+                (list(fingerprints),)
+            )
+            return [dict(zip(self.CERT_COLUMNS, r)) for r in cur.fetchall()]
+
+    def kdm_certs_put(self, rows: Sequence[Sequence[Any]]) -> int:
+        """Insert (CERT_COLUMNS..., cert_pem) rows; existing fingerprints are left as they are."""
+        cols = self.CERT_COLUMNS + ("cert_pem",)
+        with self.conn.cursor() as cur:
+            cur.executemany(
+                f"insert into kdm_certificates ({', '.join(cols)}) "
+                f"values ({', '.join(['%s'] * len(cols))}) on conflict (fingerprint) do nothing",
+                list(rows)
+            )
+            return cur.rowcount
+
+
+# ---------------------------------------------------------
+# CONNECTION POOL
+# ---------------------------------------------------------
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+# Checkout latency accounting (seconds)
+_checkouts = 0
+_checkout_total = 0.0
+_checkout_max = 0.0
+_checkout_last = 0.0
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool, opening it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DB_URL or "",
+                    min_size=DB_POOL_MIN,
+                    max_size=max(DB_POOL_MIN, DB_POOL_MAX),
+                    timeout=DB_POOL_TIMEOUT,
+                    kwargs={"autocommit": True},
+                    name="quickdcp-api",
+                    open=True,
+                )
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _record_checkout(elapsed: float) -> None:
+    global _checkouts, _checkout_total, _checkout_max, _checkout_last
+    with _pool_lock:
+        _checkouts += 1
+        _checkout_total += elapsed
+        _checkout_max = max(_checkout_max, elapsed)
+        _checkout_last = elapsed
+
+
+@contextmanager
+def session(customer_code: Optional[str] = None, timeout: Optional[float] = None) -> Iterator[DB]:
+    """Check out a pooled connection wrapped in a single transaction.
+
+    qd.customer_code is set with set_config(..., true), so the RLS context
+    lives only for this transaction and never leaks to the next borrower.
+    """
+    pool = get_pool()
+    t0 = time.perf_counter()
+    with pool.connection(timeout=timeout) as conn:
+        _record_checkout(time.perf_counter() - t0)
+        with conn.transaction():
+            db = DB(conn)
+            if customer_code:
+                db.set_customer(customer_code)
+            yield db
+
+
+def get_db(x_qd_customer: Optional[str] = Header(None, alias="X-QD-Customer")) -> Iterator[DB]:
+    """FastAPI dependency: one pooled connection + transaction per request."""
+    code = (x_qd_customer or "").strip() or None
+    with session(code) as db:
+        yield db
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool occupancy and checkout latency for health output."""
+    if _pool is None:
+        return {"open": False}
+    st = _pool.get_stats()
+    size = st.get("pool_size", 0)
+    available = st.get("pool_available", 0)
+    with _pool_lock:
+        avg = (_checkout_total / _checkouts) if _checkouts else 0.0
+        return {
+            "open": True,
+            "min": st.get("pool_min", DB_POOL_MIN),
+            "max": st.get("pool_max", DB_POOL_MAX),
+            "size": size,
+            "in_use": size - available,
+            "available": available,
+            "waiting": st.get("requests_waiting", 0),
+            "checkouts": _checkouts,
+            "checkout_ms_last": round(_checkout_last * 1000, 3),
+            "checkout_ms_avg": round(avg * 1000, 3),
+            "checkout_ms_max": round(_checkout_max * 1000, 3),
+        }
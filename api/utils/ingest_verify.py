@@ -0,0 +1,230 @@
+"""
+Ingest verification for QuickDCP uploads
+
+Confirms the full-file SHA-256 of a completed ingest object straight from S3,
+without staging it on local disk.
+
+How
+---
+1) HEAD with ChecksumMode=ENABLED. A full-object ChecksumSHA256 (no "-N"
+   suffix: single PUT or FULL_OBJECT multipart) *is* the file digest, so no
+   bytes are read at all.
+2) Otherwise the object is read as fixed-size ranged GETs, fetched in
+   parallel but fed into one hashlib.sha256 strictly in order. At most
+   INGEST_VERIFY_CONCURRENCY ranges are in flight, so memory stays around
+   concurrency x INGEST_VERIFY_RANGE_MB regardless of asset size.
+3) For composite (multipart) checksums the per-part ChecksumSHA256 values
+   from GetObjectAttributes are checked against the same byte stream, so a
+   mismatch names the bad part instead of just failing the whole file.
+
+Every ranged GET carries If-Match on the HEAD ETag: if the object is
+replaced mid-read S3 answers 412 and verification fails instead of hashing
+a mix of two versions.
+
+Environment
+-----------
+INGEST_VERIFY_RANGE_MB     range size per GET (default 16)
+INGEST_VERIFY_CONCURRENCY  parallel GETs (default 8)
+INGEST_VERIFY_PARTS        1/0 also check composite part checksums (default 1)
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+RANGE_BYTES = int(os.getenv("INGEST_VERIFY_RANGE_MB", "16")) * 1024 * 1024
+CONCURRENCY = int(os.getenv("INGEST_VERIFY_CONCURRENCY", "8"))
+CHECK_PARTS = os.getenv("INGEST_VERIFY_PARTS", "1") == "1"
+
+
+class IngestVerifyError(RuntimeError):
+    pass
+
+
+def _b64_to_hex(b64: str) -> str:
+    return base64.b64decode(b64).hex()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def list_object_parts(s3, bucket: str, key: str) -> List[Dict[str, Any]]:
+    """[{PartNumber, Size, ChecksumSHA256}] for a multipart object (empty if unknown)."""
+    parts: List[Dict[str, Any]] = []
+    marker = 0
+    while True:
+        r = s3.get_object_attributes(
+            Bucket=bucket,
+            Key=key,
+            ObjectAttributes=["ObjectParts"],
+            MaxParts=1000,
+            PartNumberMarker=marker,
+        )
+        op = r.get("ObjectParts") or {}
+        parts.extend(op.get("Parts") or [])
+        if not op.get("IsTruncated"):
+            break
+        marker = op["NextPartNumberMarker"]
+    return parts
+
+
+class _PartChecker:
+    """Hashes the in-order byte stream per part and compares to S3's part checksums."""
+
+    def __init__(self, parts: List[Dict[str, Any]]) -> None:
+        self.parts = sorted(parts, key=lambda p: p["PartNumber"])
+        self.idx = 0
+        self.left = self.parts[0]["Size"] if self.parts else 0
+        self.h = hashlib.sha256()
+        self.checked = 0
+
+    def update(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view and self.idx < len(self.parts):
+            n = min(self.left, len(view))
+            self.h.update(view[:n])
+            view = view[n:]
+            self.left -= n
+            if self.left == 0:
+                self._close_part()
+
+    def _close_part(self) -> None:
+        part = self.parts[self.idx]
+        got = base64.b64encode(self.h.digest()).decode()
+        if part.get("ChecksumSHA256") and got != part["ChecksumSHA256"]:
+            raise IngestVerifyError(f"part {part['PartNumber']} checksum mismatch")
+        self.checked += 1
+        self.idx += 1
+        self.h = hashlib.sha256()
+        if self.idx < len(self.parts):
+            self.left = self.parts[self.idx]["Size"]
+
+
+def _get_range(s3, bucket: str, key: str, etag: str, start: int, end: int) -> bytes:
+    r = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag)
+    body = r["Body"]
+    try:
+        return body.read()
+    finally:
+        body.close()
+
+
+def stream_sha256(
+    s3,
+    bucket: str,
+    key: str,
+    size: int,
+    etag: str,
+    range_bytes: int = RANGE_BYTES,
+    concurrency: int = CONCURRENCY,
+    checker: Optional[_PartChecker] = None,
+) -> str:
+    """Full-object SHA-256 hex from parallel ranged GETs, hashed in order."""
+    h = hashlib.sha256()
+    offsets = iter(range(0, size, range_bytes))
+    pending: Deque = deque()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="qd-ingest") as pool:
+        def submit_next() -> None:
+            start = next(offsets, None)
+            if start is not None:
+                end = min(size, start + range_bytes) - 1
+                pending.append(pool.submit(_get_range, s3, bucket, key, etag, start, end))
+
+        for _ in range(max(1, concurrency)):
+            submit_next()
+        while pending:
+            data = pending.popleft().result()
+            submit_next()  # keep the window full while we hash
+            h.update(data)
+            if checker is not None:
+                checker.update(data)
+    return h.hexdigest()
+
+
+def verify_object(
+    s3,
+    bucket: str,
+    key: str,
+    expected_sha256: Optional[str] = None,
+    previous: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Verify one ingest object; return the record stored under manifest["ingest"].
+
+    `previous` is an earlier record for the same job: if it covers the same
+    key and ETag its digest is reused instead of re-reading the object.
+    Raises IngestVerifyError on part checksum mismatches or when the object
+    changes while being read. A mismatch against expected_sha256 is not an
+    error here: it is reported as match=False so callers can record it.
+    """
+    t0 = time.time()
+    head = s3.head_object(Bucket=bucket, Key=key, ChecksumMode="ENABLED")
+    size = int(head.get("ContentLength") or 0)
+    etag = head.get("ETag", "")
+    s3_chk = head.get("ChecksumSHA256") or ""
+
+    rec: Dict[str, Any] = {
+        "bucket": bucket,
+        "key": key,
+        "size": size,
+        "etag": etag.strip('"'),
+        "s3_checksum_sha256": s3_chk or None,
+    }
+
+    if (
+        previous
+        and previous.get("key") == key
+        and previous.get("etag") == rec["etag"]
+        and previous.get("sha256")
+    ):
+        # same object version we already hashed
+        sha = previous["sha256"]
+        rec.update(method="previous", bytes_read=0)
+    elif s3_chk and "-" not in s3_chk:
+        # full-object checksum: S3 already hashed every byte for us
+        sha = _b64_to_hex(s3_chk)
+        rec.update(method="s3-full-object-checksum", bytes_read=0)
+    else:
+        checker = None
+        if s3_chk and CHECK_PARTS:
+            parts = list_object_parts(s3, bucket, key)
+            checker = _PartChecker(parts) if parts else None
+        try:
+            sha = stream_sha256(s3, bucket, key, size, etag, checker=checker)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in {"412", "PreconditionFailed"}:
+                raise IngestVerifyError("object changed while verifying") from e
+            raise
+        rec.update(method="ranged-stream", bytes_read=size)
+        if checker is not None:
+            rec["parts_checked"] = checker.checked
+
+    rec["sha256"] = sha
+    if expected_sha256:
+        rec["claimed_sha256"] = expected_sha256.lower()
+        rec["match"] = sha == expected_sha256.lower()
+    rec["seconds"] = round(time.time() - t0, 3)
+    rec["verified_at"] = _now()
+    return rec
+
+
+if __name__ == "__main__":  # python -m api.utils.ingest_verify <key> [sha256]
+    import json
+    import sys
+
+    import boto3
+
+    if len(sys.argv) < 2:
+        print("usage: python -m api.utils.ingest_verify <key> [sha256]")
+        sys.exit(2)
+    client = boto3.client("s3", region_name=os.getenv("AWS_DEFAULT_REGION", "eu-central-1"))
+    bucket = os.getenv("S3_BUCKET_INGEST", "quickdcp-ingest")
+    print(json.dumps(verify_object(client, bucket, sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None), indent=2))
@@ -0,0 +1,69 @@
+"""
+Expired-lease reaper for QuickDCP jobs
+
+A job claimed by a worker carries a lease (migration 0023) that the worker
+extends via /internal/heartbeat. If the worker dies the lease runs out and
+this reaper sweeps it:
+- attempts < QD_JOB_MAX_ATTEMPTS  -> QUEUED again, due after exponential backoff
+- otherwise                        -> DEAD (dead-letter, needs an operator)
+
+Each sweep handles at most REAPER_BATCH rows through the partial
+jobs_lease_expiry_idx index, and rows are taken with SKIP LOCKED, so every
+API replica can run a reaper without coordination.
+
+Other periodic recovery (e.g. retrying failed ingest verifications) can
+ride on the same thread via JobReaper.add_sweep.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from api.utils.db import session
+
+REAPER_INTERVAL_S = float(os.getenv("REAPER_INTERVAL_S", "15"))
+REAPER_BATCH = int(os.getenv("REAPER_BATCH", "100"))
+
+
+def sweep(limit: int = REAPER_BATCH) -> List[Tuple[str, str, int]]:
+    """Run one bounded sweep; return [(job_id, new_status, attempts), ...]."""
+    with session() as db:
+        rows = db.reap_expired_leases(limit)
+    for job_id, status, attempts in rows:
+        print(f"[reaper] {job_id} lease expired (attempt {attempts}) -> {status}")
+    return rows
+
+
+class JobReaper:
+    def __init__(self, interval: float = REAPER_INTERVAL_S) -> None:
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._extra: List[Callable[[], object]] = []
+
+    def add_sweep(self, fn: Callable[[], object]) -> None:
+        """Run fn after every lease sweep (errors are logged, not raised)."""
+        if fn not in self._extra:
+            self._extra.append(fn)
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="qd-job-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            for fn in [sweep, *self._extra]:
+                try:
+                    fn()
+                except Exception as e:
+                    print(f"[reaper] WARN: {getattr(fn, '__name__', fn)} failed: {e}")
+
+
+REAPER = JobReaper()
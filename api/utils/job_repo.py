@@ -0,0 +1,148 @@
+"""
+DB-backed job repository shared by the jobs, KDM and proof routers
+
+Jobs live in Postgres (jobs table) so every uvicorn worker and replica sees
+the same state. Reads go through a bounded TTL cache keyed by job_id:
+
+- writes made through the repository (create, KDM attach) and worker
+  updates (JOB_REPO.invalidate from /internal/update-job) drop the local
+  entry immediately
+- changes made by another replica show up here within JOB_CACHE_TTL_S
+
+Listing is keyset-paginated: list() returns a page plus an opaque cursor
+(base64 of the last row's created_at and id), so deep pages cost the same
+as the first.
+
+Job records are plain dicts:
+    {"job_id", "status", "profile", "manifest", "customer", "created_at", "updated_at"}
+
+Environment
+-----------
+JOB_CACHE_SIZE    cached jobs per process (default 4096, 0 = off)
+JOB_CACHE_TTL_S   cache entry lifetime in seconds (default 5)
+"""
+from __future__ import annotations
+
+import base64
+import copy
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from api.utils.db import session
+from api.utils.lru import TTLCache
+
+JOB_CACHE_SIZE = int(os.getenv("JOB_CACHE_SIZE", "4096"))
+JOB_CACHE_TTL_S = float(os.getenv("JOB_CACHE_TTL_S", "5"))
+
+# Columns a listing may project (fields=); job_id is always included
+LIST_FIELDS = ("job_id", "status", "created_at", "updated_at", "profile", "priority", "attempts")
+
+
+class JobExistsError(Exception):
+    pass
+
+
+class UnknownCustomerError(LookupError):
+    pass
+
+
+def encode_cursor(key: Tuple[datetime, str]) -> str:
+    raw = json.dumps([key[0].isoformat(), key[1]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, job_uuid = json.loads(raw)
+        return datetime.fromisoformat(ts), str(uuid.UUID(job_uuid))
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+class JobRepository:
+    def __init__(self, cache_size: int = JOB_CACHE_SIZE, ttl: float = JOB_CACHE_TTL_S) -> None:
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl) if cache_size > 0 else None
+
+    def get(self, job_id: str, customer: Optional[str] = None) -> Optional[Dict]:
+        """Job record, or None. With `customer`, other customers' jobs read as missing."""
+        rec = self._cache.get(job_id) if self._cache is not None else None
+        if rec is None:
+            with session() as db:
+                rec = db.get_job_record(job_id)
+            if rec is None:
+                return None
+            if self._cache is not None:
+                self._cache.set(job_id, rec)
+        if customer is not None and rec["customer"] != customer:
+            return None
+        return copy.deepcopy(rec)
+
+    def create(self, job_id: str, customer: str, profile: Dict) -> None:
+        with session(customer) as db:
+            res = db.insert_job(job_id, customer, profile)
+        if res is None:
+            raise UnknownCustomerError(customer)
+        if res == "exists":
+            raise JobExistsError(job_id)
+        self.invalidate(job_id)
+
+    def create_many(self, customer: str, jobs: Sequence[Tuple[str, Dict]]) -> List[bool]:
+        """Create [(job_id, profile)] in one insert; per job, True if created, False if it existed."""
+        with session(customer) as db:
+            created = db.insert_jobs(customer, jobs)
+        if created is None:
+            raise UnknownCustomerError(customer)
+        for job_id in created:
+            self.invalidate(job_id)
+        done = set(created)
+        return [job_id in done for job_id, _ in jobs]
+
+    def list(
+        self,
+        customer: str,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        statuses: Optional[Sequence[str]] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """One page of the customer's jobs (newest first) and the next cursor.
+
+        ValueError for an unknown field or a malformed cursor.
+        """
+        cols = ["job_id"]
+        for f in fields or ("status",):
+            if f not in LIST_FIELDS:
+                raise ValueError(f"unknown field {f!r}; choose from {', '.join(LIST_FIELDS)}")
+            if f not in cols:
+                cols.append(f)
+        after = decode_cursor(cursor) if cursor else None
+
+        with session(customer) as db:
+            # one extra row tells us whether another page exists
+            rows = db.list_jobs(customer, limit + 1, cols, statuses, created_after, created_before, after)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        nxt = encode_cursor(rows[-1]["_key"]) if more else None
+        for r in rows:
+            del r["_key"]
+        return rows, nxt
+
+    def append_kdms(self, job_id: str, kdms: List[Dict]) -> bool:
+        with session() as db:
+            ok = db.append_job_kdms(job_id, kdms)
+        self.invalidate(job_id)
+        return ok
+
+    def invalidate(self, job_id: str) -> None:
+        if self._cache is not None:
+            self._cache.pop(job_id)
+
+
+JOB_REPO = JobRepository()
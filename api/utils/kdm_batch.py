@@ -0,0 +1,138 @@
+"""
+Batch KDM issuance for wide releases (POST /issue/batch)
+
+One call issues a KDM per cinema certificate for a job, for thousands of
+screens at a time:
+
+- a kdm_batches row is created (draft) and moved to issuing
+- certificates are resolved per chunk through the registry
+  (api.utils.kdm_certs): PEMs are fingerprinted on a thread pool and
+  registered on first sight, fingerprint references are looked up
+- each chunk goes through the KDM engine (api.utils.kdm_crypto): with
+  KDM_ENGINE=crypto that wraps, signs and vaults the XML on a process pool
+- kdms rows are written with COPY, KDM_BATCH_CHUNK per transaction; each
+  chunk also adds to kdm_batches.total_kdms, so the batch row always
+  matches what is committed
+- results are yielded per KDM as each chunk commits, then the batch is
+  marked complete (or failed, with the KDMs committed so far kept)
+
+issue() is a generator of plain dicts (one NDJSON line each):
+    {"event": "batch", "batch_id", "job_id", "status": "issuing", "requested"}
+    {"event": "kdm", "kdm_id", "cn", "cert_fingerprint", "valid_from", ...}
+    {"event": "rejected", "cn", "cert_fingerprint", "error"}   (nothing stored;
+                                   bad or unknown certificate, or a KDM window
+                                   outside the certificate's validity)
+    {"event": "complete" | "failed", "batch_id", "total_kdms"[, "error"]}
+
+Environment
+-----------
+KDM_BATCH_CHUNK         kdms rows per COPY transaction (default 1000)
+"""
+from __future__ import annotations
+
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from api.utils.db import session
+from api.utils.kdm_certs import CERT_REGISTRY
+from api.utils.kdm_crypto import ENGINE, KDMContext, Recipient
+
+KDM_BATCH_CHUNK = int(os.getenv("KDM_BATCH_CHUNK", "1000"))
+
+
+def _iso(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _set_status(customer: str, batch_id: str, status: str) -> None:
+    with session(customer) as db:
+        db.kdm_batch_set_status(batch_id, status)
+
+
+def issue(
+    job_id: str,
+    customer: str,
+    cinemas: Sequence[Tuple[Optional[str], Optional[str], Optional[str]]],
+    ctx: KDMContext,
+    key_id: str,
+    label: Optional[str] = None,
+    created_by: Optional[str] = None,
+) -> Iterator[Dict]:
+    """Issue one KDM per (cn, cert_pem, cert_fingerprint); see the module docstring for the events.
+
+    Raises LookupError before yielding anything if the job does not exist.
+    """
+    with session(customer) as db:
+        created = db.kdm_batch_create(job_id, label or f"{job_id} x{len(cinemas)}", created_by)
+    if created is None:
+        raise LookupError(f"job {job_id} not found")
+    batch_id, job_uuid = created
+    return _run(batch_id, job_uuid, job_id, customer, cinemas, ctx, key_id)
+
+
+def _run(
+    batch_id: str,
+    job_uuid: str,
+    job_id: str,
+    customer: str,
+    cinemas: Sequence[Tuple[Optional[str], Optional[str], Optional[str]]],
+    ctx: KDMContext,
+    key_id: str,
+) -> Iterator[Dict]:
+    total = 0
+    status = "failed"
+    try:
+        _set_status(customer, batch_id, "issuing")
+        yield {"event": "batch", "batch_id": batch_id, "job_id": job_id, "status": "issuing", "requested": len(cinemas)}
+
+        vf, vu = _iso(ctx.valid_from), _iso(ctx.valid_until)
+        strict = ENGINE.name != "stub"
+        for i in range(0, len(cinemas), KDM_BATCH_CHUNK):
+            chunk = cinemas[i:i + KDM_BATCH_CHUNK]
+            recips, out = [], []
+            for (cn, pem, _), (fp, (cert, err)) in zip(chunk, CERT_REGISTRY.resolve([c[1:] for c in chunk], strict)):
+                cn = cn or (cert and cert.cn) or "CINEMA-UNKNOWN"
+                if err:
+                    out.append({"event": "rejected", "cn": cn, "cert_fingerprint": fp, "error": err})
+                else:
+                    recips.append(Recipient(str(uuid.uuid4()), cn, pem or "", fp, cert))
+            rows = []
+            for r, (_, vault_key, err) in zip(recips, ENGINE.issue(ctx, recips)):
+                if err:
+                    out.append({"event": "rejected", "cn": r.cn, "cert_fingerprint": r.fingerprint, "error": err})
+                    continue
+                rows.append((r.kdm_id, job_uuid, batch_id, r.cn, r.fingerprint, key_id, ctx.cpl_id,
+                             ctx.valid_from, ctx.valid_until, vault_key))
+                out.append({
+                    "event": "kdm",
+                    "kdm_id": r.kdm_id,
+                    "cn": r.cn,
+                    "cert_fingerprint": r.fingerprint,
+                    "valid_from": vf,
+                    "valid_until": vu,
+                    "key_id": key_id,
+                    "cpl_id": ctx.cpl_id,
+                    "delivered": False,
+                    "vault_key": vault_key,
+                })
+            if rows:
+                with session(customer) as db:
+                    total += db.kdm_copy(batch_id, rows)
+            yield from out
+
+        status = "complete"
+        _set_status(customer, batch_id, status)
+        yield {"event": "complete", "batch_id": batch_id, "total_kdms": total}
+    except Exception as e:
+        yield {"event": "failed", "batch_id": batch_id, "total_kdms": total, "error": str(e)}
+    finally:
+        # also reached when the client disconnects mid-stream (GeneratorExit)
+        if status != "complete":
+            try:
+                _set_status(customer, batch_id, "failed")
+            except Exception as e:
+                print(f"[kdm-batch] WARN: could not mark {batch_id} failed: {e}")
@@ -0,0 +1,160 @@
+"""
+Recipient certificate registry for KDM issuance
+
+Cinemas reuse the same projector / IMB certificates across thousands of
+titles. Each certificate is parsed and checked once, then stored in
+kdm_certificates keyed by its fingerprint (sha256 of the PEM, the same
+value as kdms.cert_fingerprint):
+
+- POST /certs registers PEMs up front; issue requests may then send
+  {"cert_fingerprint": ...} instead of the PEM
+- a PEM sent inline with an issue request is registered on first sight
+- lookups go through a bounded in-process LRU, then one query per request
+  (or per /issue/batch chunk) for the misses
+
+Registration parses the leaf, requires an RSA key, and when the PEM
+carries a chain checks that each certificate is signed by the next. The
+kdm_crypto engine loads the stored public key DER directly, so repeat
+issuance never parses X.509 again.
+
+Rows are immutable, so cached entries never go stale.
+
+Environment
+-----------
+KDM_CERT_REGISTRY_SIZE   registry entries cached per process (default 16384, 0 = off)
+KDM_FP_WORKERS           fingerprint threads (default 8)
+KDM_FP_PARALLEL_MIN      PEMs before the fingerprint thread pool is used (default 256)
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cryptography.exceptions import InvalidSignature
+
+from api.utils.db import session
+from api.utils.kdm_crypto import CertInfo, KDMCryptoError, cert_info, load_pem_chain
+from api.utils.lru import TTLCache
+
+KDM_CERT_REGISTRY_SIZE = int(os.getenv("KDM_CERT_REGISTRY_SIZE", "16384"))
+KDM_FP_WORKERS = int(os.getenv("KDM_FP_WORKERS", "8"))
+KDM_FP_PARALLEL_MIN = int(os.getenv("KDM_FP_PARALLEL_MIN", "256"))
+
+# (certificate or None, error or None) per reference
+Resolved = Tuple[Optional[CertInfo], Optional[str]]
+
+
+def fingerprint(pem: str) -> str:
+    """Short fingerprint of a PEM (sha256 hex), as on single-issue KDM records."""
+    return hashlib.sha256(pem.encode("utf-8")).hexdigest()
+
+
+def fingerprints(pems: Sequence[str]) -> List[str]:
+    """fingerprint() of every PEM, in order; large sets are hashed on a thread pool."""
+    uniq = list(dict.fromkeys(pems))
+    if len(uniq) < KDM_FP_PARALLEL_MIN or KDM_FP_WORKERS <= 1:
+        done = {p: fingerprint(p) for p in uniq}
+    else:
+        # hashlib drops the GIL for buffers over 2 KiB, i.e. most certificates
+        with ThreadPoolExecutor(max_workers=KDM_FP_WORKERS) as pool:
+            chunk = max(1, len(uniq) // (KDM_FP_WORKERS * 4))
+            done = dict(zip(uniq, pool.map(fingerprint, uniq, chunksize=chunk)))
+    return [done[p] for p in pems]
+
+
+def parse(pem: str, fp: str) -> CertInfo:
+    """CertInfo for the leaf of a PEM bundle; KDMCryptoError if unusable."""
+    chain = load_pem_chain(pem)
+    for cert, issuer in zip(chain, chain[1:]):
+        try:
+            cert.verify_directly_issued_by(issuer)
+        except InvalidSignature:
+            raise KDMCryptoError(f"certificate chain does not verify: {cert.subject.rfc4514_string()} is not signed by its issuer")
+        except (ValueError, TypeError) as e:
+            raise KDMCryptoError(f"certificate chain does not verify: {e}")
+    return cert_info(chain[0], fp)
+
+
+def _from_row(row: Dict) -> CertInfo:
+    return CertInfo(**{**row, "serial": int(row["serial"]), "public_key_der": bytes(row["public_key_der"])})
+
+
+class CertRegistry:
+    def __init__(self, cache_size: int = KDM_CERT_REGISTRY_SIZE) -> None:
+        # entries are immutable, so only size bounds the cache
+        self._cache = TTLCache(maxsize=cache_size, ttl=float("inf")) if cache_size > 0 else None
+
+    def _lookup(self, fps: Sequence[str]) -> Dict[str, CertInfo]:
+        found: Dict[str, CertInfo] = {}
+        if self._cache is not None:
+            for fp in fps:
+                c = self._cache.get(fp)
+                if c is not None:
+                    found[fp] = c
+        missing = [fp for fp in dict.fromkeys(fps) if fp not in found]
+        if missing:
+            with session() as db:
+                rows = db.kdm_certs_get(missing)
+            for r in rows:
+                c = _from_row(r)
+                found[c.fingerprint] = c
+                if self._cache is not None:
+                    self._cache.set(c.fingerprint, c)
+        return found
+
+    def get(self, fp: str) -> Optional[CertInfo]:
+        return self._lookup([fp]).get(fp)
+
+    def register(self, pems: Sequence[str], fps: Optional[Sequence[str]] = None) -> List[Resolved]:
+        """Parse, check and store PEMs not registered yet; one result per PEM, in order."""
+        fps = list(fps) if fps is not None else fingerprints(pems)
+        known = self._lookup(fps)
+        out: List[Resolved] = []
+        new: Dict[str, Tuple[CertInfo, str]] = {}
+        for pem, fp in zip(pems, fps):
+            c = known.get(fp) or (new[fp][0] if fp in new else None)
+            if c is None:
+                try:
+                    c = parse(pem, fp)
+                except KDMCryptoError as e:
+                    out.append((None, str(e)))
+                    continue
+                new[fp] = (c, pem)
+            out.append((c, None))
+        if new:
+            with session() as db:
+                db.kdm_certs_put([(*c[:4], str(c.serial), *c[5:], pem) for c, pem in new.values()])
+            if self._cache is not None:
+                for c, _ in new.values():
+                    self._cache.set(c.fingerprint, c)
+        return out
+
+    def resolve(self, refs: Sequence[Tuple[Optional[str], Optional[str]]], strict: bool = True) -> List[Tuple[str, Resolved]]:
+        """(fingerprint, (cert, error)) per (cert_pem, cert_fingerprint) reference.
+
+        Inline PEMs are registered on first sight. An unknown fingerprint is
+        always an error; with strict=False an unparseable PEM resolves to
+        (None, None) instead (the stub engine never reads certificates).
+        """
+        pem_at = [i for i, (pem, _) in enumerate(refs) if pem]
+        pem_fps = fingerprints([refs[i][0] for i in pem_at])
+        fps: List[str] = [fp or "" for _, fp in refs]
+        for i, fp in zip(pem_at, pem_fps):
+            fps[i] = fp
+
+        res: List[Resolved] = [(None, None)] * len(refs)
+        if pem_at:
+            for i, (c, err) in zip(pem_at, self.register([refs[i][0] for i in pem_at], pem_fps)):
+                res[i] = (c, err if strict else None)
+        by_fp = [i for i, (pem, _) in enumerate(refs) if not pem]
+        if by_fp:
+            known = self._lookup([fps[i] for i in by_fp])
+            for i in by_fp:
+                c = known.get(fps[i])
+                res[i] = (c, None) if c else (None, f"unknown certificate fingerprint {fps[i]}")
+        return list(zip(fps, res))
+
+
+CERT_REGISTRY = CertRegistry()
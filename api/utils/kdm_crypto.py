@@ -0,0 +1,629 @@
+"""
+KDM issuance engines for QuickDCP
+
+/issue and /issue/batch hand every KDM to ENGINE, chosen by environment:
+
+- stub    records only (no XML); the MVP behaviour
+- crypto  one SMPTE ST 430-1 style DCinemaSecurityMessage per recipient:
+    * each content key goes into the 138-byte KDM cipher block and is
+      wrapped with RSA-OAEP (SHA-1 / MGF1-SHA-1) for the recipient
+      certificate
+    * AuthenticatedPublic, AuthenticatedPrivate and SignedInfo are emitted
+      in exclusive-C14N form, digested with SHA-256, and signed with the
+      signer key (RSA-SHA256)
+    * the XML is written to the vault bucket as kdm/<job_id>/<kdm_id>.xml
+
+Wrap and sign are CPU bound and grow with screens x keys, so the crypto
+engine fans them out to a ProcessPoolExecutor (KDM_WORKERS processes,
+default one per core). Small requests run inline. Recipients normally
+carry a CertInfo from the certificate registry (api.utils.kdm_certs), so
+only the public key DER is loaded; a bare PEM is parsed instead. Each
+process keeps loaded keys in an LRU keyed by fingerprint, and a KDM whose
+window falls outside the recipient certificate's validity is rejected, as
+is any recipient key that is not RSA of at least MIN_RSA_BITS; an unusable
+certificate fails only its own KDM. Finished XML streams to the vault on a
+thread pool while later KDMs are still being built; all-or-nothing callers
+(/issue) pass atomic=True, which builds every KDM before uploading any and
+removes a partial upload.
+
+The XML is canonical as emitted; it is not checked against a DCI
+validator or an XML-DSig library.
+
+Environment
+-----------
+KDM_ENGINE            stub | crypto (default stub)
+KDM_SIGNER_KEY        PEM private key of the KDM signer (crypto)
+KDM_SIGNER_CERT       PEM signer certificate, optionally followed by its chain (crypto)
+KDM_WORKERS           wrap+sign processes (default: CPU count)
+KDM_PARALLEL_MIN      KDMs per request before the process pool is used (default 8)
+KDM_CERT_CACHE_SIZE   loaded recipient keys kept per process (default 4096)
+KDM_UPLOAD_THREADS    concurrent vault uploads (default 8)
+S3_BUCKET_VAULT       vault bucket; empty = keep XML out of S3 (no vault_key)
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from api.utils.lru import TTLCache
+
+KDM_ENGINE = os.getenv("KDM_ENGINE", "stub").lower()
+KDM_SIGNER_KEY = os.getenv("KDM_SIGNER_KEY", "")
+KDM_SIGNER_CERT = os.getenv("KDM_SIGNER_CERT", "")
+KDM_WORKERS = int(os.getenv("KDM_WORKERS", "0")) or (os.cpu_count() or 1)
+KDM_PARALLEL_MIN = int(os.getenv("KDM_PARALLEL_MIN", "8"))
+KDM_CERT_CACHE_SIZE = int(os.getenv("KDM_CERT_CACHE_SIZE", "4096"))
+KDM_UPLOAD_THREADS = int(os.getenv("KDM_UPLOAD_THREADS", "8"))
+S3_BUCKET_VAULT = os.getenv("S3_BUCKET_VAULT", "")
+REGION = os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
+
+NS_ETM = "http://www.smpte-ra.org/schemas/430-3/2006/ETM"
+NS_KDM = "http://www.smpte-ra.org/schemas/430-1/2006/KDM"
+NS_DSIG = "http://www.w3.org/2000/09/xmldsig#"
+NS_ENC = "http://www.w3.org/2001/04/xmlenc#"
+ALG_EXC_C14N = "http://www.w3.org/2001/10/xml-exc-c14n#"
+ALG_RSA_SHA256 = "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256"
+ALG_SHA256 = "http://www.w3.org/2001/04/xmlenc#sha256"
+ALG_SHA1 = "http://www.w3.org/2000/09/xmldsig#sha1"
+ALG_RSA_OAEP = "http://www.w3.org/2001/04/xmlenc#rsa-oaep-mgf1p"
+
+# ST 430-1 cipher block: structure id || signer thumbprint || CPL id ||
+# key type || key id || not before || not after || content key  (138 bytes)
+CIPHER_STRUCTURE_ID = bytes.fromhex("f1dc124460169a0e85bc300642f866ab")
+KEY_TYPES = ("MDIK", "MDAK", "MDSK", "FMIK", "FMAK", "MDEK")
+# the 138-byte cipher block does not fit RSA-OAEP under smaller moduli
+MIN_RSA_BITS = 2048
+OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA1()), algorithm=hashes.SHA1(), label=None)
+
+
+class KDMCryptoError(ValueError):
+    pass
+
+
+class ContentKey(NamedTuple):
+    key_id: str     # UUID
+    key_type: str   # KEY_TYPES
+    key: bytes      # 16 bytes (AES-128)
+
+
+class KDMContext(NamedTuple):
+    """Everything shared by the KDMs of one request."""
+    job_id: str
+    cpl_id: str
+    title: str
+    keys: Tuple[ContentKey, ...]
+    valid_from: datetime
+    valid_until: datetime
+    issued_at: datetime
+
+
+class CertInfo(NamedTuple):
+    """What issuance needs from a recipient certificate (a kdm_certificates row)."""
+    fingerprint: str
+    cn: Optional[str]
+    subject: str
+    issuer: str
+    serial: int
+    not_before: datetime
+    not_after: datetime
+    public_key_der: bytes
+
+
+class Recipient(NamedTuple):
+    kdm_id: str
+    cn: str
+    cert_pem: str                       # "" when cert is given
+    fingerprint: str
+    cert: Optional[CertInfo] = None
+
+
+# ---------------------------------------------------------------------------
+# Certificates and signer
+# ---------------------------------------------------------------------------
+_RECIPIENTS = TTLCache(maxsize=KDM_CERT_CACHE_SIZE, ttl=float("inf"))
+
+
+def load_pem_chain(pem: str) -> List[x509.Certificate]:
+    """Certificates of a PEM bundle, leaf first."""
+    try:
+        return x509.load_pem_x509_certificates(pem.encode("utf-8"))
+    except ValueError as e:
+        raise KDMCryptoError(f"invalid certificate: {e}")
+
+
+def _check_key(key) -> None:
+    if not isinstance(key, rsa.RSAPublicKey):
+        raise KDMCryptoError("recipient certificate must carry an RSA key")
+    if key.key_size < MIN_RSA_BITS:
+        raise KDMCryptoError(f"recipient RSA key is {key.key_size} bits; at least {MIN_RSA_BITS} required")
+
+
+def cert_info(cert: x509.Certificate, fingerprint: str) -> CertInfo:
+    key = cert.public_key()
+    _check_key(key)
+    cns = cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+    return CertInfo(
+        fingerprint,
+        str(cns[0].value) if cns else None,
+        cert.subject.rfc4514_string(),
+        cert.issuer.rfc4514_string(),
+        cert.serial_number,
+        cert.not_valid_before_utc,
+        cert.not_valid_after_utc,
+        key.public_bytes(Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo),
+    )
+
+
+def parse_cert(pem: str, fingerprint: str) -> CertInfo:
+    return cert_info(load_pem_chain(pem)[0], fingerprint)
+
+
+def recipient_cert(r: Recipient) -> Tuple[CertInfo, rsa.RSAPublicKey]:
+    """Recipient certificate and public key, loaded once per fingerprint per process."""
+    c = _RECIPIENTS.get(r.fingerprint)
+    if c is None:
+        info = r.cert or parse_cert(r.cert_pem, r.fingerprint)
+        try:
+            key = serialization.load_der_public_key(info.public_key_der)
+        except ValueError as e:
+            raise KDMCryptoError(f"invalid recipient public key: {e}")
+        _check_key(key)  # rows registered before the size check
+        c = (info, key)
+        _RECIPIENTS.set(r.fingerprint, c)
+    return c
+
+
+class Signer(NamedTuple):
+    key: rsa.RSAPrivateKey
+    certs_der: Tuple[bytes, ...]   # signer first, then its chain
+    issuer: str
+    serial: int
+    thumbprint: bytes              # SHA-1 of the signer certificate (cipher block)
+
+
+def load_signer(key_path: str = KDM_SIGNER_KEY, cert_path: str = KDM_SIGNER_CERT) -> Signer:
+    if not key_path or not cert_path:
+        raise KDMCryptoError("KDM_ENGINE=crypto needs KDM_SIGNER_KEY and KDM_SIGNER_CERT")
+    try:
+        with open(key_path, "rb") as f:
+            key = serialization.load_pem_private_key(f.read(), password=None)
+        with open(cert_path, "rb") as f:
+            chain = x509.load_pem_x509_certificates(f.read())
+    except (OSError, ValueError) as e:
+        raise KDMCryptoError(f"cannot load KDM signer: {e}")
+    if not isinstance(key, rsa.RSAPrivateKey):
+        raise KDMCryptoError("KDM signer key must be RSA")
+    der = tuple(c.public_bytes(Encoding.DER) for c in chain)
+    return Signer(key, der, chain[0].issuer.rfc4514_string(), chain[0].serial_number, hashlib.sha1(der[0]).digest())
+
+
+# ---------------------------------------------------------------------------
+# KDM XML
+# ---------------------------------------------------------------------------
+def _t(s: str) -> str:
+    """Text node as exclusive C14N writes it."""
+    return escape(s, {"\r": "&#xD;"})
+
+
+def _utc(dt: datetime) -> datetime:
+    return (dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt).astimezone(timezone.utc)
+
+
+def _ts(dt: datetime) -> str:
+    return _utc(dt).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def _urn(u: str) -> str:
+    return f"urn:uuid:{uuid.UUID(u)}"
+
+
+def _ds(name: str, body: str, attrs: str = "") -> str:
+    # exclusive C14N declares a prefix on every element that uses it below a
+    # parent that does not, so the emitted form is already canonical
+    return f'<dsig:{name} xmlns:dsig="{NS_DSIG}"{attrs}>{body}</dsig:{name}>'
+
+
+def cipher_block(signer: Signer, ctx: KDMContext, ck: ContentKey) -> bytes:
+    blk = (
+        CIPHER_STRUCTURE_ID
+        + signer.thumbprint
+        + uuid.UUID(ctx.cpl_id).bytes
+        + ck.key_type.encode("ascii")
+        + uuid.UUID(ck.key_id).bytes
+        + _ts(ctx.valid_from).encode("ascii")
+        + _ts(ctx.valid_until).encode("ascii")
+        + ck.key
+    )
+    assert len(blk) == 138
+    return blk
+
+
+def build_kdm(signer: Signer, ctx: KDMContext, r: Recipient) -> bytes:
+    """One signed KDM for one recipient."""
+    cert, public_key = recipient_cert(r)
+    if not (cert.not_before <= _utc(ctx.valid_from) and _utc(ctx.valid_until) <= cert.not_after):
+        raise KDMCryptoError("KDM validity falls outside the recipient certificate's validity")
+
+    pub = (
+        '<AuthenticatedPublic Id="ID_AuthenticatedPublic">'
+        f"<MessageId>{_urn(r.kdm_id)}</MessageId>"
+        "<MessageType>http://www.smpte-ra.org/430-1/2006/KDM#kdm-key-type</MessageType>"
+        f"<AnnotationText>{_t(ctx.title)}</AnnotationText>"
+        f"<IssueDate>{_ts(ctx.issued_at)}</IssueDate>"
+        "<Signer>"
+        + _ds("X509IssuerName", _t(signer.issuer))
+        + _ds("X509SerialNumber", str(signer.serial))
+        + "</Signer>"
+        "<RequiredExtensions>"
+        f'<KDMRequiredExtensions xmlns="{NS_KDM}">'
+        "<Recipient><X509IssuerSerial>"
+        + _ds("X509IssuerName", _t(cert.issuer))
+        + _ds("X509SerialNumber", str(cert.serial))
+        + f"</X509IssuerSerial><X509SubjectName>{_t(cert.subject)}</X509SubjectName></Recipient>"
+        f"<CompositionPlaylistId>{_urn(ctx.cpl_id)}</CompositionPlaylistId>"
+        f"<ContentTitleText>{_t(ctx.title)}</ContentTitleText>"
+        f"<ContentKeysNotValidBefore>{_ts(ctx.valid_from)}</ContentKeysNotValidBefore>"
+        f"<ContentKeysNotValidAfter>{_ts(ctx.valid_until)}</ContentKeysNotValidAfter>"
+        "<KeyIdList>"
+        + "".join(f"<TypedKeyId><KeyType>{k.key_type}</KeyType><KeyId>{_urn(k.key_id)}</KeyId></TypedKeyId>" for k in ctx.keys)
+        + "</KeyIdList>"
+        "</KDMRequiredExtensions>"
+        "</RequiredExtensions>"
+        "<NonCriticalExtensions></NonCriticalExtensions>"
+        "</AuthenticatedPublic>"
+    )
+
+    enc = []
+    for ck in ctx.keys:
+        wrapped = public_key.encrypt(cipher_block(signer, ctx, ck), OAEP)
+        enc.append(
+            f'<enc:EncryptedKey xmlns:enc="{NS_ENC}">'
+            f'<enc:EncryptionMethod Algorithm="{ALG_RSA_OAEP}">'
+            + _ds("DigestMethod", "", f' Algorithm="{ALG_SHA1}"')
+            + "</enc:EncryptionMethod>"
+            f"<enc:CipherData><enc:CipherValue>{base64.b64encode(wrapped).decode()}</enc:CipherValue></enc:CipherData>"
+            "</enc:EncryptedKey>"
+        )
+    priv = '<AuthenticatedPrivate Id="ID_AuthenticatedPrivate">' + "".join(enc) + "</AuthenticatedPrivate>"
+
+    def digest(fragment: str) -> str:
+        # the apex inherits the default namespace from the root; C14N renders it there
+        apex_end = fragment.index(" ")
+        canon = fragment[:apex_end] + f' xmlns="{NS_ETM}"' + fragment[apex_end:]
+        return base64.b64encode(hashlib.sha256(canon.encode("utf-8")).digest()).decode()
+
+    refs = "".join(
+        f'<dsig:Reference URI="#{rid}">'
+        f'<dsig:DigestMethod Algorithm="{ALG_SHA256}"></dsig:DigestMethod>'
+        f"<dsig:DigestValue>{digest(frag)}</dsig:DigestValue>"
+        "</dsig:Reference>"
+        for rid, frag in (("ID_AuthenticatedPublic", pub), ("ID_AuthenticatedPrivate", priv))
+    )
+    signed_info = _ds(
+        "SignedInfo",
+        f'<dsig:CanonicalizationMethod Algorithm="{ALG_EXC_C14N}"></dsig:CanonicalizationMethod>'
+        f'<dsig:SignatureMethod Algorithm="{ALG_RSA_SHA256}"></dsig:SignatureMethod>'
+        + refs,
+    )
+    sig = signer.key.sign(signed_info.encode("utf-8"), padding.PKCS1v15(), hashes.SHA256())
+    # Signature declares dsig, so SignedInfo drops its own declaration in the document
+    signed_info_doc = signed_info.replace(f' xmlns:dsig="{NS_DSIG}"', "", 1)
+    x509_data = "".join(
+        "<dsig:X509Data>"
+        + (
+            "<dsig:X509IssuerSerial>"
+            f"<dsig:X509IssuerName>{_t(signer.issuer)}</dsig:X509IssuerName>"
+            f"<dsig:X509SerialNumber>{signer.serial}</dsig:X509SerialNumber>"
+            "</dsig:X509IssuerSerial>"
+            if i == 0 else ""
+        )
+        + f"<dsig:X509Certificate>{base64.b64encode(der).decode()}</dsig:X509Certificate>"
+        "</dsig:X509Data>"
+        for i, der in enumerate(signer.certs_der)
+    )
+    signature = (
+        f'<dsig:Signature xmlns:dsig="{NS_DSIG}">'
+        + signed_info_doc
+        + f"<dsig:SignatureValue>{base64.b64encode(sig).decode()}</dsig:SignatureValue>"
+        f"<dsig:KeyInfo>{x509_data}</dsig:KeyInfo>"
+        "</dsig:Signature>"
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+        f'<DCinemaSecurityMessage xmlns="{NS_ETM}">{pub}{priv}{signature}</DCinemaSecurityMessage>\n'
+    ).encode("utf-8")
+
+
+def _build_safe(signer: Signer, ctx: KDMContext, r: Recipient) -> Tuple[str, Optional[bytes], Optional[str]]:
+    # a bad certificate fails its own KDM, not the whole request; cryptography
+    # reports unusable keys as plain ValueError / TypeError (e.g. OAEP on a
+    # key too small for the cipher block)
+    try:
+        return r.kdm_id, build_kdm(signer, ctx, r), None
+    except KDMCryptoError as e:
+        return r.kdm_id, None, str(e)
+    except (ValueError, TypeError) as e:
+        return r.kdm_id, None, f"cannot build KDM for this certificate: {e}"
+
+
+# ---------------------------------------------------------------------------
+# Process pool workers
+# ---------------------------------------------------------------------------
+_SIGNER: Optional[Signer] = None
+
+
+def _worker_init(key_path: str, cert_path: str) -> None:
+    global _SIGNER
+    _SIGNER = load_signer(key_path, cert_path)
+
+
+def _build_chunk(ctx: KDMContext, recipients: List[Recipient]) -> List[Tuple[str, Optional[bytes], Optional[str]]]:
+    assert _SIGNER is not None
+    return [_build_safe(_SIGNER, ctx, r) for r in recipients]
+
+
+# ---------------------------------------------------------------------------
+# Engines
+# ---------------------------------------------------------------------------
+class KDMEngine(ABC):
+    name = "abstract"
+
+    def check(self, ctx: KDMContext) -> None:
+        """KDMCryptoError if the request cannot be issued by this engine."""
+
+    @abstractmethod
+    def issue(
+        self, ctx: KDMContext, recipients: Sequence[Recipient], atomic: bool = False
+    ) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        """Yield (kdm_id, vault_key or None, error or None) per recipient, in order.
+
+        With atomic=True nothing is stored unless every recipient builds: on
+        any error no vault_key is returned for anyone, so the caller can
+        reject the whole request without leaving objects behind.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class StubEngine(KDMEngine):
+    name = "stub"
+
+    def issue(
+        self, ctx: KDMContext, recipients: Sequence[Recipient], atomic: bool = False
+    ) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        for r in recipients:
+            yield r.kdm_id, None, None
+
+
+class CryptoEngine(KDMEngine):
+    name = "crypto"
+
+    def __init__(
+        self,
+        key_path: str = KDM_SIGNER_KEY,
+        cert_path: str = KDM_SIGNER_CERT,
+        workers: int = KDM_WORKERS,
+        bucket: str = S3_BUCKET_VAULT,
+    ) -> None:
+        self.signer = load_signer(key_path, cert_path)  # fail fast on bad config
+        self._paths = (key_path, cert_path)
+        self.workers = max(1, workers)
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._uploads: Optional[ThreadPoolExecutor] = None
+        self._s3 = None
+
+    def check(self, ctx: KDMContext) -> None:
+        if not ctx.keys:
+            raise KDMCryptoError("content_keys are required for KDM_ENGINE=crypto")
+        try:
+            uuid.UUID(ctx.cpl_id or "")
+        except ValueError:
+            raise KDMCryptoError("cpl_id must be a UUID for KDM_ENGINE=crypto")
+        for k in ctx.keys:
+            if k.key_type not in KEY_TYPES:
+                raise KDMCryptoError(f"key_type must be one of {', '.join(KEY_TYPES)}")
+            if len(k.key) != 16:
+                raise KDMCryptoError("content keys must be 16 bytes (32 hex chars)")
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a threaded server process is not safe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_worker_init,
+                    initargs=self._paths,
+                )
+            return self._pool
+
+    def _upload_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._uploads is None:
+                import boto3
+
+                self._s3 = boto3.client("s3", region_name=REGION)
+                self._uploads = ThreadPoolExecutor(max_workers=max(1, KDM_UPLOAD_THREADS), thread_name_prefix="qd-kdm-vault")
+            return self._uploads
+
+    def _upload(self, key: str, xml: bytes) -> str:
+        self._s3.put_object(Bucket=self.bucket, Key=key, Body=xml, ContentType="application/xml")
+        return key
+
+    def build(self, ctx: KDMContext, recipients: Sequence[Recipient]) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+        """(kdm_id, xml, error) per recipient, in order; large requests run on the process pool."""
+        self.check(ctx)
+        if self.workers == 1 or len(recipients) < KDM_PARALLEL_MIN:
+            for r in recipients:
+                yield _build_safe(self.signer, ctx, r)
+            return
+        pool = self._process_pool()
+        size = max(1, min(64, len(recipients) // (self.workers * 4)))
+        futs = [pool.submit(_build_chunk, ctx, list(recipients[i:i + size])) for i in range(0, len(recipients), size)]
+        try:
+            for f in futs:
+                yield from f.result()
+        finally:
+            for f in futs:
+                f.cancel()
+
+    def issue(
+        self, ctx: KDMContext, recipients: Sequence[Recipient], atomic: bool = False
+    ) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        if not self.bucket:
+            for kdm_id, _, err in self.build(ctx, recipients):
+                yield kdm_id, None, err
+            return
+        if atomic:
+            yield from self._issue_atomic(ctx, recipients)
+            return
+        uploads = self._upload_pool()
+        pending: List[Tuple[str, Optional[Future], Optional[str]]] = []
+        for kdm_id, xml, err in self.build(ctx, recipients):
+            fut = uploads.submit(self._upload, f"kdm/{ctx.job_id}/{kdm_id}.xml", xml) if xml is not None else None
+            pending.append((kdm_id, fut, err))
+            # keep results in order, but do not hold more XML than the uploaders can take
+            while pending and (pending[0][1] is None or pending[0][1].done() or len(pending) > 4 * KDM_UPLOAD_THREADS):
+                kid, f, e = pending.pop(0)
+                yield kid, f.result() if f is not None else None, e
+        for kid, f, e in pending:
+            yield kid, f.result() if f is not None else None, e
+
+    def _issue_atomic(self, ctx: KDMContext, recipients: Sequence[Recipient]) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        """Build everything first; upload only if all built, and undo a partial upload."""
+        built = list(self.build(ctx, recipients))
+        if any(err for _, _, err in built):
+            for kdm_id, _, err in built:
+                yield kdm_id, None, err
+            return
+        uploads = self._upload_pool()
+        futs = [(kdm_id, uploads.submit(self._upload, f"kdm/{ctx.job_id}/{kdm_id}.xml", xml)) for kdm_id, xml, _ in built]
+        stored: List[Tuple[str, str]] = []
+        failure: Optional[BaseException] = None
+        for kdm_id, f in futs:
+            try:
+                stored.append((kdm_id, f.result()))
+            except Exception as e:
+                failure = failure or e
+        if failure is not None:
+            self._discard([key for _, key in stored])
+            raise failure
+        for kdm_id, key in stored:
+            yield kdm_id, key, None
+
+    def _discard(self, keys: List[str]) -> None:
+        """Best-effort delete of vault objects written for a request that failed."""
+        for i in range(0, len(keys), 1000):
+            try:
+                self._s3.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True},
+                )
+            except Exception as e:
+                print(f"[kdm] WARN: could not remove {len(keys[i:i + 1000])} vault object(s): {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._uploads is not None:
+                self._uploads.shutdown(wait=True)
+                self._uploads = None
+
+
+_ENGINES = {
+    "stub": StubEngine,
+    "crypto": CryptoEngine,
+}
+
+
+def make_engine(kind: str = KDM_ENGINE) -> KDMEngine:
+    try:
+        return _ENGINES[kind]()
+    except KeyError:
+        raise ValueError(f"KDM_ENGINE must be one of {', '.join(_ENGINES)}, got {kind!r}")
+
+
+ENGINE = make_engine()
+
+
+if __name__ == "__main__":  # self-check: build, unwrap and verify one KDM
+    import tempfile
+    import xml.etree.ElementTree as ET
+    from datetime import timedelta
+
+    from cryptography.x509.oid import NameOID
+
+    def _mk(cn: str, key: rsa.RSAPrivateKey, issuer_key: rsa.RSAPrivateKey, issuer: Optional[x509.Name] = None) -> x509.Certificate:
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn), x509.NameAttribute(NameOID.ORGANIZATION_NAME, "QD & Co")])
+        now = datetime.now(timezone.utc)
+        return (
+            x509.CertificateBuilder().subject_name(name).issuer_name(issuer or name)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now).not_valid_after(now + timedelta(days=1))
+            .sign(issuer_key, hashes.SHA256())
+        )
+
+    skey = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    rkey = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    scert = _mk("signer", skey, skey)
+    rcert = _mk("SCR-1", rkey, skey, scert.subject).public_bytes(Encoding.PEM).decode()
+    with tempfile.TemporaryDirectory() as d:
+        kp, cp = os.path.join(d, "k.pem"), os.path.join(d, "c.pem")
+        with open(kp, "wb") as f:
+            f.write(skey.private_bytes(Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+        with open(cp, "wb") as f:
+            f.write(scert.public_bytes(Encoding.PEM))
+        eng = CryptoEngine(kp, cp, workers=1, bucket="")
+
+    t0 = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(minutes=1)
+    ck = ContentKey(str(uuid.uuid4()), "MDIK", os.urandom(16))
+    ctx = KDMContext("JOB-SELFTEST", str(uuid.uuid4()), "Title <1> & more", (ck,), t0, t0 + timedelta(hours=12), t0)
+    rec = Recipient(str(uuid.uuid4()), "SCR-1", rcert, "fp-1")
+    (kid, xml, err), = list(eng.build(ctx, [rec]))
+    assert err is None
+    assert list(eng.build(ctx, [rec._replace(cert_pem="bad", fingerprint="fp-bad")]))[0][2].startswith("invalid certificate")
+    doc = xml.decode()
+    root = ET.fromstring(xml)  # well-formed
+
+    # the wrapped key opens with the recipient key and carries our cipher block
+    cv = root.find(f".//{{{NS_ENC}}}CipherValue").text
+    blk = rkey.decrypt(base64.b64decode(cv), OAEP)
+    assert blk == cipher_block(eng.signer, ctx, ck) and blk[-16:] == ck.key
+
+    # emitted fragments are already canonical, and the signature covers SignedInfo
+    for tag, rid in (("AuthenticatedPublic", "ID_AuthenticatedPublic"), ("AuthenticatedPrivate", "ID_AuthenticatedPrivate")):
+        frag = doc[doc.index(f"<{tag} "):doc.index(f"</{tag}>") + len(tag) + 3]
+        canon = frag.replace(f"<{tag} ", f'<{tag} xmlns="{NS_ETM}" ', 1)
+        assert ET.canonicalize(canon) == canon, tag
+        want = base64.b64encode(hashlib.sha256(canon.encode()).digest()).decode()
+        assert f'URI="#{rid}"' in doc and want in doc
+    si = doc[doc.index("<dsig:SignedInfo>"):doc.index("</dsig:SignedInfo>") + len("</dsig:SignedInfo>")]
+    si = si.replace("<dsig:SignedInfo>", f'<dsig:SignedInfo xmlns:dsig="{NS_DSIG}">', 1)
+    assert ET.canonicalize(si) == si
+    sv = root.find(f".//{{{NS_DSIG}}}SignatureValue").text
+    skey.public_key().verify(base64.b64decode(sv), si.encode(), padding.PKCS1v15(), hashes.SHA256())
+    assert recipient_cert(rec) is recipient_cert(rec._replace(cert_pem="not parsed again"))
+    info = parse_cert(rcert, "fp-2")
+    assert info.cn == "SCR-1" and recipient_cert(Recipient("k", "c", "", "fp-2", info))[0] is info
+    late = ctx._replace(valid_until=t0 + timedelta(days=30))
+    assert "outside" in list(eng.build(late, [rec._replace(kdm_id=str(uuid.uuid4()))]))[0][2]
+    print("kdm_crypto ok", len(xml), "bytes")
@@ -0,0 +1,86 @@
+"""
+Small thread-safe LRU cache with per-entry TTL.
+
+Used for hot, read-mostly lookups (e.g. public /verify responses) so bursts
+of identical requests are served from memory instead of storage.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """LRU bounded by entry count and, with maxweight > 0, by the total of
+    the weights passed to set() (e.g. approximate bytes)."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, maxweight: int = 0) -> None:
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weight = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value, w = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.weight -= w
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, weight: int = 0) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.weight -= old[2]
+            self._data[key] = (expires, value, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (self.maxweight > 0 and self.weight > self.maxweight):
+                self.weight -= self._data.popitem(last=False)[1][2]
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return None
+            self.weight -= item[2]
+            return item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+if __name__ == "__main__":  # simple self-checks
+    c = TTLCache(maxsize=2, ttl=0.05)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)  # evicts b (least recently used)
+    assert c.get("b") is None and c.get("a") == 1 and c.get("c") == 3
+    time.sleep(0.06)
+    assert c.get("a") is None and len(c) == 1
+    c.set("d", 4, ttl=10)
+    assert c.pop("d") == 4 and c.get("d") is None
+    w = TTLCache(maxsize=10, ttl=10, maxweight=10)
+    w.set("a", 1, weight=4)
+    w.set("b", 2, weight=4)
+    w.set("a", 1, weight=5)  # replacing an entry replaces its weight
+    assert w.weight == 9 and len(w) == 2
+    w.set("c", 3, weight=3)  # evicts b, the least recently used
+    assert w.get("b") is None and w.weight == 8
+    print("lru ok")
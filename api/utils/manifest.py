@@ -10,18 +10,55 @@ Goals
 
 These rules must NOT reorder lists; array order is preserved intentionally so
 operators can see the real sequence of outputs/KDMs.
+
+canonical_manifest_bytes() is the reference form. sha256_manifest() goes
+through MANIFEST_HASHER, which produces the same bytes but remembers the
+canonical text of each dict/list subtree, keyed by a structural fingerprint
+(BLAKE2b of its pickle). When a manifest grows by one KDM, only the changed
+path (root, kdm list, new entry) is serialized again; every other subtree
+comes from the cache. The cache is bounded by approximate bytes as well as
+entries; the root, which differs on every call that matters, and subtrees
+over 1/64 of the budget are never cached (their children still are).
+
+Strings that are ASCII or already NFC skip unicodedata.normalize.
+
+Environment
+-----------
+MANIFEST_HASH_CACHE_SIZE   cached subtrees per process (default 16384, 0 = off)
+MANIFEST_HASH_CACHE_MB     approximate size bound of those subtrees (default 64, 0 = off)
 """
 from __future__ import annotations
 
 import json
 import hashlib
+import os
+import pickle
 import unicodedata
+from json.encoder import encode_basestring
 from typing import Any
 
+from api.utils.lru import TTLCache
+
+MANIFEST_HASH_CACHE_SIZE = int(os.getenv("MANIFEST_HASH_CACHE_SIZE", "16384"))
+MANIFEST_HASH_CACHE_MB = int(os.getenv("MANIFEST_HASH_CACHE_MB", "64"))
+# Pickled size under which a subtree is tried as one json.dumps call
+_INLINE_BYTES = 64 * 1024
+# Long lists are fingerprinted and cached in blocks of this many items
+_BLOCK = 64
+# Per-entry bookkeeping (key, tuple, OrderedDict link) counted against the byte budget
+_ENTRY_OVERHEAD = 200
+
 # ---------------------------------------------------------------------------
 # Normalization
 # ---------------------------------------------------------------------------
 
+def _nfc(s: str) -> str:
+    """NFC form of `s`; ASCII and already-normalized strings are returned as-is."""
+    if s.isascii() or unicodedata.is_normalized("NFC", s):
+        return s
+    return unicodedata.normalize("NFC", s)
+
+
 def _normalize(value: Any) -> Any:
     """Recursively normalize strings to NFC and descend into lists/dicts.
 
@@ -30,7 +67,7 @@ def _normalize(value: Any) -> Any:
     normalized prior to canonical serialization.
     """
     if isinstance(value, str):
-        return unicodedata.normalize("NFC", value)
+        return _nfc(value)
     if isinstance(value, list):
         return [_normalize(v) for v in value]
     if isinstance(value, dict):
@@ -60,9 +97,99 @@ def canonical_manifest_bytes(obj: Any, *, ensure_ascii: bool = False) -> bytes:
     ).encode("utf-8")
 
 
+# ---------------------------------------------------------------------------
+# Memoized hashing
+# ---------------------------------------------------------------------------
+
+class ManifestHasher:
+    """canonical_manifest_bytes() (ensure_ascii=False) with per-subtree memoization.
+
+    Every dict/list subtree is fingerprinted with BLAKE2b over its pickle
+    (C speed, and type-exact: 1, 1.0, True, tuples and subclasses all
+    differ) and its canonical text cached under that fingerprint; lists
+    longer than _BLOCK are cached per block of _BLOCK items instead. On a
+    miss, subtrees under _INLINE_BYTES go through json.dumps in one C call
+    when the result is ASCII (nothing to normalize); larger or non-ASCII
+    ones are rebuilt from their children. Anything else (non-str keys,
+    tuples, subclasses, floats) is encoded exactly as the reference does.
+    The root and subtrees over budget/64 bytes are not cached.
+    """
+
+    def __init__(self, cache_size: int = MANIFEST_HASH_CACHE_SIZE, cache_mb: int = MANIFEST_HASH_CACHE_MB) -> None:
+        budget = cache_mb * 1024 * 1024
+        on = cache_size > 0 and budget > 0
+        self._cache = TTLCache(maxsize=cache_size, ttl=float("inf"), maxweight=budget) if on else None
+        # larger subtrees are rebuilt from their (cached) children instead
+        self._entry_max = budget // 64
+
+    def canonical_bytes(self, obj: Any) -> bytes:
+        # the root itself is not worth a fingerprint: it changes on every append
+        t = type(obj)
+        if t is dict or (t is list and len(obj) <= _BLOCK):
+            return self._build(obj, t, inline=False).encode("utf-8")
+        return self._enc(obj).encode("utf-8")
+
+    def sha256(self, obj: Any) -> str:
+        return hashlib.sha256(self.canonical_bytes(obj)).hexdigest()
+
+    def clear(self) -> None:
+        if self._cache is not None:
+            self._cache.clear()
+
+    def _enc(self, v: Any) -> str:
+        t = type(v)
+        if t is str:
+            return encode_basestring(_nfc(v))
+        if t is list and len(v) > _BLOCK:
+            # fixed blocks: appending to a long list (manifest["kdm"]) re-encodes only the last one
+            return "[" + ",".join([self._enc(v[i:i + _BLOCK])[1:-1] for i in range(0, len(v), _BLOCK)]) + "]"
+        if t is dict or t is list:
+            if self._cache is None:
+                return self._build(v, t, inline=False)
+            try:
+                pk = pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:  # unpicklable member: no fingerprint, no caching
+                return self._build(v, t, inline=False)
+            if len(pk) > self._entry_max:
+                return self._build(v, t, inline=False)
+            fp = hashlib.blake2b(pk, digest_size=16).digest()
+            out = self._cache.get(fp)
+            if out is None:
+                out = self._build(v, t, inline=len(pk) < _INLINE_BYTES)
+                if len(out) <= self._entry_max:
+                    self._cache.set(fp, out, weight=len(out) + _ENTRY_OVERHEAD)
+            return out
+        if v is None:
+            return "null"
+        if t is bool:
+            return "true" if v else "false"
+        if t is int:
+            return int.__repr__(v)
+        return _dumps(_normalize(v))
+
+    def _build(self, v: Any, t: type, inline: bool) -> str:
+        if inline:
+            text = _dumps(v)
+            if text.isascii():
+                return text
+        if t is list:
+            return "[" + ",".join([self._enc(x) for x in v]) + "]"
+        if all(type(k) is str for k in v):
+            # keys are not normalized, only sorted (as json.dumps(sort_keys=True))
+            return "{" + ",".join([encode_basestring(k) + ":" + self._enc(v[k]) for k in sorted(v)]) + "}"
+        return _dumps(_normalize(v))
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+MANIFEST_HASHER = ManifestHasher()
+
+
 def sha256_manifest(obj: Any) -> str:
     """Return hex SHA-256 of the canonical manifest bytes."""
-    return hashlib.sha256(canonical_manifest_bytes(obj)).hexdigest()
+    return MANIFEST_HASHER.sha256(obj)
 
 
 def canonical_equal(a: Any, b: Any) -> bool:
@@ -77,11 +204,3 @@ def sanitize(obj: Any) -> Any:
     """
     return _normalize(obj)
 
-
-if __name__ == "__main__":  # simple self-checks
-    sample = {"b": ["e\u0301", "x"], "a": "cafe\u0301"}  # decomposed accents
-    bytes1 = canonical_manifest_bytes(sample)
-    bytes2 = canonical_manifest_bytes({"a": "café", "b": ["é", "x"]})
-    assert bytes1 == bytes2
-    print("canonical sha256:", sha256_manifest(sample))
-    print("equal:", canonical_equal(sample, {"a": "café", "b": ["é", "x"]}))
@@ -0,0 +1,93 @@
+"""
+Merkle trees for batched TSA proofs
+
+Leaves are manifest SHA-256 digests (hex). Hashing is domain-separated as in
+RFC 6962 so a leaf can never be passed off as an inner node:
+
+    leaf = SHA256(0x00 || digest)
+    node = SHA256(0x01 || left || right)
+
+An odd node at the end of a level is promoted unchanged to the next level
+(no duplication, so two different leaf sets never share a root).
+
+An inclusion path is a list of "L:<hex>" / "R:<hex>" steps from the leaf up,
+naming the sibling hash and the side it sits on. The same format is accepted
+by ops/verify_offline.sh --path.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import List, Sequence
+
+
+def leaf_hash(sha_hex: str) -> bytes:
+    return hashlib.sha256(b"\x00" + bytes.fromhex(sha_hex)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+class MerkleTree:
+    def __init__(self, leaves_hex: Sequence[str]) -> None:
+        if not leaves_hex:
+            raise ValueError("merkle tree needs at least one leaf")
+        level = [leaf_hash(h) for h in leaves_hex]
+        self.levels: List[List[bytes]] = [level]
+        while len(level) > 1:
+            nxt = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                nxt.append(level[-1])
+            self.levels.append(nxt)
+            level = nxt
+
+    @property
+    def root(self) -> str:
+        return self.levels[-1][0].hex()
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+    def path(self, index: int) -> List[str]:
+        """Inclusion path for leaf `index`, leaf level first."""
+        if not 0 <= index < len(self):
+            raise IndexError("leaf index out of range")
+        out: List[str] = []
+        for level in self.levels[:-1]:
+            sib = index ^ 1
+            if sib < len(level):
+                out.append(("L:" if sib < index else "R:") + level[sib].hex())
+            index //= 2
+        return out
+
+
+def root_from_path(sha_hex: str, path: Sequence[str]) -> str:
+    """Recompute the root from a leaf digest and its inclusion path."""
+    h = leaf_hash(sha_hex)
+    for step in path:
+        side, _, sib_hex = step.partition(":")
+        sib = bytes.fromhex(sib_hex)
+        if side == "L":
+            h = node_hash(sib, h)
+        elif side == "R":
+            h = node_hash(h, sib)
+        else:
+            raise ValueError(f"bad path step {step!r}")
+    return h.hex()
+
+
+def verify_inclusion(sha_hex: str, path: Sequence[str], root_hex: str) -> bool:
+    try:
+        return root_from_path(sha_hex, path) == root_hex.lower()
+    except ValueError:
+        return False
+
+
+if __name__ == "__main__":  # simple self-checks
+    for n in (1, 2, 3, 5, 8, 13, 100):
+        leaves = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(n)]
+        t = MerkleTree(leaves)
+        for i, leaf in enumerate(leaves):
+            assert verify_inclusion(leaf, t.path(i), t.root), (n, i)
+        assert not verify_inclusion(leaves[0], t.path(min(1, n - 1)), t.root) or n == 1
+    print("merkle ok, root(3):", MerkleTree([hashlib.sha256(b"x").hexdigest()] * 3).root)
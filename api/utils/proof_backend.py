@@ -0,0 +1,311 @@
+"""
+Pluggable proof storage for QuickDCP
+
+All proof reads and writes (/proof/*, /verify, the Merkle batcher) go
+through STORE, a ProofStore chosen by environment:
+
+- file      JSON files under jobs/proof/ (api.utils.proof_store); one host only
+- postgres  proofs / proof_batches tables; shared by every API replica
+- memory    process-local dicts, for tests and throwaway dev servers
+
+With PROOF_CACHE_SIZE > 0 the store is wrapped in a bounded LRU with
+write-through: writes go to the backend first and then refresh the cache,
+hot reads (e.g. repeated /verify) skip the backend. Entries expire after
+PROOF_CACHE_TTL_S, which bounds how long a replica can serve a record
+another replica has since changed.
+
+Records are plain dicts (shape documented in api.utils.proof_store).
+Callers get copies and must save() what they change.
+
+Environment
+-----------
+PROOF_STORE          file | postgres | memory (default file)
+PROOF_CACHE_SIZE     LRU entries in front of the store (default 0 = off)
+PROOF_CACHE_TTL_S    cache entry lifetime in seconds (default 5)
+"""
+from __future__ import annotations
+
+import copy
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional
+
+from api.utils import proof_store
+from api.utils.db import session
+from api.utils.lru import TTLCache
+
+PROOF_STORE = os.getenv("PROOF_STORE", "file").lower()
+PROOF_CACHE_SIZE = int(os.getenv("PROOF_CACHE_SIZE", "0"))
+PROOF_CACHE_TTL_S = float(os.getenv("PROOF_CACHE_TTL_S", "5"))
+
+
+class ProofStore(ABC):
+    @abstractmethod
+    def load(self, job_id: str) -> Optional[Dict]: ...
+
+    @abstractmethod
+    def save(self, job_id: str, record: Dict) -> None:
+        """Create or replace a record; LookupError if the backend has no such job."""
+
+    @abstractmethod
+    def delete(self, job_id: str) -> bool: ...
+
+    @abstractmethod
+    def find_by_sha(self, manifest_sha256: str) -> Optional[str]:
+        """job_id whose record carries this manifest hash, if any."""
+
+    @abstractmethod
+    def list_ids(self) -> Iterator[str]: ...
+
+    @abstractmethod
+    def load_batch(self, batch_id: str) -> Optional[Dict]: ...
+
+    @abstractmethod
+    def save_batch(self, batch: Dict) -> None: ...
+
+    @abstractmethod
+    def list_batch_ids(self, status: Optional[str] = None) -> List[str]: ...
+
+    def batch_members(self, batch_id: str) -> List[Dict]:
+        """Proof records whose batch_id is batch_id (open-batch recovery).
+
+        The default scans every record; backends with an index override it.
+        """
+        out = []
+        for job_id in self.list_ids():
+            rec = self.load(job_id)
+            if rec and rec.get("batch_id") == batch_id:
+                out.append(rec)
+        return out
+
+    def init(self, job_id: str, manifest_sha256: str) -> Dict:
+        rec = self.load(job_id) or {"job_id": job_id, "status": "PENDING"}
+        rec["manifest_sha256"] = manifest_sha256
+        self.save(job_id, rec)
+        return rec
+
+
+class FileProofStore(ProofStore):
+    def load(self, job_id: str) -> Optional[Dict]:
+        return proof_store.load(job_id)
+
+    def save(self, job_id: str, record: Dict) -> None:
+        proof_store.save(job_id, record)
+
+    def delete(self, job_id: str) -> bool:
+        return proof_store.delete(job_id)
+
+    def find_by_sha(self, manifest_sha256: str) -> Optional[str]:
+        return proof_store.find_by_sha(manifest_sha256)
+
+    def list_ids(self) -> Iterator[str]:
+        return proof_store.list_ids()
+
+    def load_batch(self, batch_id: str) -> Optional[Dict]:
+        return proof_store.load_batch(batch_id)
+
+    def save_batch(self, batch: Dict) -> None:
+        proof_store.save_batch(batch)
+
+    def list_batch_ids(self, status: Optional[str] = None) -> List[str]:
+        return proof_store.list_batch_ids(status)
+
+
+class PostgresProofStore(ProofStore):
+    """proofs / proof_batches (migration 0025); one pooled session per call."""
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        with session() as db:
+            return db.proof_load(job_id)
+
+    def save(self, job_id: str, record: Dict) -> None:
+        with session() as db:
+            if not db.proof_save(job_id, record):
+                raise LookupError(f"job {job_id} not found")
+
+    def delete(self, job_id: str) -> bool:
+        with session() as db:
+            return db.proof_delete(job_id)
+
+    def find_by_sha(self, manifest_sha256: str) -> Optional[str]:
+        with session() as db:
+            return db.proof_find_by_sha(manifest_sha256)
+
+    def list_ids(self) -> Iterator[str]:
+        after = None
+        while True:
+            with session() as db:
+                page = db.proof_list_ids(after)
+            yield from page
+            if len(page) < 1000:
+                return
+            after = page[-1]
+
+    def load_batch(self, batch_id: str) -> Optional[Dict]:
+        with session() as db:
+            return db.proof_batch_load(batch_id)
+
+    def save_batch(self, batch: Dict) -> None:
+        with session() as db:
+            db.proof_batch_save(batch)
+
+    def list_batch_ids(self, status: Optional[str] = None) -> List[str]:
+        with session() as db:
+            return db.proof_batch_ids(status)
+
+    def batch_members(self, batch_id: str) -> List[Dict]:
+        with session() as db:
+            return db.proof_batch_members(batch_id)
+
+
+class MemoryProofStore(ProofStore):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._proofs: Dict[str, Dict] = {}
+        self._batches: Dict[str, Dict] = {}
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            rec = self._proofs.get(job_id)
+            return copy.deepcopy(rec) if rec is not None else None
+
+    def save(self, job_id: str, record: Dict) -> None:
+        with self._lock:
+            self._proofs[job_id] = copy.deepcopy(record)
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            return self._proofs.pop(job_id, None) is not None
+
+    def find_by_sha(self, manifest_sha256: str) -> Optional[str]:
+        sha = manifest_sha256.lower()
+        with self._lock:
+            for jid, rec in self._proofs.items():
+                if str(rec.get("manifest_sha256", "")).lower() == sha:
+                    return jid
+        return None
+
+    def list_ids(self) -> Iterator[str]:
+        with self._lock:
+            ids = list(self._proofs)
+        return iter(ids)
+
+    def load_batch(self, batch_id: str) -> Optional[Dict]:
+        with self._lock:
+            b = self._batches.get(batch_id)
+            return copy.deepcopy(b) if b is not None else None
+
+    def save_batch(self, batch: Dict) -> None:
+        with self._lock:
+            self._batches[batch["batch_id"]] = copy.deepcopy(batch)
+
+    def list_batch_ids(self, status: Optional[str] = None) -> List[str]:
+        with self._lock:
+            return sorted(k for k, b in self._batches.items() if status is None or b.get("status") == status)
+
+
+class CachedProofStore(ProofStore):
+    """Bounded write-through LRU in front of another store."""
+
+    def __init__(self, inner: ProofStore, maxsize: int = 1024, ttl: float = 5.0) -> None:
+        self.inner = inner
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        rec = self._cache.get(("p", job_id))
+        if rec is None:
+            rec = self.inner.load(job_id)
+            if rec is None:
+                return None
+            self._cache.set(("p", job_id), rec)
+        return copy.deepcopy(rec)
+
+    def save(self, job_id: str, record: Dict) -> None:
+        try:
+            self.inner.save(job_id, record)
+        except Exception:
+            self._cache.pop(("p", job_id))
+            raise
+        self._cache.set(("p", job_id), copy.deepcopy(record))
+
+    def delete(self, job_id: str) -> bool:
+        self._cache.pop(("p", job_id))
+        return self.inner.delete(job_id)
+
+    def find_by_sha(self, manifest_sha256: str) -> Optional[str]:
+        sha = manifest_sha256.lower()
+        jid = self._cache.get(("s", sha))
+        if jid is not None:
+            rec = self.load(jid)
+            # the record may have been re-initialised with another manifest
+            if rec and str(rec.get("manifest_sha256", "")).lower() == sha:
+                return jid
+            self._cache.pop(("s", sha))
+        jid = self.inner.find_by_sha(manifest_sha256)
+        if jid is not None:
+            self._cache.set(("s", sha), jid)
+        return jid
+
+    def list_ids(self) -> Iterator[str]:
+        return self.inner.list_ids()
+
+    def load_batch(self, batch_id: str) -> Optional[Dict]:
+        b = self._cache.get(("b", batch_id))
+        if b is None:
+            b = self.inner.load_batch(batch_id)
+            if b is None:
+                return None
+            self._cache.set(("b", batch_id), b)
+        return copy.deepcopy(b)
+
+    def save_batch(self, batch: Dict) -> None:
+        try:
+            self.inner.save_batch(batch)
+        except Exception:
+            self._cache.pop(("b", batch["batch_id"]))
+            raise
+        self._cache.set(("b", batch["batch_id"]), copy.deepcopy(batch))
+
+    def list_batch_ids(self, status: Optional[str] = None) -> List[str]:
+        return self.inner.list_batch_ids(status)
+
+    def batch_members(self, batch_id: str) -> List[Dict]:
+        return self.inner.batch_members(batch_id)
+
+
+_BACKENDS = {
+    "file": FileProofStore,
+    "postgres": PostgresProofStore,
+    "memory": MemoryProofStore,
+}
+
+
+def make_store(kind: str = PROOF_STORE, cache_size: int = PROOF_CACHE_SIZE, cache_ttl: float = PROOF_CACHE_TTL_S) -> ProofStore:
+    try:
+        store: ProofStore = _BACKENDS[kind]()
+    except KeyError:
+        raise ValueError(f"PROOF_STORE must be one of {', '.join(_BACKENDS)}, got {kind!r}")
+    if cache_size > 0:
+        store = CachedProofStore(store, maxsize=cache_size, ttl=cache_ttl)
+    return store
+
+
+STORE = make_store()
+
+
+if __name__ == "__main__":  # simple self-checks (memory backend, with cache)
+    s = make_store("memory", cache_size=8)
+    r = s.init("JOB-SELFTEST", "AB" * 32)
+    r["status"] = "TSA_OK"
+    assert s.load("JOB-SELFTEST")["status"] == "PENDING"  # copies, not shared dicts
+    s.save("JOB-SELFTEST", r)
+    assert s.load("JOB-SELFTEST")["status"] == "TSA_OK"
+    assert s.find_by_sha("ab" * 32) == "JOB-SELFTEST"
+    s.init("JOB-SELFTEST", "cd" * 32)
+    assert s.find_by_sha("ab" * 32) is None
+    s.save_batch({"batch_id": "B-1", "status": "OPEN", "leaves": []})
+    assert s.list_batch_ids("OPEN") == ["B-1"] and s.list_batch_ids("TSA_OK") == []
+    assert list(s.list_ids()) == ["JOB-SELFTEST"] and s.delete("JOB-SELFTEST")
+    assert s.load("JOB-SELFTEST") is None
+    print("proof_backend ok")
@@ -0,0 +1,309 @@
+"""
+Merkle-batched TSA timestamping for QuickDCP proofs
+
+Instead of one TSQ per job, manifest hashes that arrive within a window are
+collected into a batch; when the batch reaches TSA_BATCH_MAX leaves or is
+TSA_BATCH_WINDOW_S old it is sealed:
+
+- the leaves (manifest SHA-256s, in arrival order) form a Merkle tree
+  (api.utils.merkle), and each member's proof record gets its leaf_index,
+  merkle_root and merkle_path
+- ONE TSQ is built over the root
+- with TSA_URL set the TSQ is sent to the TSA right away; otherwise the batch
+  waits for POST /proof/batch/{batch_id}/ack with the TSR
+
+When the TSR verifies against the root, every member record becomes TSA_OK.
+A job's proof is then checked independently as leaf -> root (path) -> TSR.
+
+Batches live in the proof store (api.utils.proof_backend). Leaves of the
+open batch are kept in memory and the batch is written in full only when
+sealed; while open, its row holds just the owning process and a heartbeat
+(refreshed every TSA_BATCH_STALE_S / 4). Every member's proof record
+carries batch_id and leaf_index, so at startup an OPEN batch whose
+heartbeat is older than TSA_BATCH_STALE_S (its owner died) is rebuilt from
+those records and sealed; batches other live processes or replicas are
+still filling are left alone.
+
+Environment
+-----------
+TSA_BATCH            1 = /proof/init batches by default (default 0)
+TSA_BATCH_MAX        leaves per batch (default 512)
+TSA_BATCH_WINDOW_S   max age of an open batch in seconds (default 10)
+TSA_BATCH_STALE_S    heartbeat age after which an OPEN batch's owner is
+                     presumed dead (default max(60, 3 x window))
+TSA_URL              RFC-3161 endpoint to submit sealed batches to (optional)
+TSA_CA_PATH          CA bundle used to verify TSRs fetched from TSA_URL
+"""
+from __future__ import annotations
+
+import base64
+import os
+import secrets
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from api.utils.proof_backend import STORE
+from api.utils.merkle import MerkleTree
+from api.utils.tsa import build_tsq, verify_tsr
+
+BATCH_ENABLED = os.getenv("TSA_BATCH", "0") == "1"
+BATCH_MAX = int(os.getenv("TSA_BATCH_MAX", "512"))
+BATCH_WINDOW_S = float(os.getenv("TSA_BATCH_WINDOW_S", "10"))
+BATCH_STALE_S = float(os.getenv("TSA_BATCH_STALE_S", "0")) or max(60.0, 3 * BATCH_WINDOW_S)
+TSA_URL = os.getenv("TSA_URL", "")
+TSA_CA_PATH = os.getenv("TSA_CA_PATH", "")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _age_s(ts: Optional[str]) -> float:
+    if not ts:
+        return float("inf")
+    try:
+        return (datetime.now(timezone.utc) - datetime.fromisoformat(ts)).total_seconds()
+    except ValueError:
+        return float("inf")
+
+
+def _new_batch_id() -> str:
+    return f"B-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{secrets.token_hex(3)}"
+
+
+def _tsa_ca_pem() -> Optional[str]:
+    if TSA_CA_PATH and os.path.isfile(TSA_CA_PATH):
+        with open(TSA_CA_PATH, "r", encoding="utf-8") as f:
+            return f.read()
+    return None
+
+
+def submit_tsq(tsq_der: bytes, url: str = TSA_URL, timeout: float = 30.0) -> bytes:
+    """POST a TSQ to an RFC-3161 TSA over HTTP and return the TSR (DER)."""
+    r = requests.post(url, data=tsq_der, headers={"Content-Type": "application/timestamp-query"}, timeout=timeout)
+    r.raise_for_status()
+    return r.content
+
+
+def ack_batch(batch_id: str, tsr_der: bytes, ca_pem: Optional[str] = None) -> Dict:
+    """Verify a TSR against the batch root and mark every member TSA_OK.
+
+    Raises KeyError for unknown batches, ValueError if the batch is still
+    open, and tsa.TSAVerifyError if the TSR does not cover the root.
+    """
+    batch = STORE.load_batch(batch_id)
+    if not batch:
+        raise KeyError(batch_id)
+    if batch.get("status") == "OPEN":
+        raise ValueError("batch is still open")
+
+    verify_tsr(tsr_der, batch["merkle_root"], ca_pem)
+
+    batch["tsr_base64"] = base64.b64encode(tsr_der).decode()
+    batch["status"] = "TSA_OK"
+    batch["tsa_at"] = _now()
+    STORE.save_batch(batch)
+
+    for leaf in batch["leaves"]:
+        rec = STORE.load(leaf["job_id"])
+        if rec and rec.get("batch_id") == batch_id:
+            rec["status"] = "TSA_OK"
+            rec["tsa_ok"] = True
+            STORE.save(leaf["job_id"], rec)
+    return batch
+
+
+class ProofBatcher:
+    def __init__(self, max_leaves: int = BATCH_MAX, window_s: float = BATCH_WINDOW_S,
+                 stale_s: float = BATCH_STALE_S) -> None:
+        self.max_leaves = max(1, max_leaves)
+        self.window_s = window_s
+        self.stale_s = stale_s
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}"
+        self._lock = threading.Lock()
+        self._open: Optional[Dict] = None
+        self._index: Dict[str, int] = {}  # job_id -> leaf index in the open batch
+        self._opened_at = 0.0
+        self._beat_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -----------------------------------------------------------------
+    # Lifecycle
+    # -----------------------------------------------------------------
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self.recover()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="qd-proof-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def _run(self) -> None:
+        tick = max(0.2, min(1.0, self.window_s / 4))
+        while not self._stop.wait(tick):
+            try:
+                self.seal_due()
+                self.heartbeat()
+            except Exception as e:
+                print(f"[proof-batch] WARN: seal/heartbeat failed: {e}")
+
+    def heartbeat(self) -> None:
+        """Refresh the open batch's heartbeat so recovery leaves it alone."""
+        with self._lock:
+            if self._open is None or not self._open["leaves"]:
+                return
+            if time.monotonic() - self._beat_at < self.stale_s / 4:
+                return
+            self._save_open()
+
+    def recover(self) -> None:
+        """Seal OPEN batches whose owner is gone (heartbeat older than stale_s)."""
+        for bid in STORE.list_batch_ids("OPEN"):
+            batch = STORE.load_batch(bid)
+            if not batch or batch.get("status") != "OPEN" or batch.get("owner") == self.owner:
+                continue
+            if _age_s(batch.get("heartbeat_at") or batch.get("created_at")) < self.stale_s:
+                continue  # another live process is still filling it
+            if not batch.get("leaves"):
+                batch["leaves"] = self._members_as_leaves(bid)
+            if batch["leaves"]:
+                print(f"[proof-batch] sealing orphaned batch {bid} (owner {batch.get('owner', '?')})")
+                self._finish(self._seal(batch))
+
+    @staticmethod
+    def _members_as_leaves(batch_id: str) -> List[Dict]:
+        """Rebuild an open batch's leaves from its members' proof records."""
+        members = [
+            r for r in STORE.batch_members(batch_id)
+            if r.get("status") == "BATCHED" and r.get("leaf_index") is not None
+        ]
+        members.sort(key=lambda r: r["leaf_index"])
+        return [{"job_id": r["job_id"], "sha256": r["manifest_sha256"]} for r in members]
+
+    # -----------------------------------------------------------------
+    # Batching
+    # -----------------------------------------------------------------
+    def _save_open(self) -> None:
+        """Persist the open batch without its leaves (owner + heartbeat only)."""
+        batch = self._open
+        batch["heartbeat_at"] = _now()
+        STORE.save_batch({**batch, "leaves": [], "size": len(batch["leaves"])})
+        self._beat_at = time.monotonic()
+
+    def add(self, job_id: str, manifest_sha256: str) -> Tuple[str, int]:
+        """Put a job's manifest hash into the open batch; return (batch_id, leaf_index)."""
+        sealed = None
+        with self._lock:
+            if self._open is None:
+                self._open = {
+                    "batch_id": _new_batch_id(),
+                    "status": "OPEN",
+                    "created_at": _now(),
+                    "owner": self.owner,
+                    "leaves": [],
+                }
+                self._index = {}
+                self._opened_at = time.monotonic()
+            batch = self._open
+            leaves: List[Dict] = batch["leaves"]
+            idx = self._index.get(job_id)
+
+            # record first: a store that rejects the job (LookupError) leaves no leaf behind
+            rec = STORE.load(job_id) or {"job_id": job_id}
+            for k in ("merkle_root", "merkle_path", "tsr_base64"):
+                rec.pop(k, None)
+            rec.update(
+                manifest_sha256=manifest_sha256,
+                status="BATCHED",
+                tsa_ok=False,
+                batch_id=batch["batch_id"],
+                leaf_index=len(leaves) if idx is None else idx,
+            )
+            STORE.save(job_id, rec)
+
+            if idx is None:
+                idx = self._index[job_id] = len(leaves)
+                leaves.append({"job_id": job_id, "sha256": manifest_sha256})
+                if idx == 0:
+                    self._save_open()  # first member: claim the batch for this process
+            else:
+                leaves[idx]["sha256"] = manifest_sha256  # re-init before sealing
+
+            if len(leaves) >= self.max_leaves:
+                sealed = self._seal(batch)
+                self._open = None
+            batch_id = batch["batch_id"]
+        if sealed is not None:
+            self._finish(sealed)
+        return batch_id, idx
+
+    def seal_due(self) -> Optional[Dict]:
+        with self._lock:
+            if not self._has_leaves() or time.monotonic() - self._opened_at < self.window_s:
+                return None
+            sealed = self._seal(self._open)
+            self._open = None
+        self._finish(sealed)
+        return sealed
+
+    def flush(self) -> Optional[Dict]:
+        """Seal the open batch now, whatever its age or size."""
+        with self._lock:
+            if not self._has_leaves():
+                return None
+            sealed = self._seal(self._open)
+            self._open = None
+        self._finish(sealed)
+        return sealed
+
+    def _has_leaves(self) -> bool:
+        # an open batch whose every add was rejected by the store has nothing to seal
+        if self._open is not None and not self._open["leaves"]:
+            self._open = None
+        return self._open is not None
+
+    def _seal(self, batch: Dict) -> Dict:
+        leaves = batch["leaves"]
+        tree = MerkleTree([l["sha256"] for l in leaves])
+        root = tree.root
+        for i, leaf in enumerate(leaves):
+            rec = STORE.load(leaf["job_id"])
+            if not rec or rec.get("batch_id") != batch["batch_id"]:
+                continue
+            rec.update(leaf_index=i, merkle_root=root, merkle_path=tree.path(i))
+            STORE.save(leaf["job_id"], rec)
+        batch.pop("size", None)
+        batch.update(
+            status="SEALED",
+            sealed_at=_now(),
+            merkle_root=root,
+            tsq_der=base64.b64encode(build_tsq(root)).decode(),
+        )
+        STORE.save_batch(batch)
+        print(f"[proof-batch] sealed {batch['batch_id']}: {len(leaves)} leaves, root {root}")
+        return batch
+
+    def _finish(self, batch: Dict) -> None:
+        """Outside the lock: hand the sealed batch to the TSA if one is configured."""
+        if not TSA_URL:
+            return
+        try:
+            tsr = submit_tsq(base64.b64decode(batch["tsq_der"]))
+            ack_batch(batch["batch_id"], tsr, _tsa_ca_pem())
+            print(f"[proof-batch] {batch['batch_id']} timestamped by {TSA_URL}")
+        except Exception as e:
+            # batch stays SEALED; POST /proof/batch/{id}/ack can finish it later
+            print(f"[proof-batch] WARN: TSA submit for {batch['batch_id']} failed: {e}")
+
+
+BATCHER = ProofBatcher()
@@ -7,6 +7,46 @@ Responsibilities
 - Provide atomic writes (temp file + replace) to avoid corruption.
 - Lazy-create storage directory: <project>/jobs/proof/
 - Tiny convenience helpers: load, save, init, exists, list_ids, delete.
+- Merkle batch records (TSA batching) under jobs/proof/batches/.
+- manifest_sha256 -> job_id index under jobs/proof/_by_sha/<ab>/<sha>, kept
+  in step by save/init/delete, so find_by_sha is one file read instead of a
+  scan.
+
+Layout
+------
+Records are sharded by the SHA-256 of their job_id, so no directory grows
+past a few thousand entries even with millions of proofs:
+
+    jobs/proof/ab/cd/<job_id>.proof.json
+
+Records in the old flat layout (jobs/proof/<job_id>.proof.json) are still
+read and move to their shard on the next save; `relayout` moves them all.
+
+Id log
+------
+Full scans don't walk the shard tree. Each newly created record appends its
+job_id to an append-only log under jobs/proof/_log/:
+
+    base-<n>.jsonl   compacted, de-duplicated ids (newest base wins)
+    seg-<n>.jsonl    ids appended since, rotated at PROOF_LOG_SEGMENT_BYTES
+
+Record files stay authoritative: a logged id is listed only while its record
+exists. When PROOF_LOG_COMPACT_SEGMENTS segments have piled up they are
+folded into a new base in a background thread (dropping deleted and
+duplicate ids) without blocking writers. list_ids streams ids in log order;
+list_ids_page pages through them with an opaque cursor (a cursor taken
+before a compaction is rejected with ValueError; restart the listing).
+
+Maintenance
+-----------
+    python -m api.utils.proof_store relayout   # flat -> sharded, rebuild log + index
+    python -m api.utils.proof_store compact    # fold log segments now
+    python -m api.utils.proof_store reindex    # rebuild the sha index only
+
+Environment
+-----------
+PROOF_LOG_SEGMENT_BYTES      rotate the active segment past this size (default 4 MiB)
+PROOF_LOG_COMPACT_SEGMENTS   compact once this many segments exist (default 4)
 
 Record shape (example)
 ----------------------
@@ -14,33 +54,73 @@ Record shape (example)
   "job_id": "JOB-123",
   "status": "PENDING" | "TSA_OK",
   "manifest_sha256": "...",
-  "tsa_ok": true
+  "tsa_ok": true,
+  # batched proofs only (see api.utils.proof_batch)
+  "batch_id": "B-...", "leaf_index": 7,
+  "merkle_root": "...", "merkle_path": ["L:<hex>", "R:<hex>", ...]
 }
 """
 from __future__ import annotations
 
+import fcntl
+import hashlib
+import itertools
 import json
 import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 # Resolve project root two levels up: api/utils -> project
 ROOT = Path(__file__).resolve().parents[2]
 PROOFD = ROOT / "jobs" / "proof"
 PROOFD.mkdir(parents=True, exist_ok=True)
+BATCHD = PROOFD / "batches"
+BATCHD.mkdir(parents=True, exist_ok=True)
+SHAD = PROOFD / "_by_sha"
+SHAD.mkdir(parents=True, exist_ok=True)
+LOGD = PROOFD / "_log"
+LOGD.mkdir(parents=True, exist_ok=True)
+
+SEGMENT_BYTES = int(os.getenv("PROOF_LOG_SEGMENT_BYTES", str(4 << 20)))
+COMPACT_SEGMENTS = int(os.getenv("PROOF_LOG_COMPACT_SEGMENTS", "4"))
+
+_SHA_RE = re.compile(r"[0-9a-f]{64}")
+_SEG_RE = re.compile(r"(base|seg)-(\d{8})\.jsonl")
+_HEX2_RE = re.compile(r"[0-9a-f]{2}")
+_SUFFIX = ".proof.json"
+
+_compacting = threading.Lock()
+_legacy_warned = False
 
 
 def _path(job_id: str) -> Path:
-    return PROOFD / f"{job_id}.proof.json"
+    h = hashlib.sha256(job_id.encode("utf-8")).hexdigest()
+    return PROOFD / h[:2] / h[2:4] / f"{job_id}{_SUFFIX}"
+
+
+def _legacy_path(job_id: str) -> Path:
+    return PROOFD / f"{job_id}{_SUFFIX}"
+
+
+def _existing_path(job_id: str) -> Optional[Path]:
+    for p in (_path(job_id), _legacy_path(job_id)):
+        if p.exists():
+            return p
+    return None
 
 
 def exists(job_id: str) -> bool:
-    return _path(job_id).exists()
+    return _existing_path(job_id) is not None
 
 
 def load(job_id: str) -> Optional[Dict]:
-    p = _path(job_id)
-    if not p.exists():
+    p = _existing_path(job_id)
+    if p is None:
         return None
     try:
         return json.loads(p.read_text(encoding="utf-8"))
@@ -55,10 +135,87 @@ def _atomic_write(path: Path, data: str) -> None:
     os.replace(tmp, path)
 
 
+def _norm_sha(sha: object) -> Optional[str]:
+    h = str(sha or "").lower()
+    return h if _SHA_RE.fullmatch(h) else None
+
+
+def _sha_path(sha: str) -> Path:
+    return SHAD / sha[:2] / sha
+
+
+def _index_put(sha: Optional[str], job_id: str) -> None:
+    if not sha:
+        return
+    p = _sha_path(sha)
+    p.parent.mkdir(exist_ok=True)
+    _atomic_write(p, job_id)
+
+
+def _index_drop(sha: Optional[str], job_id: str) -> None:
+    # only if the entry still points at this job (another job may share the hash)
+    if not sha:
+        return
+    p = _sha_path(sha)
+    try:
+        if p.read_text(encoding="utf-8") == job_id:
+            p.unlink()
+    except FileNotFoundError:
+        pass
+
+
 def save(job_id: str, record: Dict) -> None:
     p = _path(job_id)
+    old = load(job_id)
+    created = not p.exists()
+    if created:
+        p.parent.mkdir(parents=True, exist_ok=True)
     s = json.dumps(record, separators=(",", ":"))
     _atomic_write(p, s)
+    if created:
+        _legacy_path(job_id).unlink(missing_ok=True)
+        _log_append(job_id)
+
+    sha = _norm_sha(record.get("manifest_sha256"))
+    old_sha = _norm_sha(old.get("manifest_sha256")) if old else None
+    if old_sha != sha:
+        _index_drop(old_sha, job_id)
+    _index_put(sha, job_id)
+
+
+def find_by_sha(manifest_sha256: str) -> Optional[str]:
+    """job_id of the proof whose manifest_sha256 matches, via the index.
+
+    Entries are checked against the record they point at, so a stale entry
+    (e.g. a proof file removed by hand) reads as a miss, never a wrong hit.
+    """
+    sha = _norm_sha(manifest_sha256)
+    if not sha:
+        return None
+    try:
+        job_id = _sha_path(sha).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    rec = load(job_id)
+    if not rec or _norm_sha(rec.get("manifest_sha256")) != sha:
+        return None
+    return job_id
+
+
+def rebuild_index() -> int:
+    """Recreate the sha index from the proof records; returns entries written."""
+    for d in SHAD.iterdir():
+        if d.is_dir():
+            for f in d.iterdir():
+                f.unlink()
+    n = 0
+    for jid in list_ids():
+        rec = load(jid)
+        sha = _norm_sha(rec.get("manifest_sha256")) if rec else None
+        if sha:
+            _index_put(sha, jid)
+            n += 1
+    return n
 
 
 def init(job_id: str, manifest_sha256: str) -> Dict:
@@ -68,30 +225,295 @@ def init(job_id: str, manifest_sha256: str) -> Dict:
     return rec
 
 
-def list_ids() -> List[str]:
-    out: List[str] = []
-    for f in PROOFD.glob("*.proof.json"):
-        out.append(f.stem.replace(".proof", ""))
-    return sorted(out)
-
-
 def delete(job_id: str) -> bool:
     p = _path(job_id)
+    rec = load(job_id)
     try:
         p.unlink(missing_ok=True)
+        _legacy_path(job_id).unlink(missing_ok=True)
+        if rec:
+            _index_drop(_norm_sha(rec.get("manifest_sha256")), job_id)
         return True
     except Exception:
         return False
 
 
-if __name__ == "__main__":  # basic self-test
+# ---------------------------------------------------------------------
+# Id log
+# ---------------------------------------------------------------------
+Segment = Tuple[int, Path]
+
+
+@contextmanager
+def _log_lock(exclusive: bool) -> Iterator[None]:
+    # appends share the lock; rotating to a fresh segment takes it exclusively
+    with open(LOGD / ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _segments() -> Tuple[Optional[Segment], List[Segment]]:
+    """Newest base and the segments after it, as (number, path)."""
+    base: Optional[Segment] = None
+    segs: List[Segment] = []
+    for f in LOGD.iterdir():
+        m = _SEG_RE.fullmatch(f.name)
+        if not m:
+            continue
+        n = int(m.group(2))
+        if m.group(1) == "base":
+            if base is None or n > base[0]:
+                base = (n, f)
+        else:
+            segs.append((n, f))
+    floor = base[0] if base else -1
+    return base, sorted(x for x in segs if x[0] > floor)
+
+
+def _last_number(base: Optional[Segment], segs: List[Segment]) -> int:
+    return max([base[0] if base else 0] + [n for n, _ in segs])
+
+
+def _log_append(job_id: str) -> None:
+    line = (json.dumps(job_id) + "\n").encode("utf-8")
+    with _log_lock(False):
+        base, segs = _segments()
+        if not segs or segs[-1][1].stat().st_size >= SEGMENT_BYTES:
+            n = _last_number(base, segs) + 1
+            segs.append((n, LOGD / f"seg-{n:08d}.jsonl"))
+        # O_APPEND: concurrent appenders (other workers) never interleave a line
+        fd = os.open(segs[-1][1], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    if len(segs) >= COMPACT_SEGMENTS:
+        _compact_async()
+
+
+def _lines(fh, pos: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """(offset after line, line) for each complete line from `pos`."""
+    fh.seek(pos)
+    for line in fh:
+        pos += len(line)
+        if line.endswith(b"\n"):
+            yield pos, line
+
+
+def _stream(base: Optional[Segment], segs: List[Segment], start: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[str, str]]:
+    """(job_id, cursor) for every live id in log order, each id once."""
+    files = ([base] if base else []) + segs
+    if start and start[0] not in {n for n, _ in files}:
+        raise ValueError("cursor expired (proof log was compacted); restart the listing")
+    # open everything up front: a concurrent compaction may unlink these files
+    handles = [(n, open(p, "rb")) for n, p in files]
+    try:
+        # an id can repeat in the tail (deleted and re-created); only its last
+        # occurrence counts. The base is already de-duplicated.
+        last: Dict[bytes, Tuple[int, int]] = {}
+        for n, fh in handles[1 if base else 0:]:
+            for pos, line in _lines(fh):
+                last[line] = (n, pos)
+        for n, fh in handles:
+            if start and n < start[0]:
+                continue
+            for pos, line in _lines(fh, start[1] if start and n == start[0] else 0):
+                if last.get(line, (n, pos)) != (n, pos):
+                    continue
+                try:
+                    jid = json.loads(line)
+                except ValueError:
+                    continue
+                if _path(jid).exists():
+                    yield jid, f"{n}:{pos}"
+    finally:
+        for _, fh in handles:
+            fh.close()
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not cursor:
+        return None
+    try:
+        n, pos = cursor.split(":")
+        return int(n), int(pos)
+    except ValueError:
+        raise ValueError(f"bad cursor {cursor!r}")
+
+
+def _warn_legacy() -> None:
+    global _legacy_warned
+    if not _legacy_warned:
+        _legacy_warned = True
+        if next(PROOFD.glob(f"*{_SUFFIX}"), None) is not None:
+            print("[proof-store] WARN: flat-layout proofs found and not listed; "
+                  "run `python -m api.utils.proof_store relayout`")
+
+
+def list_ids(cursor: Optional[str] = None) -> Iterator[str]:
+    """Stream every job_id in the store (log order, not sorted)."""
+    _warn_legacy()
+    base, segs = _segments()
+    for jid, _ in _stream(base, segs, _parse_cursor(cursor)):
+        yield jid
+
+
+def list_ids_page(cursor: Optional[str] = None, limit: int = 1000) -> Tuple[List[str], Optional[str]]:
+    """One page of job_ids and the cursor for the next page (None at the end)."""
+    _warn_legacy()
+    base, segs = _segments()
+    page = list(itertools.islice(_stream(base, segs, _parse_cursor(cursor)), limit))
+    nxt = page[-1][1] if len(page) == limit else None
+    return [jid for jid, _ in page], nxt
+
+
+def _rebase(scan: Callable[[Optional[Segment], List[Segment]], Iterator[str]], min_segments: int = 0) -> Optional[int]:
+    """Replace the log up to now with a single base written from `scan`.
+
+    Writers are only blocked while the active segment is rotated; the scan
+    itself runs unlocked and ids created meanwhile land in the new segment.
+    """
+    with _log_lock(True):
+        base, segs = _segments()
+        if len(segs) < min_segments:
+            return None
+        last = _last_number(base, segs)
+        (LOGD / f"seg-{last + 1:08d}.jsonl").touch()
+
+    out = LOGD / f"base-{last:08d}.jsonl"
+    tmp = LOGD / f".base-{last:08d}.tmp"
+    count = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        for jid in scan(base, segs):
+            f.write(json.dumps(jid) + "\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, out)
+
+    for f in LOGD.iterdir():
+        m = _SEG_RE.fullmatch(f.name)
+        if m and int(m.group(2)) <= last and f != out:
+            f.unlink(missing_ok=True)
+        elif f.name.endswith(".tmp"):
+            # left by a compaction that died with its process
+            try:
+                if f.stat().st_mtime < time.time() - 3600:
+                    f.unlink()
+            except FileNotFoundError:
+                pass
+    return count
+
+
+def compact(force: bool = True) -> Optional[int]:
+    """Fold the log into a new base of live, unique ids; returns the id count."""
+    return _rebase(
+        lambda base, segs: (jid for jid, _ in _stream(base, segs)),
+        min_segments=0 if force else COMPACT_SEGMENTS,
+    )
+
+
+def _compact_async() -> None:
+    if not _compacting.acquire(blocking=False):
+        return
+
+    def run() -> None:
+        try:
+            compact(force=False)
+        except Exception as e:
+            print(f"[proof-store] WARN: log compaction failed: {e}")
+        finally:
+            _compacting.release()
+
+    threading.Thread(target=run, name="qd-proof-compact", daemon=True).start()
+
+
+def _walk_shards() -> Iterator[str]:
+    for d1 in os.scandir(PROOFD):
+        if not (d1.is_dir() and _HEX2_RE.fullmatch(d1.name)):
+            continue
+        for d2 in os.scandir(d1.path):
+            if not (d2.is_dir() and _HEX2_RE.fullmatch(d2.name)):
+                continue
+            for f in os.scandir(d2.path):
+                if f.name.endswith(_SUFFIX):
+                    yield f.name[: -len(_SUFFIX)]
+
+
+def relayout() -> Dict[str, int]:
+    """Move flat-layout records into their shards, then rebuild log and index.
+
+    Idempotent and safe to re-run after an interruption.
+    """
+    moved = 0
+    with os.scandir(PROOFD) as it:
+        for e in it:
+            if not (e.is_file() and e.name.endswith(_SUFFIX)):
+                continue
+            jid = e.name[: -len(_SUFFIX)]
+            dst = _path(jid)
+            if dst.exists():
+                # already saved in the sharded layout, which is newer
+                os.unlink(e.path)
+            else:
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(e.path, dst)
+            moved += 1
+    logged = _rebase(lambda base, segs: _walk_shards()) or 0
+    return {"moved": moved, "logged": logged, "indexed": rebuild_index()}
+
+
+def _batch_path(batch_id: str) -> Path:
+    return BATCHD / f"{batch_id}.batch.json"
+
+
+def load_batch(batch_id: str) -> Optional[Dict]:
+    p = _batch_path(batch_id)
+    if not p.exists():
+        return None
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+
+def save_batch(batch: Dict) -> None:
+    _atomic_write(_batch_path(batch["batch_id"]), json.dumps(batch, separators=(",", ":")))
+
+
+def list_batch_ids(status: Optional[str] = None) -> List[str]:
+    ids = sorted(f.name[: -len(".batch.json")] for f in BATCHD.glob("*.batch.json"))
+    if status is None:
+        return ids
+    return [b for b in ids if (load_batch(b) or {}).get("status") == status]
+
+
+if __name__ == "__main__":  # basic self-test; see Maintenance above for commands
+    if sys.argv[1:] == ["reindex"]:
+        print(f"indexed {rebuild_index()} proofs")
+        sys.exit(0)
+    if sys.argv[1:] == ["compact"]:
+        print(f"compacted log: {compact()} ids")
+        sys.exit(0)
+    if sys.argv[1:] == ["relayout"]:
+        print("relayout:", relayout())
+        sys.exit(0)
     jid = "JOB-SELFTEST"
     init(jid, "abcd" * 16)
     rec = load(jid)
     assert rec and rec["manifest_sha256"].startswith("abcd")
+    assert find_by_sha("ABCD" * 16) == jid
+    init(jid, "ef01" * 16)
+    assert find_by_sha("abcd" * 16) is None and find_by_sha("ef01" * 16) == jid
     rec["tsa_ok"] = True
     rec["status"] = "TSA_OK"
     save(jid, rec)
     assert load(jid).get("tsa_ok") is True
-    print("ids:", list_ids())
+    assert _path(jid).exists() and jid in list_ids()
+    print("ids:", list_ids_page(limit=10)[0])
     delete(jid)
+    assert jid not in list_ids()
+    assert find_by_sha("ef01" * 16) is None
@@ -0,0 +1,134 @@
+"""
+Job queue wake-ups for QuickDCP (LISTEN jobs_queued)
+
+Responsibilities
+----------------
+- Hold ONE dedicated LISTEN connection per API process (not a pooled one:
+  a listening session must stay open and idle between notifications).
+- Bump a generation counter on every `jobs_queued` notification.
+- Let long-polling requests await the next generation without holding a
+  threadpool thread or a pooled DB connection while they wait.
+
+The trigger lives in migration 0022. Notifications are only a hint: callers
+always re-run the claim query after waking, and should cap each wait so a
+missed notification (listener reconnecting, backoff expiring) only costs one
+recheck interval.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from typing import Optional, Set, Tuple
+
+import psycopg
+
+CHANNEL = "jobs_queued"
+DB_URL = os.getenv("DATABASE_URL")
+
+
+class JobQueueListener:
+    def __init__(self, dsn: Optional[str] = None, channel: str = CHANNEL) -> None:
+        self.dsn = dsn or DB_URL or ""
+        self.channel = channel
+        self.generation = 0
+        self.connected = False
+        self._lock = threading.Lock()
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # -----------------------------------------------------------------
+    # Lifecycle
+    # -----------------------------------------------------------------
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="qd-jobs-listener", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(self.dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {self.channel}")
+                    self.connected = True
+                    backoff = 1.0
+                    # Wake everyone once after (re)connecting: anything queued
+                    # while we were away has not been announced.
+                    self._bump()
+                    while not self._stop.is_set():
+                        for _ in conn.notifies(timeout=5.0):
+                            self._bump()
+            except Exception as e:
+                print(f"[queue] WARN: listener error: {e}")
+            self.connected = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    # -----------------------------------------------------------------
+    # Notification fan-out
+    # -----------------------------------------------------------------
+    def _bump(self) -> None:
+        with self._lock:
+            self.generation += 1
+            waiters, self._waiters = self._waiters, set()
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, fut)
+            except RuntimeError:
+                # event loop already closed (shutdown)
+                pass
+
+    async def wait(self, since: int, timeout: float) -> bool:
+        """Wait until generation moves past `since` or timeout elapses.
+
+        Returns True if woken by a notification.
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        entry = (loop, fut)
+        with self._lock:
+            if self.generation != since:
+                return True
+            self._waiters.add(entry)
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(entry)
+
+
+def _resolve(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+_listener: Optional[JobQueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def get_listener() -> JobQueueListener:
+    """Return the process-wide listener, starting it on first use."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = JobQueueListener()
+    _listener.start()
+    return _listener
+
+
+def stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,502 @@
+"""
+In-process RFC-3161 for QuickDCP (no openssl subprocess)
+
+Provides
+--------
+- build_tsq(sha_hex): TimeStampReq DER, byte-identical to
+  `openssl ts -query -sha256 -digest <hex> -cert -no_nonce`
+- verify_tsr(tsr_der, sha_hex, ca_pem=None): checks a TimeStampResp (or a
+  bare timeStampToken) the way `openssl ts -verify -queryfile` does:
+    * PKIStatus granted / grantedWithMods
+    * eContentType id-ct-TSTInfo, TSTInfo imprint == request imprint
+    * signedAttrs: contentType, messageDigest == H(TSTInfo)
+    * ESS signingCertificate(v2) hash matches the signer certificate
+    * CMS signature over signedAttrs with the signer's public key
+    * signer EKU timeStamping (critical, sole) and chain to a trusted CA
+- parse_tst_info(tsr_der): serial / genTime / policy / nonce / imprint
+
+Only the handful of ASN.1 structures above are decoded, with a minimal DER
+reader; everything cryptographic is done by the `cryptography` package.
+Unsupported algorithms (e.g. RSASSA-PSS) raise TSRUnsupported so callers can
+fall back to openssl.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import ssl
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509.oid import ExtendedKeyUsageOID, ExtensionOID
+
+
+class TSRVerifyError(ValueError):
+    pass
+
+
+class TSRUnsupported(TSRVerifyError):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# OIDs
+# ---------------------------------------------------------------------------
+OID_SIGNED_DATA = "1.2.840.113549.1.7.2"
+OID_TST_INFO = "1.2.840.113549.1.9.16.1.4"
+OID_ATTR_CONTENT_TYPE = "1.2.840.113549.1.9.3"
+OID_ATTR_MESSAGE_DIGEST = "1.2.840.113549.1.9.4"
+OID_ATTR_SIGNING_CERT = "1.2.840.113549.1.9.16.2.12"
+OID_ATTR_SIGNING_CERT_V2 = "1.2.840.113549.1.9.16.2.47"
+
+DIGESTS = {
+    "1.3.14.3.2.26": hashes.SHA1,
+    "2.16.840.1.101.3.4.2.4": hashes.SHA224,
+    "2.16.840.1.101.3.4.2.1": hashes.SHA256,
+    "2.16.840.1.101.3.4.2.2": hashes.SHA384,
+    "2.16.840.1.101.3.4.2.3": hashes.SHA512,
+}
+RSA_PKCS1 = {
+    "1.2.840.113549.1.1.1": None,  # rsaEncryption: hash from digestAlgorithm
+    "1.2.840.113549.1.1.5": hashes.SHA1,
+    "1.2.840.113549.1.1.14": hashes.SHA224,
+    "1.2.840.113549.1.1.11": hashes.SHA256,
+    "1.2.840.113549.1.1.12": hashes.SHA384,
+    "1.2.840.113549.1.1.13": hashes.SHA512,
+}
+ECDSA = {
+    "1.2.840.10045.2.1": None,  # id-ecPublicKey: hash from digestAlgorithm
+    "1.2.840.10045.4.1": hashes.SHA1,
+    "1.2.840.10045.4.3.1": hashes.SHA224,
+    "1.2.840.10045.4.3.2": hashes.SHA256,
+    "1.2.840.10045.4.3.3": hashes.SHA384,
+    "1.2.840.10045.4.3.4": hashes.SHA512,
+}
+
+# ---------------------------------------------------------------------------
+# TSQ
+# ---------------------------------------------------------------------------
+# TimeStampReq { version 1, messageImprint { sha256 + NULL, OCTET STRING(32) }, certReq TRUE }
+_TSQ_PREFIX = bytes.fromhex("30390201013031300d060960864801650304020105000420")
+_TSQ_SUFFIX = bytes.fromhex("0101ff")
+
+
+def build_tsq(sha_hex: str) -> bytes:
+    """TimeStampReq DER for a hex SHA-256 (-sha256 -cert -no_nonce, no policy)."""
+    digest = _digest_bytes(sha_hex)
+    return _TSQ_PREFIX + digest + _TSQ_SUFFIX
+
+
+def _digest_bytes(sha_hex: str) -> bytes:
+    try:
+        digest = bytes.fromhex(sha_hex)
+    except (TypeError, ValueError) as e:
+        raise ValueError("sha256 must be hex") from e
+    if len(digest) != 32:
+        raise ValueError("sha256 must be 32 bytes (64 hex chars)")
+    return digest
+
+
+# ---------------------------------------------------------------------------
+# Minimal DER reader
+# ---------------------------------------------------------------------------
+class _TLV(NamedTuple):
+    buf: bytes
+    tag: int
+    start: int  # header start
+    body: int   # content start
+    end: int
+
+    @property
+    def raw(self) -> bytes:
+        return self.buf[self.start:self.end]
+
+    @property
+    def content(self) -> bytes:
+        return self.buf[self.body:self.end]
+
+    def children(self) -> List["_TLV"]:
+        out: List[_TLV] = []
+        off = self.body
+        while off < self.end:
+            t = _read(self.buf, off, self.end)
+            out.append(t)
+            off = t.end
+        return out
+
+
+def _read(buf: bytes, off: int = 0, limit: Optional[int] = None) -> _TLV:
+    limit = len(buf) if limit is None else limit
+    try:
+        start = off
+        tag = buf[off]
+        if tag & 0x1F == 0x1F:
+            raise TSRVerifyError("high-tag-number form not supported")
+        ln = buf[off + 1]
+        off += 2
+        if ln & 0x80:
+            n = ln & 0x7F
+            if n == 0 or n > 4:
+                raise TSRVerifyError("bad DER length")
+            ln = int.from_bytes(buf[off:off + n], "big")
+            off += n
+    except IndexError:
+        raise TSRVerifyError("truncated DER") from None
+    end = off + ln
+    if end > limit:
+        raise TSRVerifyError("truncated DER")
+    return _TLV(buf, tag, start, off, end)
+
+
+def _oid(t: _TLV) -> str:
+    if t.tag != 0x06:
+        raise TSRVerifyError("expected OBJECT IDENTIFIER")
+    data = t.content
+    if not data:
+        raise TSRVerifyError("empty OBJECT IDENTIFIER")
+    parts: List[int] = []
+    val = 0
+    for b in data:
+        val = (val << 7) | (b & 0x7F)
+        if not b & 0x80:
+            parts.append(val)
+            val = 0
+    first = parts[0]
+    head = [0, first] if first < 40 else [1, first - 40] if first < 80 else [2, first - 80]
+    return ".".join(str(p) for p in head + parts[1:])
+
+
+def _int(t: _TLV) -> int:
+    if t.tag != 0x02:
+        raise TSRVerifyError("expected INTEGER")
+    return int.from_bytes(t.content, "big", signed=True)
+
+
+def _gentime(t: _TLV) -> datetime:
+    if t.tag != 0x18:
+        raise TSRVerifyError("expected GeneralizedTime")
+    s = t.content.decode("ascii").rstrip("Z")
+    frac = ""
+    if "." in s:
+        s, frac = s.split(".", 1)
+    dt = datetime.strptime(s, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+    if frac:
+        dt = dt.replace(microsecond=int((frac + "000000")[:6]))
+    return dt
+
+
+def _alg_oid(t: _TLV) -> str:
+    return _oid(t.children()[0])
+
+
+# ---------------------------------------------------------------------------
+# TSR structure
+# ---------------------------------------------------------------------------
+class _Token(NamedTuple):
+    tst_der: bytes
+    signed_data: _TLV
+    certs: List[x509.Certificate]
+    signer_info: _TLV
+
+
+def is_token(der: bytes) -> bool:
+    """True if der is a bare timeStampToken (ContentInfo), not a TimeStampResp."""
+    try:
+        kids = _read(der).children()
+        return bool(kids) and kids[0].tag == 0x06 and _oid(kids[0]) == OID_SIGNED_DATA
+    except TSRVerifyError:
+        return False
+
+
+def _token_from_der(der: bytes) -> _TLV:
+    top = _read(der)
+    if top.tag != 0x30:
+        raise TSRVerifyError("TSR is not a SEQUENCE")
+    kids = top.children()
+    if kids and kids[0].tag == 0x06:
+        return top  # bare token
+    # TimeStampResp { status PKIStatusInfo, timeStampToken OPTIONAL }
+    status = _int(kids[0].children()[0])
+    if status not in (0, 1):
+        raise TSRVerifyError(f"TSA status {status} (not granted)")
+    if len(kids) < 2:
+        raise TSRVerifyError("TSR has no timeStampToken")
+    return kids[1]
+
+
+def _parse_token(der: bytes) -> _Token:
+    try:
+        return _parse_token_unchecked(der)
+    except TSRVerifyError:
+        raise
+    except (IndexError, ValueError) as e:
+        raise TSRVerifyError(f"malformed TSR: {e}") from e
+
+
+def _parse_token_unchecked(der: bytes) -> _Token:
+    ci = _token_from_der(der).children()
+    if _oid(ci[0]) != OID_SIGNED_DATA:
+        raise TSRVerifyError("token is not CMS SignedData")
+    sd = ci[1].children()[0]  # [0] EXPLICIT SignedData
+    fields = sd.children()
+    encap = fields[2].children()
+    if _oid(encap[0]) != OID_TST_INFO:
+        raise TSRVerifyError("eContentType is not id-ct-TSTInfo")
+    tst_der = encap[1].children()[0].content  # [0] EXPLICIT OCTET STRING
+    certs: List[x509.Certificate] = []
+    signer_infos: Optional[_TLV] = None
+    for f in fields[3:]:
+        if f.tag == 0xA0:  # certificates [0] IMPLICIT
+            for c in f.children():
+                if c.tag == 0x30:
+                    certs.append(x509.load_der_x509_certificate(c.raw))
+        elif f.tag == 0x31:
+            signer_infos = f
+    if signer_infos is None or not signer_infos.children():
+        raise TSRVerifyError("no SignerInfo")
+    sis = signer_infos.children()
+    if len(sis) != 1:
+        raise TSRVerifyError("expected exactly one SignerInfo")
+    return _Token(tst_der, sd, certs, sis[0])
+
+
+def _parse_tst(tst_der: bytes) -> Dict[str, Any]:
+    try:
+        return _parse_tst_unchecked(tst_der)
+    except TSRVerifyError:
+        raise
+    except (IndexError, ValueError) as e:
+        raise TSRVerifyError(f"malformed TSTInfo: {e}") from e
+
+
+def _parse_tst_unchecked(tst_der: bytes) -> Dict[str, Any]:
+    f = _read(tst_der).children()
+    imprint = f[2].children()
+    info: Dict[str, Any] = {
+        "version": _int(f[0]),
+        "policy": _oid(f[1]),
+        "hash_alg": _alg_oid(imprint[0]),
+        "digest": imprint[1].content.hex(),
+        "serial": _int(f[3]),
+        "gen_time": _gentime(f[4]),
+        "nonce": None,
+    }
+    for x in f[5:]:
+        if x.tag == 0x02:
+            info["nonce"] = _int(x)
+    return info
+
+
+def parse_tst_info(tsr_der: bytes) -> Dict[str, Any]:
+    """TSTInfo fields from a TSR or token (no verification)."""
+    return _parse_tst(_parse_token(tsr_der).tst_der)
+
+
+# ---------------------------------------------------------------------------
+# Verification
+# ---------------------------------------------------------------------------
+def _issuer_serial(cert: x509.Certificate) -> Tuple[bytes, int]:
+    tbs = _read(cert.tbs_certificate_bytes).children()
+    i = 1 if tbs[0].tag == 0xA0 else 0
+    return tbs[i + 2].raw, _int(tbs[i])
+
+
+def _find_signer(sid: _TLV, certs: List[x509.Certificate]) -> x509.Certificate:
+    if sid.tag == 0x30:  # IssuerAndSerialNumber
+        issuer, serial = sid.children()
+        want = (issuer.raw, _int(serial))
+        for c in certs:
+            if _issuer_serial(c) == want:
+                return c
+    elif sid.tag == 0x80:  # [0] SubjectKeyIdentifier
+        for c in certs:
+            try:
+                ski = c.extensions.get_extension_for_oid(ExtensionOID.SUBJECT_KEY_IDENTIFIER).value.digest
+            except x509.ExtensionNotFound:
+                continue
+            if ski == sid.content:
+                return c
+    raise TSRVerifyError("signer certificate not found")
+
+
+def _hash(alg_oid: str, data: bytes) -> bytes:
+    algo = DIGESTS.get(alg_oid)
+    if algo is None:
+        raise TSRUnsupported(f"unsupported digest algorithm {alg_oid}")
+    h = hashes.Hash(algo())
+    h.update(data)
+    return h.finalize()
+
+
+def _check_signed_attrs(attrs: _TLV, tst_der: bytes, digest_oid: str, signer: x509.Certificate) -> None:
+    found: Dict[str, _TLV] = {}
+    for a in attrs.children():
+        oid_t, values = a.children()
+        found[_oid(oid_t)] = values.children()[0]
+    ct = found.get(OID_ATTR_CONTENT_TYPE)
+    if ct is None or _oid(ct) != OID_TST_INFO:
+        raise TSRVerifyError("signed contentType attribute missing or wrong")
+    md = found.get(OID_ATTR_MESSAGE_DIGEST)
+    if md is None or md.content != _hash(digest_oid, tst_der):
+        raise TSRVerifyError("messageDigest does not match TSTInfo")
+
+    # ESS signing certificate: first ESSCertID must be the signer's cert
+    cert_der = signer.public_bytes(Encoding.DER)
+    if OID_ATTR_SIGNING_CERT_V2 in found:
+        first = found[OID_ATTR_SIGNING_CERT_V2].children()[0].children()[0].children()
+        if first[0].tag == 0x30:
+            alg, got = _alg_oid(first[0]), first[1].content
+        else:
+            alg, got = "2.16.840.1.101.3.4.2.1", first[0].content
+        if _hash(alg, cert_der) != got:
+            raise TSRVerifyError("ESS signingCertificateV2 does not match signer")
+    elif OID_ATTR_SIGNING_CERT in found:
+        first = found[OID_ATTR_SIGNING_CERT].children()[0].children()[0].children()
+        if hashlib.sha1(cert_der).digest() != first[0].content:
+            raise TSRVerifyError("ESS signingCertificate does not match signer")
+    else:
+        raise TSRVerifyError("ESS signing certificate attribute missing")
+
+
+def _verify_signature(signer: x509.Certificate, sig_oid: str, digest_oid: str, sig: bytes, data: bytes) -> None:
+    key = signer.public_key()
+    try:
+        if isinstance(key, rsa.RSAPublicKey) and sig_oid in RSA_PKCS1:
+            algo = RSA_PKCS1[sig_oid] or DIGESTS.get(digest_oid)
+            if algo is None:
+                raise TSRUnsupported(f"unsupported digest algorithm {digest_oid}")
+            key.verify(sig, data, padding.PKCS1v15(), algo())
+        elif isinstance(key, ec.EllipticCurvePublicKey) and sig_oid in ECDSA:
+            algo = ECDSA[sig_oid] or DIGESTS.get(digest_oid)
+            if algo is None:
+                raise TSRUnsupported(f"unsupported digest algorithm {digest_oid}")
+            key.verify(sig, data, ec.ECDSA(algo()))
+        else:
+            raise TSRUnsupported(f"unsupported signature algorithm {sig_oid}")
+    except InvalidSignature:
+        raise TSRVerifyError("CMS signature invalid") from None
+
+
+def _check_tsa_eku(signer: x509.Certificate) -> None:
+    try:
+        ext = signer.extensions.get_extension_for_oid(ExtensionOID.EXTENDED_KEY_USAGE)
+    except x509.ExtensionNotFound:
+        raise TSRVerifyError("signer certificate lacks extendedKeyUsage timeStamping") from None
+    if not ext.critical or list(ext.value) != [ExtendedKeyUsageOID.TIME_STAMPING]:
+        raise TSRVerifyError("signer extendedKeyUsage must be critical and only timeStamping")
+
+
+def _valid_at(cert: x509.Certificate, at: datetime) -> bool:
+    return cert.not_valid_before_utc <= at <= cert.not_valid_after_utc
+
+
+_default_anchors: Optional[List[x509.Certificate]] = None
+
+
+def _system_anchors() -> List[x509.Certificate]:
+    """Trust anchors from the system bundle (what openssl uses without -CAfile)."""
+    global _default_anchors
+    if _default_anchors is None:
+        anchors: List[x509.Certificate] = []
+        paths = ssl.get_default_verify_paths()
+        cafile = os.getenv("TSA_CA_FILE") or paths.cafile or paths.openssl_cafile
+        if cafile and os.path.isfile(cafile):
+            with open(cafile, "rb") as f:
+                anchors = x509.load_pem_x509_certificates(f.read())
+        _default_anchors = anchors
+    return _default_anchors
+
+
+def _check_chain(signer: x509.Certificate, pool: List[x509.Certificate],
+                 anchors: List[x509.Certificate], at: datetime) -> None:
+    trusted = {c.fingerprint(hashes.SHA256()) for c in anchors}
+    candidates = pool + anchors
+    cur = signer
+    for _ in range(10):
+        if not _valid_at(cur, at):
+            raise TSRVerifyError(f"certificate not valid at {at.isoformat()}: {cur.subject.rfc4514_string()}")
+        if cur.fingerprint(hashes.SHA256()) in trusted:
+            return
+        issuer = None
+        for cand in candidates:
+            if cand.subject != cur.issuer or cand is cur:
+                continue
+            try:
+                cur.verify_directly_issued_by(cand)
+            except (ValueError, TypeError, InvalidSignature):
+                continue
+            issuer = cand
+            break
+        if issuer is None:
+            raise TSRVerifyError("unable to get local issuer certificate")
+        try:
+            bc = issuer.extensions.get_extension_for_oid(ExtensionOID.BASIC_CONSTRAINTS).value
+            is_ca = bc.ca
+        except x509.ExtensionNotFound:
+            is_ca = issuer.issuer == issuer.subject  # v1 self-signed root
+        if not is_ca:
+            raise TSRVerifyError("issuer is not a CA")
+        if issuer.fingerprint(hashes.SHA256()) == cur.fingerprint(hashes.SHA256()):
+            break  # untrusted self-signed
+        cur = issuer
+    raise TSRVerifyError("certificate chain does not reach a trusted CA")
+
+
+def verify_tsr(
+    tsr_der: bytes,
+    sha_hex: str,
+    ca_pem: Optional[str] = None,
+    at: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Verify a TSR/token against the request build_tsq(sha_hex) would send.
+
+    Returns the parsed TSTInfo; raises TSRVerifyError on any failure. The chain
+    is checked at `at` (default: now, like openssl); anchors are ca_pem or the
+    system bundle.
+    """
+    digest = _digest_bytes(sha_hex)
+    tok = _parse_token(tsr_der)
+    tst = _parse_tst(tok.tst_der)
+    if tst["version"] != 1:
+        raise TSRVerifyError("unsupported TSTInfo version")
+    if tst["hash_alg"] != "2.16.840.1.101.3.4.2.1" or tst["digest"] != digest.hex():
+        raise TSRVerifyError("message imprint mismatch")
+
+    try:
+        si = tok.signer_info.children()
+        sid, digest_alg = si[1], si[2]
+        i = 3
+        attrs = None
+        if si[i].tag == 0xA0:
+            attrs = si[i]
+            i += 1
+        sig_alg, sig = si[i], si[i + 1]
+    except IndexError:
+        raise TSRVerifyError("malformed SignerInfo") from None
+    if attrs is None:
+        raise TSRVerifyError("SignerInfo has no signedAttrs")
+    digest_oid = _alg_oid(digest_alg)
+
+    signer = _find_signer(sid, tok.certs)
+    try:
+        _check_signed_attrs(attrs, tok.tst_der, digest_oid, signer)
+    except IndexError:
+        raise TSRVerifyError("malformed signedAttrs") from None
+    # signature covers signedAttrs re-tagged as SET OF (0x31), not [0]
+    _verify_signature(signer, _alg_oid(sig_alg), digest_oid, sig.content, b"\x31" + attrs.raw[1:])
+
+    _check_tsa_eku(signer)
+    if ca_pem:
+        try:
+            anchors = x509.load_pem_x509_certificates(ca_pem.encode())
+        except ValueError as e:
+            raise TSRVerifyError(f"invalid CA certificate: {e}") from None
+    else:
+        anchors = _system_anchors()
+    _check_chain(signer, tok.certs, anchors, at or datetime.now(timezone.utc))
+    return tst
@@ -1,25 +1,43 @@
 """
 TSA utilities for QuickDCP (fixed)
 
-Provides small helpers around OpenSSL RFC-3161 tooling:
+Provides small helpers around RFC-3161 time-stamping:
 - build_tsq(sha_hex): generate a deterministic TSQ (DER) from a hex SHA-256
 - verify_tsr(tsr_der, sha_hex, ca_pem=None): verify TSR matches TSQ for given digest
 - extract_tsr_info(tsr_der): best-effort parse of human-readable fields
 - ensure_openssl(): sanity check that openssl exists in PATH
 
+TSA_MODE selects the implementation:
+- inprocess (default): api.utils.rfc3161, no subprocess or temp files;
+  algorithms it does not implement fall back to openssl
+- openssl: fork `openssl ts` as before
+- crosscheck: run both, fail closed and log if they disagree
+
+tests/test_tsa.py checks the in-process implementation against openssl
+byte for byte (skipped when openssl is not installed).
+
 These helpers are used by the proof router; they allow unit testing and
 centralize OpenSSL error handling.
 """
 from __future__ import annotations
 
+import os
 import subprocess
 import tempfile
 from typing import Optional, Dict
 
+from api.utils import rfc3161
+
+TSA_MODE = os.getenv("TSA_MODE", "inprocess").lower()
+
+
 class OpenSSLNotFound(RuntimeError):
     pass
 
-class OpenSSLVerifyError(RuntimeError):
+class TSAVerifyError(RuntimeError):
+    pass
+
+class OpenSSLVerifyError(TSAVerifyError):
     pass
 
 
@@ -39,34 +57,36 @@ def ensure_openssl() -> None:
     _checked = True
 
 
-def build_tsq(sha_hex: str) -> bytes:
-    """Return TSQ (DER) for a manifest hex SHA-256.
-
-    This uses -no_nonce and includes cert chain request for better portability.
-    """
+# ---------------------------------------------------------------------------
+# openssl implementation (TSA_MODE=openssl, crosscheck and fallback)
+# ---------------------------------------------------------------------------
+def openssl_build_tsq(sha_hex: str) -> bytes:
+    """TSQ (DER) from `openssl ts -query` (DER is its default output)."""
     ensure_openssl()
     try:
         return subprocess.check_output([
             "openssl", "ts", "-query",
             "-sha256", "-digest", sha_hex,
-            "-cert", "-no_nonce", "-outform", "DER",
-        ])
+            "-cert", "-no_nonce",
+        ], stderr=subprocess.PIPE)
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"openssl ts -query failed: {e}") from e
 
 
-def verify_tsr(tsr_der: bytes, sha_hex: str, ca_pem: Optional[str] = None) -> None:
-    """Verify a TSR against a TSQ rebuilt from sha_hex. Raises on failure."""
+def openssl_verify_tsr(tsr_der: bytes, sha_hex: str, ca_pem: Optional[str] = None) -> None:
+    """Verify a TSR (or bare token) with `openssl ts -verify`. Raises on failure."""
     ensure_openssl()
     with tempfile.TemporaryDirectory() as d:
         tsr_p = f"{d}/resp.tsr"
         tsq_p = f"{d}/req.tsq"
         with open(tsr_p, "wb") as f:
             f.write(tsr_der)
-        tsq = build_tsq(sha_hex)
+        tsq = openssl_build_tsq(sha_hex)
         with open(tsq_p, "wb") as f:
             f.write(tsq)
         cmd = ["openssl", "ts", "-verify", "-in", tsr_p, "-queryfile", tsq_p]
+        if rfc3161.is_token(tsr_der):
+            cmd.append("-token_in")
         if ca_pem:
             ca_p = f"{d}/tsa.pem"
             with open(ca_p, "w", encoding="utf-8") as f:
@@ -80,12 +100,80 @@ def verify_tsr(tsr_der: bytes, sha_hex: str, ca_pem: Optional[str] = None) -> No
             raise OpenSSLVerifyError(out.stderr.strip() or out.stdout.strip() or "verify failed")
 
 
+# ---------------------------------------------------------------------------
+# Public API (mode dispatch)
+# ---------------------------------------------------------------------------
+def build_tsq(sha_hex: str) -> bytes:
+    """Return TSQ (DER) for a manifest hex SHA-256.
+
+    This uses -no_nonce and includes cert chain request for better portability.
+    """
+    if TSA_MODE == "openssl":
+        return openssl_build_tsq(sha_hex)
+    tsq = rfc3161.build_tsq(sha_hex)
+    if TSA_MODE == "crosscheck":
+        ref = openssl_build_tsq(sha_hex)
+        if ref != tsq:
+            print(f"[tsa] crosscheck: TSQ differs from openssl for {sha_hex}")
+            raise RuntimeError("TSQ crosscheck mismatch")
+    return tsq
+
+
+def _inprocess_verify(tsr_der: bytes, sha_hex: str, ca_pem: Optional[str]) -> None:
+    try:
+        rfc3161.verify_tsr(tsr_der, sha_hex, ca_pem)
+    except rfc3161.TSRUnsupported as e:
+        print(f"[tsa] {e}; falling back to openssl")
+        openssl_verify_tsr(tsr_der, sha_hex, ca_pem)
+    except rfc3161.TSRVerifyError as e:
+        raise TSAVerifyError(str(e)) from e
+
+
+def verify_tsr(tsr_der: bytes, sha_hex: str, ca_pem: Optional[str] = None) -> None:
+    """Verify a TSR against a TSQ rebuilt from sha_hex. Raises on failure."""
+    if TSA_MODE == "openssl":
+        openssl_verify_tsr(tsr_der, sha_hex, ca_pem)
+        return
+    if TSA_MODE != "crosscheck":
+        _inprocess_verify(tsr_der, sha_hex, ca_pem)
+        return
+
+    errors: Dict[str, Optional[Exception]] = {}
+    for name, fn in (("inprocess", _inprocess_verify), ("openssl", openssl_verify_tsr)):
+        try:
+            fn(tsr_der, sha_hex, ca_pem)
+            errors[name] = None
+        except TSAVerifyError as e:
+            errors[name] = e
+    if (errors["inprocess"] is None) != (errors["openssl"] is None):
+        print(f"[tsa] crosscheck disagreement for {sha_hex}: "
+              f"inprocess={errors['inprocess'] or 'ok'} openssl={errors['openssl'] or 'ok'}")
+    err = errors["inprocess"] or errors["openssl"]
+    if err is not None:
+        raise err
+
+
 def extract_tsr_info(tsr_der: bytes) -> Dict[str, str]:
     """Return a best-effort info dict from a TSR (serial, policy, time, etc.).
 
-    This parses the human-readable text output of openssl ts -reply -text.
+    In-process this reads TSTInfo directly; in openssl mode it parses the
+    human-readable text output of openssl ts -reply -text.
     If parsing fails, returns an empty dict.
     """
+    if TSA_MODE != "openssl":
+        try:
+            tst = rfc3161.parse_tst_info(tsr_der)
+        except rfc3161.TSRVerifyError:
+            return {}
+        info = {
+            "serial": hex(tst["serial"]),
+            "time": tst["gen_time"].strftime("%b %d %H:%M:%S %Y GMT"),
+            "policy": tst["policy"],
+        }
+        if tst["nonce"] is not None:
+            info["nonce"] = hex(tst["nonce"])
+        return info
+
     ensure_openssl()
     info: Dict[str, str] = {}
     with tempfile.NamedTemporaryFile(suffix=".tsr") as f:
@@ -108,11 +196,3 @@ def extract_tsr_info(tsr_der: bytes) -> Dict[str, str]:
         elif s.startswith("Nonce:"):
             info["nonce"] = s.split(":", 1)[-1].strip()
     return info
-
-
-if __name__ == "__main__":  # minimal self-test for presence
-    try:
-        ensure_openssl()
-        print("openssl ok")
-    except Exception as e:
-        print("openssl missing:", e)
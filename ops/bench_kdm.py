@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark the crypto KDM engine: KDMs per second against the number of screens.
+
+Generates a throwaway signer and one certificate per screen (a handful of
+RSA-2048 keys, reused across certificates, so setup stays fast), then
+times CryptoEngine.build() (parse + RSA-OAEP wrap + XML + RSA-SHA256 sign)
+for every screens x workers combination. No vault upload and no database
+are involved.
+
+Certificates are parsed once per worker process, so the first run of each
+worker count is done twice and the warm run is reported.
+
+Usage
+-----
+    python -m ops.bench_kdm [--screens 10,100,1000,5000] [--workers 1,4] [--keys 1]
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509.oid import NameOID
+
+from api.utils.kdm_certs import fingerprint
+from api.utils.kdm_crypto import ContentKey, CryptoEngine, KDMContext, Recipient
+
+
+def _cert(cn: str, key, issuer_key, issuer=None) -> x509.Certificate:
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+    now = datetime.now(timezone.utc)
+    return (
+        x509.CertificateBuilder().subject_name(name).issuer_name(issuer or name)
+        .public_key(key.public_key()).serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + timedelta(days=30))
+        .sign(issuer_key, hashes.SHA256())
+    )
+
+
+def run(screens, workers, n_keys=1):
+    t0 = time.monotonic()
+    skey = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    scert = _cert("bench-signer", skey, skey)
+    pool = [rsa.generate_private_key(public_exponent=65537, key_size=2048) for _ in range(8)]
+    top = max(screens)
+    pems = [
+        _cert(f"SCR-{i}", pool[i % len(pool)], skey, scert.subject).public_bytes(Encoding.PEM).decode()
+        for i in range(top)
+    ]
+    print(f"setup: {top} certificates in {time.monotonic() - t0:.1f}s ({os.cpu_count()} CPUs)")
+
+    now = datetime.now(timezone.utc)
+    keys = tuple(ContentKey(str(uuid.uuid4()), "MDIK", os.urandom(16)) for _ in range(n_keys))
+    ctx = KDMContext("BENCH", str(uuid.uuid4()), "Bench", keys, now, now + timedelta(days=7), now)
+
+    with tempfile.TemporaryDirectory() as d:
+        kp, cp = os.path.join(d, "signer.key"), os.path.join(d, "signer.pem")
+        with open(kp, "wb") as f:
+            f.write(skey.private_bytes(Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+        with open(cp, "wb") as f:
+            f.write(scert.public_bytes(Encoding.PEM))
+
+        print(f"{'workers':>7} {'screens':>8} {'keys':>5} {'seconds':>8} {'KDM/s':>8}")
+        for w in workers:
+            eng = CryptoEngine(kp, cp, workers=w, bucket="")
+            try:
+                for i, n in enumerate(screens):
+                    recips = [Recipient(str(uuid.uuid4()), f"SCR-{j}", pems[j], fingerprint(pems[j])) for j in range(n)]
+                    for _ in range(2 if i == 0 else 1):  # first: pool start-up and certificate parsing
+                        t = time.monotonic()
+                        done = sum(1 for _ in eng.build(ctx, recips))
+                        dt = time.monotonic() - t
+                    print(f"{w:>7} {n:>8} {n_keys:>5} {dt:>8.2f} {done / dt:>8.0f}")
+            finally:
+                eng.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="KDM engine throughput")
+    ap.add_argument("--screens", default="10,100,1000,5000", help="comma-separated screen counts")
+    ap.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="comma-separated process counts")
+    ap.add_argument("--keys", type=int, default=1, help="content keys per KDM")
+    a = ap.parse_args()
+    run(
+        sorted({int(x) for x in a.screens.split(",")}),
+        sorted({int(x) for x in a.workers.split(",")}),
+        a.keys,
+    )
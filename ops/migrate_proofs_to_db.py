@@ -1,8 +1,47 @@
 #!/usr/bin/env python3
+"""
+Migrate file-backed proof records (jobs/proof/, flat or sharded) into the
+proofs table.
+
+Modes
+-----
+bulk (default)
+    Files are read by a thread pool in batches of --batch. Each batch is
+    one transaction: rows are streamed with COPY into a temp table and
+    merged with a single INSERT ... ON CONFLICT (job_id) DO UPDATE.
+    Progress and rate are printed per batch.
+
+    A checkpoint (--checkpoint, default <root>/.migrate_checkpoint.json)
+    makes reruns incremental: after a complete run only files modified
+    since that run started are read again, and an interrupted run resumes
+    after the last committed batch. --full ignores the checkpoint.
+
+rows
+    The original per-file path (proof_init / proof_update_*), one
+    autocommit statement at a time. Fine for a handful of records.
+
+Proofs whose job_id has no jobs row are skipped and counted.
+Requires migrations through 0025 (proofs.record / proofs.batch_id).
+
+Usage
+-----
+    python -m ops.migrate_proofs_to_db [--root jobs/proof] [--batch 5000]
+                                       [--workers 16] [--full] [--mode rows]
+"""
+import argparse
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Optional, Tuple
+
 from api.utils.db import DB
 
+Row = Tuple[str, str, str, bool, Optional[str], Optional[bool], Optional[str], str]
+
+_COLUMNS = "job_id, manifest_sha256, status, tsa_ok, fp_proof_id, fp_verified, batch_id, record"
+
 
 def run(root="jobs/proof"):
     db = DB()
@@ -12,7 +51,8 @@ def run(root="jobs/proof"):
         print("no legacy proofs found; skipping")
         return
 
-    for f in p.glob("*.proof.json"):
+    # flat (legacy) and sharded ab/cd/ layouts
+    for f in p.rglob("*.proof.json"):
         try:
             data = json.loads(f.read_text())
 
@@ -42,5 +82,170 @@ def run(root="jobs/proof"):
             print("ERR:", f, e)
 
 
+# ---------------------------------------------------------------------------
+# Bulk mode
+# ---------------------------------------------------------------------------
+def _read(path: str) -> Optional[Row]:
+    """One proof file -> COPY row, or None when it has no manifest hash."""
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError) as e:
+        print("ERR:", path, e)
+        return None
+    sha = data.get("manifest_sha256")
+    if not sha:
+        return None
+    job_id = data.get("job_id") or os.path.basename(path)[: -len(".proof.json")]
+    fp_id = data.get("fp_proof_id")
+    return (
+        job_id,
+        str(sha).lower(),
+        data.get("status") or ("TSA_OK" if data.get("tsa_ok") else "PENDING"),
+        bool(data.get("tsa_ok")),
+        fp_id,
+        bool(data.get("fp_verified")) if fp_id else None,
+        data.get("batch_id"),
+        json.dumps(data, separators=(",", ":")),
+    )
+
+
+def _merge(db: DB, rows: List[Row]) -> Tuple[int, int]:
+    """COPY one batch into a temp table and merge it; returns (merged, no_job)."""
+    with db.conn.transaction():
+        with db.conn.cursor() as cur:
+            cur.execute(
+                """
+                create temp table proof_import (
+                    job_id text, manifest_sha256 text, status text, tsa_ok boolean,
+                    fp_proof_id text, fp_verified boolean, batch_id text, record jsonb
+                ) on commit drop
+                """
+            )
+            with cur.copy(f"copy proof_import ({_COLUMNS}) from stdin") as cp:
+                for r in rows:
+                    cp.write_row(r)
+
+            # a job may appear twice (flat + sharded copy); the merge takes one
+            cur.execute(
+                """
+                insert into proofs(job_id, manifest_sha256, status, tsa_ok,
+                                   fp_proof_id, fp_verified, batch_id, record)
+                select distinct on (j.id)
+                       j.id, i.manifest_sha256, i.status, i.tsa_ok,
+                       i.fp_proof_id, i.fp_verified, i.batch_id, i.record
+                from proof_import i
+                join jobs j on j.job_id = i.job_id
+                order by j.id, i.tsa_ok desc
+                on conflict(job_id)
+                do update set
+                    manifest_sha256 = excluded.manifest_sha256,
+                    status = excluded.status,
+                    tsa_ok = excluded.tsa_ok,
+                    fp_proof_id = coalesce(excluded.fp_proof_id, proofs.fp_proof_id),
+                    fp_verified = coalesce(excluded.fp_verified, proofs.fp_verified),
+                    batch_id = excluded.batch_id,
+                    record = excluded.record,
+                    updated_at = now()
+                """
+            )
+            merged = cur.rowcount
+            cur.execute(
+                """
+                select count(distinct i.job_id)
+                from proof_import i
+                left join jobs j on j.job_id = i.job_id
+                where j.id is null
+                """
+            )
+            no_job = cur.fetchone()[0]
+    return merged, no_job
+
+
+def _load_checkpoint(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_checkpoint(path: Path, state: dict) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _candidates(root: Path, since: float, after: Optional[str]) -> List[str]:
+    """Proof files modified at/after `since`, sorted, past `after` (resume point)."""
+    out = []
+    for dirpath, _, names in os.walk(root):
+        for n in names:
+            if not n.endswith(".proof.json"):
+                continue
+            p = os.path.join(dirpath, n)
+            if since and os.stat(p).st_mtime < since:
+                continue
+            if after is not None and p <= after:
+                continue
+            out.append(p)
+    out.sort()
+    return out
+
+
+def run_bulk(root="jobs/proof", batch=5000, workers=16, checkpoint: Optional[str] = None, full=False):
+    p = Path(root)
+    if not p.exists():
+        print("no legacy proofs found; skipping")
+        return
+
+    ckpt = Path(checkpoint) if checkpoint else p / ".migrate_checkpoint.json"
+    state = {} if full else _load_checkpoint(ckpt)
+    if state.get("last_path"):
+        # interrupted run: same cutoff, continue after the last committed batch
+        since, started = state.get("since", 0.0), state["run_started"]
+        print(f"resuming after {state['last_path']}")
+    else:
+        since, started = state.get("since", 0.0), time.time()
+
+    files = _candidates(p, since, state.get("last_path"))
+    total = len(files)
+    print(f"{total} proof files to migrate" + (" (incremental)" if since else ""))
+
+    db = DB()
+    merged = skipped = no_job = 0
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for i in range(0, total, batch):
+            chunk = files[i:i + batch]
+            rows = [r for r in pool.map(_read, chunk) if r is not None]
+            skipped += len(chunk) - len(rows)
+            if rows:
+                m, nj = _merge(db, rows)
+                merged += m
+                no_job += nj
+            _save_checkpoint(ckpt, {"since": since, "run_started": started, "last_path": chunk[-1]})
+
+            done = i + len(chunk)
+            rate = done / max(time.monotonic() - t0, 1e-6)
+            print(f"  {done}/{total} files  {merged} merged  {rate:,.0f} files/s")
+
+    # complete: next run only needs files touched since this one started
+    _save_checkpoint(ckpt, {"since": started, "run_started": None, "last_path": None})
+    print(f"done: {merged} merged, {no_job} without a job row, {skipped} unreadable/no sha "
+          f"in {time.monotonic() - t0:.1f}s")
+
+
 if __name__ == "__main__":
-    run()
+    ap = argparse.ArgumentParser(description="Migrate file-backed proofs into Postgres")
+    ap.add_argument("--root", default="jobs/proof")
+    ap.add_argument("--mode", choices=["bulk", "rows"], default="bulk")
+    ap.add_argument("--batch", type=int, default=5000, help="files per COPY/merge transaction")
+    ap.add_argument("--workers", type=int, default=16, help="file reader threads")
+    ap.add_argument("--checkpoint", help="checkpoint file (default <root>/.migrate_checkpoint.json)")
+    ap.add_argument("--full", action="store_true", help="ignore the checkpoint and read every file")
+    a = ap.parse_args()
+
+    if a.mode == "rows":
+        run(a.root)
+    else:
+        run_bulk(a.root, batch=a.batch, workers=a.workers, checkpoint=a.checkpoint, full=a.full)
@@ -3,19 +3,32 @@
 QuickDCP uploader (fixed)
 
 CLI tool to stream a large file to the QuickDCP API using S3 multipart uploads.
-- Computes full-file SHA256
 - Initiates multipart: POST /upload/init
-- Presigns each part: POST /upload/part
+- Reads the file ONCE: each part feeds the full-file SHA256 and is handed to
+  one of N concurrent uploaders (per-part checksum computed there)
+- Presigns parts in windows ahead of the read cursor: POST /upload/parts
 - PUTs each part directly to S3 with x-amz-checksum-sha256
-- Completes upload: POST /upload/complete
+- Completes upload: POST /upload/complete (with the full-file SHA256)
 - Verifies with GET /upload/head
 
+Resume: every finished part is appended to a sidecar ledger next to the file
+(<path>.qdcp-upload.jsonl: upload_id, part number, ETag, checksum). With
+--resume the ledger is reconciled against GET /upload/parts/{upload_id} and
+only parts S3 is missing (or whose checksum no longer matches the local
+bytes) are sent again. The ledger is removed once /upload/complete succeeds.
+
+All HTTP goes through one pooled requests.Session. Read-ahead is bounded,
+so memory stays around (concurrency + 1) x part size.
+
 Examples
 --------
 python3 ops/qdcp_upload.py /path/to/movie.mov \
   --api http://localhost:8080 \
   --customer dev --key dev \
-  --part-size 64
+  --part-size 64 --concurrency 8
+
+# after a crash / dropped uplink, pick up where it stopped
+python3 ops/qdcp_upload.py /path/to/movie.mov --resume
 """
 from __future__ import annotations
 
@@ -26,21 +39,19 @@ import json
 import math
 import os
 import sys
+import threading
 import time
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 DEFAULT_PART_MB = int(os.getenv("QDCP_PART_MB", "64"))
+DEFAULT_CONCURRENCY = int(os.getenv("QDCP_CONCURRENCY", "4"))
+PRESIGN_WINDOW = int(os.getenv("QDCP_PRESIGN_WINDOW", "64"))  # parts per /upload/parts call
 TIMEOUT = (10, 300)  # (connect, read)
-
-
-def sha256_file(path: str, block: int = 1024 * 1024) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(block), b""):
-            h.update(chunk)
-    return h.hexdigest()
+LEDGER_SUFFIX = ".qdcp-upload.jsonl"
 
 
 def checksum_b64(data: bytes) -> str:
@@ -55,6 +66,235 @@ def human(n: int) -> str:
     return f"{n}B"
 
 
+def make_session(concurrency: int) -> requests.Session:
+    """One keep-alive pool per host (API + S3), sized for the uploaders."""
+    sess = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, concurrency * 2))
+    sess.mount("http://", adapter)
+    sess.mount("https://", adapter)
+    return sess
+
+
+class PartLedger:
+    """Append-only JSONL record of an in-flight multipart upload.
+
+    Line 1 is the header (file identity + upload_id/key); every further line
+    is one finished part. Appends are flushed per part so a killed process
+    loses at most the parts still in flight.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.fh = None
+
+    def load(self) -> Tuple[Optional[Dict[str, Any]], Dict[int, Dict[str, str]]]:
+        """Return (header, {part_no: {"etag", "checksum"}}); (None, {}) if absent/corrupt."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None, {}
+        parts: Dict[int, Dict[str, str]] = {}
+        header: Optional[Dict[str, Any]] = None
+        for i, line in enumerate(lines):
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # torn last line after a crash
+            if i == 0:
+                header = rec
+            elif "part" in rec:
+                parts[int(rec["part"])] = {"etag": rec["etag"], "checksum": rec.get("checksum", "")}
+        return header, parts
+
+    def start(self, header: Dict[str, Any], append: bool = False) -> None:
+        self.fh = open(self.path, "a" if append else "w", encoding="utf-8")
+        if not append:
+            self._write(header)
+
+    def append(self, part_no: int, etag: str, checksum: str) -> None:
+        if self.fh is not None:
+            self._write({"part": part_no, "etag": etag, "checksum": checksum})
+
+    def _write(self, rec: Dict[str, Any]) -> None:
+        with self.lock:
+            self.fh.write(json.dumps(rec, separators=(",", ":")) + "\n")
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+
+    def remove(self) -> None:
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def file_identity(path: str, part_size: int) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {"name": os.path.basename(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "part_size": part_size}
+
+
+def list_uploaded_parts(sess: requests.Session, api: str, headers: Dict[str, str],
+                        key: str, upload_id: str) -> Optional[Dict[int, Dict[str, Any]]]:
+    """Parts S3 holds for upload_id, or None if the upload no longer exists."""
+    r = sess.get(f"{api}/upload/parts/{upload_id}", headers=headers, params={"key": key}, timeout=TIMEOUT)
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return {int(p["PartNumber"]): p for p in r.json()["parts"]}
+
+
+def reconcile(ledger_parts: Dict[int, Dict[str, str]],
+              remote: Dict[int, Dict[str, Any]]) -> Dict[int, Tuple[str, str]]:
+    """Parts that may be skipped: {part_no: (etag, expected_checksum)}.
+
+    A part counts only if S3 has it; the expected checksum comes from S3
+    when it reports one, else from our ledger (ETag must then agree). Parts
+    with no checksum at all are re-sent, since the local bytes can't be
+    checked against them.
+    """
+    skip: Dict[int, Tuple[str, str]] = {}
+    for n, rp in remote.items():
+        etag = str(rp.get("ETag", "")).strip('"')
+        chk = rp.get("ChecksumSHA256") or ""
+        lp = ledger_parts.get(n)
+        if not chk and lp and lp["etag"] == etag:
+            chk = lp["checksum"]
+        if etag and chk:
+            skip[n] = (etag, chk)
+    return skip
+
+
+class PartUploader:
+    """Concurrent part PUTs fed by a single sequential read pass."""
+
+    def __init__(self, sess: requests.Session, api: str, headers: Dict[str, str],
+                 key: str, upload_id: str, size: int, parts_total: int, concurrency: int,
+                 ledger: Optional[PartLedger] = None,
+                 skip: Optional[Dict[int, Tuple[str, str]]] = None) -> None:
+        self.sess = sess
+        self.api = api
+        self.headers = headers
+        self.key = key
+        self.upload_id = upload_id
+        self.size = size
+        self.parts_total = parts_total
+        self.concurrency = max(1, concurrency)
+        self.ledger = ledger
+        # Parts already on S3 (resume): {part_no: (etag, expected_checksum)}
+        self.skip: Dict[int, Tuple[str, str]] = dict(skip or {})
+        # Read-ahead slots: one buffer per uploader plus one being read
+        self.slots = threading.BoundedSemaphore(self.concurrency + 1)
+        self.lock = threading.Lock()
+        self.etags: Dict[int, str] = {}
+        self.urls: Dict[int, str] = {}
+        self.error: Optional[BaseException] = None
+        self.sent = 0
+        self.skipped = 0
+        self.skipped_bytes = 0
+        self.t0 = time.time()
+
+    def presign(self, part_no: int) -> str:
+        """URL for part_no; fetches the next PRESIGN_WINDOW parts to send in one call."""
+        if part_no not in self.urls:
+            nums: List[int] = []
+            n = part_no
+            while n <= self.parts_total and len(nums) < PRESIGN_WINDOW:
+                if n not in self.skip:
+                    nums.append(n)
+                n += 1
+            pr = self.sess.post(
+                f"{self.api}/upload/parts",
+                headers=self.headers,
+                json={"key": self.key, "upload_id": self.upload_id, "part_numbers": nums},
+                timeout=TIMEOUT,
+            )
+            pr.raise_for_status()
+            for p in pr.json()["parts"]:
+                self.urls[int(p["part_number"])] = p["url"]
+        return self.urls.pop(part_no)
+
+    def put_part(self, part_no: int, url: str, chunk: bytes) -> None:
+        try:
+            # PUT to S3 with checksum header (base64 of binary sha256)
+            chk = checksum_b64(chunk)
+            put = None
+            for attempt in range(1, 5):
+                try:
+                    put = self.sess.put(url, data=chunk, headers={"x-amz-checksum-sha256": chk}, timeout=TIMEOUT)
+                    if put.status_code in (200, 201):
+                        break
+                except Exception:
+                    if attempt == 4:
+                        raise
+                time.sleep(0.5 * attempt)
+
+            etag = put.headers.get("ETag", "").strip('"') if put is not None else ""
+            if not etag:
+                raise RuntimeError(f"missing_etag part={part_no}")
+            if self.ledger is not None:
+                self.ledger.append(part_no, etag, chk)
+            self.done(part_no, etag, len(chunk))
+        except BaseException as e:
+            with self.lock:
+                self.error = self.error or e
+        finally:
+            self.slots.release()
+
+    def done(self, part_no: int, etag: str, n: int) -> None:
+        with self.lock:
+            self.etags[part_no] = etag
+            self.sent += n
+            count = len(self.etags)
+            sent = self.sent
+            done_bytes = sent + self.skipped_bytes
+        elapsed = time.time() - self.t0
+        rate = sent / elapsed if elapsed > 0 else 0
+        pct = (done_bytes / self.size * 100) if self.size else 100.0
+        print(f"[qdcp] part {count}/{self.parts_total} uploaded — {pct:.1f}% @ {human(int(rate))}/s", file=sys.stderr)
+
+    def run(self, path: str, part_size: int) -> str:
+        """Stream the file once; return its full SHA256 hex."""
+        h = hashlib.sha256()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool, open(path, "rb") as f:
+            part_no = 1
+            while self.error is None:
+                self.slots.acquire()
+                chunk = f.read(part_size)
+                if not chunk:
+                    self.slots.release()
+                    break
+                h.update(chunk)
+                if part_no in self.skip:
+                    etag, expected = self.skip.pop(part_no)
+                    if checksum_b64(chunk) == expected:
+                        with self.lock:
+                            self.etags[part_no] = etag
+                            self.skipped += 1
+                            self.skipped_bytes += len(chunk)
+                        self.slots.release()
+                        part_no += 1
+                        continue
+                    print(f"[qdcp] part {part_no} on S3 does not match local bytes — re-uploading", file=sys.stderr)
+                try:
+                    url = self.presign(part_no)
+                except BaseException:
+                    self.slots.release()
+                    raise
+                pool.submit(self.put_part, part_no, url, chunk)
+                part_no += 1
+        if self.error is not None:
+            raise self.error
+        return h.hexdigest()
+
+    def parts(self) -> List[Dict[str, int | str]]:
+        return [{"ETag": self.etags[n], "PartNumber": n} for n in sorted(self.etags)]
+
+
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="QuickDCP multipart uploader")
     p.add_argument("path", help="file to upload")
@@ -62,7 +302,9 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--customer", default=os.getenv("QD_CUSTOMER", "dev"))
     p.add_argument("--key", default=os.getenv("QD_KEY", "dev"))
     p.add_argument("--part-size", type=int, default=DEFAULT_PART_MB, help="part size in MB (default: env QDCP_PART_MB or 64)")
+    p.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="parallel part uploads (default: env QDCP_CONCURRENCY or 4)")
     p.add_argument("--verify", action="store_true", help="HEAD the object after completion")
+    p.add_argument("--resume", action="store_true", help=f"continue the upload recorded in <path>{LEDGER_SUFFIX}")
     return p.parse_args()
 
 
@@ -82,83 +324,76 @@ def main() -> int:
         "Authorization": f"QuickDCP {args.key}",
     }
 
-    print(f"[qdcp] hashing {path} ({human(size)}) …", file=sys.stderr)
-    file_sha = sha256_file(path)
-
-    # init
-    print("[qdcp] init multipart …", file=sys.stderr)
-    r = requests.post(
-        f"{args.api}/upload/init",
-        headers=headers,
-        data={"filename": os.path.basename(path), "size": str(size), "sha256": file_sha},
-        timeout=TIMEOUT,
-    )
-    r.raise_for_status()
-    meta = r.json()
-    upload_id = meta["upload_id"]
-    key = meta["key"]
-
-    # upload parts
-    etags: List[Dict[str, int | str]] = []
-    sent = 0
-    part_no = 1
-    t0 = time.time()
-
-    with open(path, "rb") as f:
-        while True:
-            chunk = f.read(part_size)
-            if not chunk:
-                break
-            # presign url
-            pr = requests.post(
-                f"{args.api}/upload/part",
-                headers=headers,
-                data={"key": key, "upload_id": upload_id, "part_number": str(part_no)},
-                timeout=TIMEOUT,
-            )
-            pr.raise_for_status()
-            url = pr.json()["url"]
+    sess = make_session(args.concurrency)
+    ledger = PartLedger(path + LEDGER_SUFFIX)
+    skip: Dict[int, Tuple[str, str]] = {}
+    upload_id = key = None
 
-            # PUT to S3 with checksum header (base64 of binary sha256)
-            chk = checksum_b64(chunk)
-            for attempt in range(1, 5):
-                try:
-                    put = requests.put(url, data=chunk, headers={"x-amz-checksum-sha256": chk}, timeout=TIMEOUT)
-                    if put.status_code in (200, 201):
-                        break
-                except Exception as e:
-                    if attempt == 4:
-                        raise
-                time.sleep(0.5 * attempt)
+    if args.resume:
+        header, ledger_parts = ledger.load()
+        ident = file_identity(path, 0)
+        if header and all(header.get(k) == ident[k] for k in ("name", "size", "mtime_ns")):
+            # keep the original part boundaries, whatever --part-size says now
+            part_size = int(header["part_size"])
+            parts_total = max(1, math.ceil(size / part_size))
+            remote = list_uploaded_parts(sess, args.api, headers, header["key"], header["upload_id"])
+            if remote is not None:
+                upload_id, key = header["upload_id"], header["key"]
+                skip = reconcile(ledger_parts, remote)
+                print(f"[qdcp] resuming {upload_id}: {len(skip)}/{parts_total} parts already on S3", file=sys.stderr)
+                ledger.start(header, append=True)
+            else:
+                print("[qdcp] previous upload no longer exists — starting over", file=sys.stderr)
+        elif header:
+            print("[qdcp] ledger does not match file (changed?) — starting over", file=sys.stderr)
+        else:
+            print("[qdcp] no ledger found — starting a new upload", file=sys.stderr)
 
-            etag = put.headers.get("ETag", "").strip('"')
-            if not etag:
-                print(json.dumps({"ok": False, "error": "missing_etag", "part": part_no}), file=sys.stderr)
-                return 2
-            etags.append({"ETag": etag, "PartNumber": part_no})
+    if upload_id is None:
+        # init (full-file SHA256 is sent with /complete once streamed)
+        print(f"[qdcp] init multipart {path} ({human(size)}) …", file=sys.stderr)
+        r = sess.post(
+            f"{args.api}/upload/init",
+            headers=headers,
+            data={"filename": os.path.basename(path), "size": str(size)},
+            timeout=TIMEOUT,
+        )
+        r.raise_for_status()
+        meta = r.json()
+        upload_id = meta["upload_id"]
+        key = meta["key"]
+        ledger.start({**file_identity(path, part_size), "key": key, "upload_id": upload_id})
 
-            sent += len(chunk)
-            elapsed = time.time() - t0
-            rate = sent / elapsed if elapsed > 0 else 0
-            pct = (sent / size * 100) if size else 100.0
-            print(f"[qdcp] part {part_no}/{parts_total} uploaded — {pct:.1f}% @ {human(int(rate))}/s", file=sys.stderr)
-            part_no += 1
+    # upload parts: single read pass, N concurrent PUTs
+    up = PartUploader(sess, args.api, headers, key, upload_id, size, parts_total, args.concurrency,
+                      ledger=ledger, skip=skip)
+    try:
+        file_sha = up.run(path, part_size)
+    except RuntimeError as e:
+        print(json.dumps({"ok": False, "error": str(e)}), file=sys.stderr)
+        return 2
+    etags = up.parts()
+    elapsed = time.time() - up.t0
+    print(f"[qdcp] {len(etags)} parts, {human(size)} in {elapsed:.1f}s @ {human(int(size / elapsed if elapsed > 0 else 0))}/s", file=sys.stderr)
 
     # complete
     print("[qdcp] complete multipart …", file=sys.stderr)
-    cr = requests.post(
+    cr = sess.post(
         f"{args.api}/upload/complete",
         headers={**headers, "Content-Type": "application/json"},
-        data=json.dumps({"key": key, "upload_id": upload_id, "parts": etags}),
+        data=json.dumps({"key": key, "upload_id": upload_id, "parts": etags, "sha256": file_sha}),
         timeout=TIMEOUT,
     )
     cr.raise_for_status()
+    ledger.remove()
 
     result = {"ok": True, "key": key, "sha256": file_sha, "size": size, "parts": len(etags)}
+    if up.skipped:
+        result["resumed_parts"] = up.skipped
 
     if args.verify:
         try:
-            hr = requests.get(f"{args.api}/upload/head", headers=headers, params={"key": key}, timeout=TIMEOUT)
+            hr = sess.get(f"{args.api}/upload/head", headers=headers, params={"key": key}, timeout=TIMEOUT)
             if hr.status_code == 200:
                 result["head"] = hr.json()
         except Exception as e:
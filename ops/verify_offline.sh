@@ -10,6 +10,12 @@
 #   ops/verify_offline.sh --sha <HEX> --tsr resp.tsr [--ca tsa.crt]
 #   ops/verify_offline.sh --manifest manifest.json --tsr resp.tsr [--ca tsa.crt]
 #
+# Merkle-batched proofs (TSR covers the batch root, not the manifest):
+#   ops/verify_offline.sh --sha <HEX> --path 'L:<hex>,R:<hex>,...' \
+#       [--root <HEX>] --tsr batch.tsr [--ca tsa.crt]
+# --path takes the merkle_path from /verify/{ref} (comma-separated or the
+# JSON array as-is). The script checks leaf -> root -> TSR.
+#
 # Exits 0 on success, non-zero otherwise. Prints a short report.
 
 set -euo pipefail
@@ -18,6 +24,8 @@ SHA_HEX=""
 MANIFEST=""
 TSR=""
 CAFILE=""
+MERKLE_PATH=""
+MERKLE_ROOT=""
 QUIET=0
 
 while [[ $# -gt 0 ]]; do
@@ -26,6 +34,8 @@ while [[ $# -gt 0 ]]; do
     --manifest) MANIFEST="$2"; shift 2;;
     --tsr) TSR="$2"; shift 2;;
     --ca) CAFILE="$2"; shift 2;;
+    --path) MERKLE_PATH="$2"; shift 2;;
+    --root) MERKLE_ROOT="$2"; shift 2;;
     -q|--quiet) QUIET=1; shift;;
     -h|--help)
       sed -n '1,40p' "$0"; exit 0;;
@@ -75,17 +85,51 @@ PY
 )
 fi
 
+# Batched proof: walk the inclusion path to the root the TSR was issued for
+if [[ -n "$MERKLE_PATH" ]]; then
+  if ! command -v python3 >/dev/null 2>&1; then
+    echo "[ERR] python3 is required to check the Merkle path" >&2
+    exit 3
+  fi
+  ROOT_HEX=$(python3 - "$SHA_HEX" "$MERKLE_PATH" <<'PY'
+import sys,json,hashlib
+leaf,path=sys.argv[1],sys.argv[2].strip()
+steps=json.loads(path) if path.startswith('[') else [s for s in path.split(',') if s]
+h=hashlib.sha256(b'\x00'+bytes.fromhex(leaf)).digest()
+for st in steps:
+  side,_,sib=st.strip().partition(':')
+  sib=bytes.fromhex(sib)
+  if side=='L': h=hashlib.sha256(b'\x01'+sib+h).digest()
+  elif side=='R': h=hashlib.sha256(b'\x01'+h+sib).digest()
+  else: sys.exit('bad path step: '+st)
+print(h.hex())
+PY
+) || { echo "[ERR] invalid --path" >&2; exit 2; }
+  if [[ -n "$MERKLE_ROOT" && "${MERKLE_ROOT,,}" != "$ROOT_HEX" ]]; then
+    echo "[FAIL] Merkle path does not lead to root $MERKLE_ROOT (got $ROOT_HEX)" >&2
+    exit 6
+  fi
+  if [[ $QUIET -eq 0 ]]; then
+    echo "[ok] leaf $SHA_HEX is in batch root $ROOT_HEX"
+  fi
+  SHA_HEX="$ROOT_HEX"
+fi
+
 # Build TSQ in DER
 REQ_TSQ=$(mktemp)
 trap 'rm -f "$REQ_TSQ"' EXIT
 
 if [[ $QUIET -eq 0 ]]; then
-  echo "[info] manifest sha256: $SHA_HEX"
+  if [[ -n "$MERKLE_PATH" ]]; then
+    echo "[info] batch root (TSQ imprint): $SHA_HEX"
+  else
+    echo "[info] manifest sha256: $SHA_HEX"
+  fi
   echo "[info] building TSQ …"
 fi
 
-# Openssl ts -query will write DER to stdout; redirect to file
-if ! openssl ts -query -sha256 -digest "$SHA_HEX" -cert -no_nonce -outform DER >"$REQ_TSQ"; then
+# Openssl ts -query writes DER to stdout (it has no -outform option); redirect to file
+if ! openssl ts -query -sha256 -digest "$SHA_HEX" -cert -no_nonce >"$REQ_TSQ"; then
   echo "[ERR] openssl ts -query failed" >&2
   exit 4
 fi
@@ -108,7 +152,7 @@ fi
 
 if [[ $QUIET -eq 0 ]]; then
   echo "[ok] TSA verify: PASS"
-  echo "[info] TSR details:"; openssl ts -reply -in "$TSR" -text -token_in | sed 's/^/  /'
+  echo "[info] TSR details:"; openssl ts -reply -in "$TSR" -text | sed 's/^/  /'
 else
   echo "PASS"
 fi
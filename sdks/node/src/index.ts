@@ -37,8 +37,30 @@ export interface RenderResponse {
   status: string; // QUEUED
 }
 
+export interface RenderBatchItem {
+  job_id: string | null;
+  status: "QUEUED" | "REJECTED";
+  error: string | null;
+}
+
 export interface JobSummary { job_id: string; status: string }
 
+export type JobField = "job_id" | "status" | "created_at" | "updated_at" | "profile" | "priority" | "attempts";
+
+export interface ListJobsParams {
+  limit?: number; // 1..500, server default 50
+  cursor?: string; // next_cursor of the previous page
+  status?: string | string[];
+  createdAfter?: string | Date;
+  createdBefore?: string | Date;
+  fields?: JobField[]; // job_id is always returned; default ["status"]
+}
+
+export interface JobPage {
+  items: Array<Record<string, unknown> & { job_id: string }>;
+  next_cursor: string | null;
+}
+
 export interface ManifestQC { audio_lufs?: number; video_issues?: number; subtitle_sync_ms?: number }
 export interface Manifest {
   job_id: string;
@@ -118,6 +140,20 @@ export class QuickDCP {
     });
   }
 
+  /** Submit many jobs via /jobs/render:batch, batchSize per request; one result per request, in order. */
+  async renderJobs(reqs: RenderRequest[], batchSize = 500): Promise<RenderBatchItem[]> {
+    const out: RenderBatchItem[] = [];
+    for (let i = 0; i < reqs.length; i += batchSize) {
+      const res = await jsonFetch<{ created: number; results: RenderBatchItem[] }>(`${this.baseUrl}/jobs/render:batch`, {
+        method: "POST",
+        headers: this.headers,
+        body: JSON.stringify({ jobs: reqs.slice(i, i + batchSize) }),
+      });
+      out.push(...res.results);
+    }
+    return out;
+  }
+
   async getJob(jobId: string): Promise<Manifest | { job_id: string; status: string }> {
     return jsonFetch(`${this.baseUrl}/jobs/${encodeURIComponent(jobId)}`, {
       method: "GET",
@@ -125,13 +161,32 @@ export class QuickDCP {
     });
   }
 
-  async listJobs(): Promise<JobSummary[]> {
-    return jsonFetch(`${this.baseUrl}/jobs`, {
+  async listJobs(params: ListJobsParams = {}): Promise<JobPage> {
+    const q = new URLSearchParams();
+    const iso = (v: string | Date) => (v instanceof Date ? v.toISOString() : v);
+    if (params.limit !== undefined) q.set("limit", String(params.limit));
+    if (params.cursor) q.set("cursor", params.cursor);
+    if (params.status) q.set("status", Array.isArray(params.status) ? params.status.join(",") : params.status);
+    if (params.createdAfter) q.set("created_after", iso(params.createdAfter));
+    if (params.createdBefore) q.set("created_before", iso(params.createdBefore));
+    if (params.fields?.length) q.set("fields", params.fields.join(","));
+    const qs = q.toString();
+    return jsonFetch(`${this.baseUrl}/jobs${qs ? `?${qs}` : ""}`, {
       method: "GET",
       headers: { ...this.headers, "Content-Type": "" },
     });
   }
 
+  /** Every matching job, newest first, following next_cursor. */
+  async *iterJobs(params: Omit<ListJobsParams, "cursor"> = {}): AsyncGenerator<JobPage["items"][number]> {
+    let cursor: string | undefined;
+    do {
+      const page = await this.listJobs({ ...params, cursor });
+      yield* page.items;
+      cursor = page.next_cursor ?? undefined;
+    } while (cursor);
+  }
+
   // Proof
   async proofInit(jobId: string): Promise<ProofInitRes> {
     return jsonFetch(`${this.baseUrl}/proof/init`, {
@@ -1,3 +1,2 @@
-from .client import Client
-
-__all__ = ["Client"]
+from .init import *  # noqa: F401,F403
+from .init import __all__, __getattr__, __version__  # noqa: F401
@@ -0,0 +1,418 @@
+"""
+QuickDCP Python SDK — asyncio client
+
+Same API surface as quickdcp.client.QuickDCP, built on httpx.AsyncClient:
+one keep-alive connection pool per client, HTTP/2 when the `h2` package is
+installed (`pip install quickdcp[async]`), HTTP/1.1 otherwise.
+
+Bulk helpers fan out concurrently, bounded by `concurrency`:
+- render_jobs(payloads)  submit many jobs (/jobs/render:batch, batches in parallel)
+- get_jobs(ids)          fetch many jobs
+- iter_jobs(**filters)   async-iterate every listed job, following cursors
+- wait_for_jobs(ids)     poll until every job leaves QUEUED/PROCESSING
+
+Example:
+    import asyncio
+    from quickdcp.aio import AsyncQuickDCP
+
+    async def main():
+        async with AsyncQuickDCP("http://localhost:8080", "dev", "dev", concurrency=32) as qc:
+            subs = await qc.render_jobs([{"job_id": f"JOB-{i}", "profile": {"res": "2K"}} for i in range(500)])
+            done = await qc.wait_for_jobs([s["job_id"] for s in subs])
+            print(done)
+
+    asyncio.run(main())
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import pathlib
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
+from urllib.parse import quote
+
+try:
+    import httpx
+except Exception as e:  # pragma: no cover - optional dependency
+    raise ImportError("AsyncQuickDCP requires httpx: pip install 'quickdcp[async]'") from e
+
+from .client import (
+    LEDGER_SUFFIX,
+    RENDER_BATCH_SIZE,
+    ClientOptions,
+    CompletePart,
+    HeadRes,
+    JobPage,
+    ListPartsRes,
+    PartSignRes,
+    PartsSignRes,
+    ProofAckRes,
+    ProofInitRes,
+    RenderBatchItem,
+    RenderResponse,
+    UploadInitRes,
+    _headers,
+    _ledger_load,
+    _list_params,
+    _ledger_write,
+    _sha256_b64,
+    _sha256_file,
+)
+
+T = TypeVar("T")
+
+PENDING_STATUSES = frozenset({"QUEUED", "PROCESSING"})
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+class AsyncQuickDCP:
+    def __init__(
+        self,
+        base_url: str,
+        customer: str,
+        api_key: str,
+        timeout: Tuple[int, int] | None = None,
+        concurrency: int = 16,
+        http2: Optional[bool] = None,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self.opts = ClientOptions(base_url.rstrip("/"), customer, api_key, timeout or (10, 300))
+        self.concurrency = max(1, concurrency)
+        connect, read = self.opts.timeout
+        self.client = client or httpx.AsyncClient(
+            http2=_http2_available() if http2 is None else http2,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(
+                max_connections=self.concurrency * 2,
+                max_keepalive_connections=self.concurrency,
+            ),
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncQuickDCP":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    async def _fetch(self, method: str, url: str, **kw) -> Any:
+        r = await self.client.request(method, url, **kw)
+        txt = r.text
+        try:
+            data = r.json() if txt else None
+        except Exception:
+            data = None
+        if r.is_error:
+            raise httpx.HTTPStatusError(f"HTTP {r.status_code}: {data or txt}", request=r.request, response=r)
+        return data
+
+    async def _gather(
+        self,
+        fn: Callable[[Any], Awaitable[T]],
+        items: Iterable[Any],
+        concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> List[Union[T, BaseException]]:
+        """Run fn over items with at most `concurrency` in flight; results in input order."""
+        sem = asyncio.Semaphore(max(1, concurrency or self.concurrency))
+
+        async def one(item: Any) -> T:
+            async with sem:
+                return await fn(item)
+
+        return await asyncio.gather(*(one(i) for i in items), return_exceptions=return_exceptions)
+
+    # ----------------- Jobs -----------------
+    async def render_job(self, payload: Dict[str, Any]) -> RenderResponse:
+        url = f"{self.opts.base_url}/jobs/render"
+        return await self._fetch("POST", url, headers=_headers(self.opts), content=json.dumps(payload))
+
+    async def get_job(self, job_id: str) -> Dict[str, Any]:
+        url = f"{self.opts.base_url}/jobs/{quote(job_id)}"
+        return await self._fetch("GET", url, headers=_headers(self.opts, content=None))
+
+    async def list_jobs(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        status: Union[str, Sequence[str], None] = None,
+        created_after: Union[str, datetime, None] = None,
+        created_before: Union[str, datetime, None] = None,
+        fields: Union[str, Sequence[str], None] = None,
+    ) -> JobPage:
+        url = f"{self.opts.base_url}/jobs"
+        params = _list_params(limit, cursor, status, created_after, created_before, fields)
+        return await self._fetch("GET", url, headers=_headers(self.opts, content=None), params=params)
+
+    async def iter_jobs(self, **filters: Any) -> AsyncIterator[Dict[str, Any]]:
+        """Every matching job, following cursors; takes list_jobs() filters (not cursor)."""
+        cursor = None
+        while True:
+            page = await self.list_jobs(cursor=cursor, **filters)
+            for item in page["items"]:
+                yield item
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
+
+    async def render_jobs(
+        self,
+        payloads: Sequence[Dict[str, Any]],
+        concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        batch_size: int = RENDER_BATCH_SIZE,
+    ) -> List[Union[RenderBatchItem, BaseException]]:
+        """Submit many jobs via /jobs/render:batch; one result per payload, in input order.
+
+        With return_exceptions, a failed request yields its exception for
+        each payload of that batch instead of raising.
+        """
+        url = f"{self.opts.base_url}/jobs/render:batch"
+        chunks = [list(payloads[i:i + batch_size]) for i in range(0, len(payloads), batch_size)]
+
+        async def one(chunk: List[Dict[str, Any]]) -> List[RenderBatchItem]:
+            res = await self._fetch("POST", url, headers=_headers(self.opts), content=json.dumps({"jobs": chunk}))
+            return res["results"]
+
+        out: List[Union[RenderBatchItem, BaseException]] = []
+        for chunk, res in zip(chunks, await self._gather(one, chunks, concurrency, return_exceptions)):
+            out.extend([res] * len(chunk) if isinstance(res, BaseException) else res)
+        return out
+
+    async def get_jobs(
+        self,
+        job_ids: Sequence[str],
+        concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> List[Union[Dict[str, Any], BaseException]]:
+        return await self._gather(self.get_job, job_ids, concurrency, return_exceptions)
+
+    async def wait_for_jobs(
+        self,
+        job_ids: Sequence[str],
+        poll_interval: float = 2.0,
+        timeout: Optional[float] = None,
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Poll until every job has left QUEUED/PROCESSING; return {job_id: job}.
+
+        Only still-pending jobs are polled each round. Raises asyncio.TimeoutError
+        after `timeout` seconds (the jobs finished so far are on the exception's
+        `done` attribute).
+        """
+        pending = list(dict.fromkeys(job_ids))
+        done: Dict[str, Dict[str, Any]] = {}
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while pending:
+            jobs = await self._gather(self.get_job, pending, concurrency)
+            still: List[str] = []
+            for jid, job in zip(pending, jobs):
+                if (job or {}).get("status") in PENDING_STATUSES:
+                    still.append(jid)
+                else:
+                    done[jid] = job
+            pending = still
+            if not pending:
+                break
+            if deadline is not None and time.monotonic() + poll_interval > deadline:
+                err = asyncio.TimeoutError(f"{len(pending)} job(s) still pending")
+                err.done = done  # type: ignore[attr-defined]
+                raise err
+            await asyncio.sleep(poll_interval)
+        return done
+
+    # ----------------- Proof -----------------
+    async def proof_init(self, job_id: str) -> ProofInitRes:
+        url = f"{self.opts.base_url}/proof/init"
+        return await self._fetch("POST", url, headers=_headers(self.opts), content=json.dumps({"job_id": job_id}))
+
+    async def proof_ack_tsa(self, job_id: str, tsr_base64: str, tsa_cert_pem: Optional[str] = None) -> ProofAckRes:
+        url = f"{self.opts.base_url}/proof/ack/tsa"
+        body = {"job_id": job_id, "tsr_base64": tsr_base64}
+        if tsa_cert_pem:
+            body["tsa_cert_pem"] = tsa_cert_pem
+        return await self._fetch("POST", url, headers=_headers(self.opts), content=json.dumps(body))
+
+    async def proof_status(self, job_id: str) -> ProofAckRes:
+        url = f"{self.opts.base_url}/proof/status/{quote(job_id)}"
+        return await self._fetch("GET", url, headers=_headers(self.opts, content=None))
+
+    # ----------------- Upload -----------------
+    async def upload_init(self, filename: str, size: int, sha256: str) -> UploadInitRes:
+        url = f"{self.opts.base_url}/upload/init"
+        form = {"filename": filename, "size": str(size), "sha256": sha256}
+        return await self._fetch("POST", url, headers=_headers(self.opts, content=None), data=form)
+
+    async def sign_part(self, key: str, upload_id: str, part_number: int) -> PartSignRes:
+        url = f"{self.opts.base_url}/upload/part"
+        form = {"key": key, "upload_id": upload_id, "part_number": str(part_number)}
+        return await self._fetch("POST", url, headers=_headers(self.opts, content=None), data=form)
+
+    async def sign_parts(
+        self,
+        key: str,
+        upload_id: str,
+        part_numbers: Optional[Iterable[int]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> PartsSignRes:
+        """Presign many parts in one call (explicit list or start..end inclusive)."""
+        url = f"{self.opts.base_url}/upload/parts"
+        body: Dict[str, Any] = {"key": key, "upload_id": upload_id}
+        if part_numbers is not None:
+            body["part_numbers"] = list(part_numbers)
+        else:
+            body["start"] = start
+            body["end"] = end
+        return await self._fetch("POST", url, headers=_headers(self.opts), content=json.dumps(body))
+
+    async def upload_complete(self, key: str, upload_id: str, parts: List[CompletePart]) -> Dict[str, Any]:
+        url = f"{self.opts.base_url}/upload/complete"
+        body = {"key": key, "upload_id": upload_id, "parts": parts}
+        return await self._fetch("POST", url, headers=_headers(self.opts), content=json.dumps(body))
+
+    async def list_parts(self, key: str, upload_id: str) -> ListPartsRes:
+        url = f"{self.opts.base_url}/upload/parts/{quote(upload_id, safe='')}"
+        return await self._fetch("GET", url, headers=_headers(self.opts, content=None), params={"key": key})
+
+    async def upload_head(self, key: str) -> HeadRes:
+        url = f"{self.opts.base_url}/upload/head"
+        return await self._fetch("GET", url, headers=_headers(self.opts, content=None), params={"key": key})
+
+    async def upload_verify(self, key: str, sha256: Optional[str] = None, job_id: Optional[str] = None) -> Dict[str, Any]:
+        url = f"{self.opts.base_url}/upload/verify"
+        body = {"key": key, "sha256": sha256, "job_id": job_id}
+        return await self._fetch("POST", url, headers=_headers(self.opts), content=json.dumps(body))
+
+    # ----------------- High-level multipart -----------------
+    async def upload_file(
+        self,
+        filepath: Union[str, os.PathLike],
+        part_size_mb: int = 64,
+        presign_window: int = 64,
+        resume: bool = False,
+        concurrency: int = 4,
+    ) -> Dict[str, Any]:
+        """Async counterpart of QuickDCP.upload_file with `concurrency` parallel part PUTs.
+
+        File reads and hashing run in a worker thread; at most concurrency + 1
+        parts are held in memory. The resume ledger format is shared with the
+        sync client.
+        """
+        p = pathlib.Path(filepath).expanduser().resolve()
+        if not p.is_file():
+            raise FileNotFoundError(str(p))
+        st = p.stat()
+        size = st.st_size
+        sha = await asyncio.to_thread(_sha256_file, p)
+
+        part_size = max(5, part_size_mb) * 1024 * 1024
+        ledger_path = p.with_name(p.name + LEDGER_SUFFIX)
+        done: Dict[int, Tuple[str, str]] = {}
+        key = upload_id = None
+        ledger = None
+
+        if resume:
+            header, ledger_parts = _ledger_load(ledger_path)
+            if header and header.get("size") == size and header.get("mtime_ns") == st.st_mtime_ns and header.get("sha256") == sha:
+                try:
+                    remote = (await self.list_parts(header["key"], header["upload_id"]))["parts"]
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code != 404:
+                        raise
+                else:
+                    key, upload_id = header["key"], header["upload_id"]
+                    part_size = int(header["part_size"])
+                    for rp in remote:
+                        n, etag = int(rp["PartNumber"]), rp["ETag"].strip('"')
+                        chk = rp.get("ChecksumSHA256") or ""
+                        lp = ledger_parts.get(n)
+                        if not chk and lp and lp["etag"] == etag:
+                            chk = lp["checksum"]
+                        if chk:
+                            done[n] = (etag, chk)
+                    ledger = open(ledger_path, "a", encoding="utf-8")
+
+        if upload_id is None:
+            init = await self.upload_init(p.name, size, sha)
+            key = init["key"]
+            upload_id = init["upload_id"]
+            if resume:
+                ledger = open(ledger_path, "w", encoding="utf-8")
+                _ledger_write(ledger, {"name": p.name, "size": size, "mtime_ns": st.st_mtime_ns, "sha256": sha,
+                                       "part_size": part_size, "key": key, "upload_id": upload_id})
+
+        parts_total = max(1, math.ceil(size / part_size))
+        urls: Dict[int, str] = {}
+        etags: Dict[int, str] = {}
+        slots = asyncio.Semaphore(max(1, concurrency) + 1)
+        tasks: List[asyncio.Task] = []
+
+        async def put(part_no: int, chunk: bytes, chk: str) -> None:
+            try:
+                r = await self.client.put(urls.pop(part_no), content=chunk, headers={"x-amz-checksum-sha256": chk})
+                if r.status_code not in (200, 201):
+                    raise httpx.HTTPStatusError(f"part PUT failed: {r.status_code} {r.text}", request=r.request, response=r)
+                etag = (r.headers.get("ETag") or "").strip('"')
+                if not etag:
+                    raise RuntimeError("missing ETag on part PUT")
+                etags[part_no] = etag
+                if ledger is not None:
+                    _ledger_write(ledger, {"part": part_no, "etag": etag, "checksum": chk})
+            finally:
+                slots.release()
+
+        def read_part(f, n: int) -> Tuple[bytes, str]:
+            chunk = f.read(n)
+            return chunk, _sha256_b64(chunk) if chunk else ""
+
+        try:
+            with open(p, "rb") as f:
+                for part_no in range(1, parts_total + 1):
+                    await slots.acquire()
+                    chunk, chk = await asyncio.to_thread(read_part, f, part_size)
+                    if part_no in done and done[part_no][1] == chk:
+                        etags[part_no] = done[part_no][0]
+                        slots.release()
+                        continue
+                    done.pop(part_no, None)
+                    if part_no not in urls:
+                        nums = [n for n in range(part_no, parts_total + 1) if n not in done][: max(1, presign_window)]
+                        for sp in (await self.sign_parts(key, upload_id, part_numbers=nums))["parts"]:
+                            urls[int(sp["part_number"])] = sp["url"]
+                    tasks.append(asyncio.create_task(put(part_no, chunk, chk)))
+                    # surface a failed PUT early instead of reading the rest of the file
+                    for t in tasks:
+                        if t.done() and t.exception() is not None:
+                            raise t.exception()
+                await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            if ledger is not None:
+                ledger.close()
+
+        parts: List[CompletePart] = [{"ETag": etags[n], "PartNumber": n} for n in sorted(etags)]
+        await self.upload_complete(key, upload_id, parts)
+        if resume:
+            ledger_path.unlink(missing_ok=True)
+        return {"key": key, "sha256": sha, "size": size, "parts": len(parts)}
+
+
+__all__ = ["AsyncQuickDCP", "PENDING_STATUSES"]
@@ -4,6 +4,10 @@ QuickDCP Python SDK (fixed)
 Minimal client for the QuickDCP API with multipart upload helper.
 Requires: requests>=2.31, Python 3.9+
 
+All calls go through one pooled requests.Session (keep-alive), so repeated
+calls reuse TCP+TLS connections. Use the client as a context manager, or call
+close(), to release them. For asyncio code see quickdcp.aio.AsyncQuickDCP.
+
 Example:
     from quickdcp.client import QuickDCP
     qc = QuickDCP(base_url="http://localhost:8080", customer="dev", api_key="dev")
@@ -20,9 +24,11 @@ import os
 import pathlib
 import time
 from dataclasses import dataclass
-from typing import Any, Dict, Iterable, List, Optional, Tuple, TypedDict, Union
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypedDict, Union
 
 import requests
+from requests.adapters import HTTPAdapter
 
 # --------------------------------------------------------------------------------------
 # Types
@@ -31,10 +37,19 @@ class RenderResponse(TypedDict):
     job_id: str
     status: str
 
+class RenderBatchItem(TypedDict):
+    job_id: Optional[str]
+    status: str             # QUEUED | REJECTED
+    error: Optional[str]    # why it was rejected
+
 class JobSummary(TypedDict):
     job_id: str
     status: str
 
+class JobPage(TypedDict):
+    items: List[Dict[str, Any]]   # job_id + requested fields (default: status)
+    next_cursor: Optional[str]    # None on the last page
+
 class ProofInitRes(TypedDict):
     job_id: str
     manifest_sha256: str
@@ -55,10 +70,31 @@ class UploadInitRes(TypedDict):
 class PartSignRes(TypedDict):
     url: str
 
+class SignedPart(TypedDict):
+    part_number: int
+    url: str
+
+class PartsSignRes(TypedDict):
+    key: str
+    upload_id: str
+    expires_in: int
+    parts: List[SignedPart]
+
 class CompletePart(TypedDict):
     ETag: str
     PartNumber: int
 
+class UploadedPart(TypedDict):
+    PartNumber: int
+    ETag: str
+    Size: Optional[int]
+    ChecksumSHA256: Optional[str]
+
+class ListPartsRes(TypedDict):
+    key: str
+    upload_id: str
+    parts: List[UploadedPart]
+
 class HeadRes(TypedDict):
     key: str
     exists: bool
@@ -87,8 +123,16 @@ def _headers(opts: ClientOptions, content: Optional[str] = "application/json") -
     return h
 
 
-def _jsonfetch(opts: ClientOptions, method: str, url: str, **kw) -> Any:
-    r = requests.request(method, url, timeout=opts.timeout, **kw)
+def _make_session(pool_maxsize: int = 10) -> requests.Session:
+    sess = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    sess.mount("http://", adapter)
+    sess.mount("https://", adapter)
+    return sess
+
+
+def _jsonfetch(opts: ClientOptions, method: str, url: str, session: Optional[requests.Session] = None, **kw) -> Any:
+    r = (session or requests).request(method, url, timeout=opts.timeout, **kw)
     txt = r.text
     try:
         data = r.json() if txt else None
@@ -99,6 +143,37 @@ def _jsonfetch(opts: ClientOptions, method: str, url: str, **kw) -> Any:
     return data
 
 
+def _list_params(
+    limit: Optional[int],
+    cursor: Optional[str],
+    status: Union[str, Sequence[str], None],
+    created_after: Union[str, datetime, None],
+    created_before: Union[str, datetime, None],
+    fields: Union[str, Sequence[str], None],
+) -> Dict[str, Any]:
+    """Query string for GET /jobs; lists become comma-separated, datetimes ISO 8601."""
+    def csv(v: Union[str, Sequence[str]]) -> str:
+        return v if isinstance(v, str) else ",".join(v)
+
+    def iso(v: Union[str, datetime]) -> str:
+        return v.isoformat() if isinstance(v, datetime) else v
+
+    p: Dict[str, Any] = {}
+    if limit is not None:
+        p["limit"] = limit
+    if cursor:
+        p["cursor"] = cursor
+    if status:
+        p["status"] = csv(status)
+    if created_after is not None:
+        p["created_after"] = iso(created_after)
+    if created_before is not None:
+        p["created_before"] = iso(created_before)
+    if fields:
+        p["fields"] = csv(fields)
+    return p
+
+
 def _sha256_file(path: Union[str, os.PathLike], block: int = 1024 * 1024) -> str:
     h = hashlib.sha256()
     with open(path, "rb") as f:
@@ -114,38 +189,119 @@ def _sha256_b64(buf: bytes) -> str:
 # --------------------------------------------------------------------------------------
 # Client
 # --------------------------------------------------------------------------------------
+LEDGER_SUFFIX = ".qdcp-upload.jsonl"
+RENDER_BATCH_SIZE = 500  # server default RENDER_BATCH_MAX
+
+
+def _ledger_load(path: pathlib.Path) -> Tuple[Optional[Dict[str, Any]], Dict[int, Dict[str, str]]]:
+    """Read a part ledger: header line, then one {"part","etag","checksum"} per line."""
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
+        return None, {}
+    header: Optional[Dict[str, Any]] = None
+    parts: Dict[int, Dict[str, str]] = {}
+    for i, line in enumerate(lines):
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue  # torn last line after a crash
+        if i == 0:
+            header = rec
+        elif "part" in rec:
+            parts[int(rec["part"])] = {"etag": rec["etag"], "checksum": rec.get("checksum", "")}
+    return header, parts
+
+
+def _ledger_write(fh, rec: Dict[str, Any]) -> None:
+    fh.write(json.dumps(rec, separators=(",", ":")) + "\n")
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
 class QuickDCP:
-    def __init__(self, base_url: str, customer: str, api_key: str, timeout: Tuple[int, int] | None = None) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        customer: str,
+        api_key: str,
+        timeout: Tuple[int, int] | None = None,
+        session: Optional[requests.Session] = None,
+        pool_maxsize: int = 10,
+    ) -> None:
         self.opts = ClientOptions(base_url.rstrip("/"), customer, api_key, timeout or (10, 300))
+        self.session = session or _make_session(pool_maxsize)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "QuickDCP":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _fetch(self, method: str, url: str, **kw) -> Any:
+        return _jsonfetch(self.opts, method, url, session=self.session, **kw)
 
     # ----------------- Jobs -----------------
     def render_job(self, payload: Dict[str, Any]) -> RenderResponse:
         url = f"{self.opts.base_url}/jobs/render"
-        return _jsonfetch(self.opts, "POST", url, headers=_headers(self.opts), data=json.dumps(payload))
+        return self._fetch("POST", url, headers=_headers(self.opts), data=json.dumps(payload))
+
+    def render_jobs(self, payloads: Sequence[Dict[str, Any]], batch_size: int = RENDER_BATCH_SIZE) -> List[RenderBatchItem]:
+        """Submit many jobs via /jobs/render:batch, batch_size per request; one result per payload, in order."""
+        url = f"{self.opts.base_url}/jobs/render:batch"
+        out: List[RenderBatchItem] = []
+        for i in range(0, len(payloads), batch_size):
+            chunk = list(payloads[i:i + batch_size])
+            res = self._fetch("POST", url, headers=_headers(self.opts), data=json.dumps({"jobs": chunk}))
+            out.extend(res["results"])
+        return out
 
     def get_job(self, job_id: str) -> Dict[str, Any]:
         url = f"{self.opts.base_url}/jobs/{requests.utils.quote(job_id)}"
-        return _jsonfetch(self.opts, "GET", url, headers=_headers(self.opts, content=None))
-
-    def list_jobs(self) -> List[JobSummary]:
+        return self._fetch("GET", url, headers=_headers(self.opts, content=None))
+
+    def list_jobs(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        status: Union[str, Sequence[str], None] = None,
+        created_after: Union[str, datetime, None] = None,
+        created_before: Union[str, datetime, None] = None,
+        fields: Union[str, Sequence[str], None] = None,
+    ) -> JobPage:
+        """One page of jobs, newest first; pass next_cursor back as cursor for the next."""
         url = f"{self.opts.base_url}/jobs"
-        return _jsonfetch(self.opts, "GET", url, headers=_headers(self.opts, content=None))
+        params = _list_params(limit, cursor, status, created_after, created_before, fields)
+        return self._fetch("GET", url, headers=_headers(self.opts, content=None), params=params)
+
+    def iter_jobs(self, **filters: Any) -> Iterator[Dict[str, Any]]:
+        """Every matching job, following cursors; takes list_jobs() filters (not cursor)."""
+        cursor = None
+        while True:
+            page = self.list_jobs(cursor=cursor, **filters)
+            yield from page["items"]
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
 
     # ----------------- Proof -----------------
     def proof_init(self, job_id: str) -> ProofInitRes:
         url = f"{self.opts.base_url}/proof/init"
-        return _jsonfetch(self.opts, "POST", url, headers=_headers(self.opts), data=json.dumps({"job_id": job_id}))
+        return self._fetch("POST", url, headers=_headers(self.opts), data=json.dumps({"job_id": job_id}))
 
     def proof_ack_tsa(self, job_id: str, tsr_base64: str, tsa_cert_pem: Optional[str] = None) -> ProofAckRes:
         url = f"{self.opts.base_url}/proof/ack/tsa"
         body = {"job_id": job_id, "tsr_base64": tsr_base64}
         if tsa_cert_pem:
             body["tsa_cert_pem"] = tsa_cert_pem
-        return _jsonfetch(self.opts, "POST", url, headers=_headers(self.opts), data=json.dumps(body))
+        return self._fetch("POST", url, headers=_headers(self.opts), data=json.dumps(body))
 
     def proof_status(self, job_id: str) -> ProofAckRes:
         url = f"{self.opts.base_url}/proof/status/{requests.utils.quote(job_id)}"
-        return _jsonfetch(self.opts, "GET", url, headers=_headers(self.opts, content=None))
+        return self._fetch("GET", url, headers=_headers(self.opts, content=None))
 
     # ----------------- Upload -----------------
     def upload_init(self, filename: str, size: int, sha256: str) -> UploadInitRes:
@@ -155,7 +311,7 @@ class QuickDCP:
             "size": str(size),
             "sha256": sha256,
         }
-        return _jsonfetch(self.opts, "POST", url, headers=_headers(self.opts, content="application/x-www-form-urlencoded"), data=requests.models.RequestEncodingMixin._encode_params(form))
+        return self._fetch("POST", url, headers=_headers(self.opts, content="application/x-www-form-urlencoded"), data=requests.models.RequestEncodingMixin._encode_params(form))
 
     def sign_part(self, key: str, upload_id: str, part_number: int) -> PartSignRes:
         url = f"{self.opts.base_url}/upload/part"
@@ -164,57 +320,163 @@ class QuickDCP:
             "upload_id": upload_id,
             "part_number": str(part_number),
         }
-        return _jsonfetch(self.opts, "POST", url, headers=_headers(self.opts, content="application/x-www-form-urlencoded"), data=requests.models.RequestEncodingMixin._encode_params(form))
+        return self._fetch("POST", url, headers=_headers(self.opts, content="application/x-www-form-urlencoded"), data=requests.models.RequestEncodingMixin._encode_params(form))
+
+    def sign_parts(
+        self,
+        key: str,
+        upload_id: str,
+        part_numbers: Optional[Iterable[int]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> PartsSignRes:
+        """Presign many parts in one call (explicit list or start..end inclusive)."""
+        url = f"{self.opts.base_url}/upload/parts"
+        body: Dict[str, Any] = {"key": key, "upload_id": upload_id}
+        if part_numbers is not None:
+            body["part_numbers"] = list(part_numbers)
+        else:
+            body["start"] = start
+            body["end"] = end
+        return self._fetch("POST", url, headers=_headers(self.opts), data=json.dumps(body))
 
     def upload_complete(self, key: str, upload_id: str, parts: List[CompletePart]) -> Dict[str, Any]:
         url = f"{self.opts.base_url}/upload/complete"
         body = {"key": key, "upload_id": upload_id, "parts": parts}
-        return _jsonfetch(self.opts, "POST", url, headers=_headers(self.opts), data=json.dumps(body))
+        return self._fetch("POST", url, headers=_headers(self.opts), data=json.dumps(body))
+
+    def list_parts(self, key: str, upload_id: str) -> ListPartsRes:
+        """Parts S3 already holds for an open multipart upload."""
+        url = f"{self.opts.base_url}/upload/parts/{requests.utils.quote(upload_id, safe='')}?key={requests.utils.quote(key)}"
+        return self._fetch("GET", url, headers=_headers(self.opts, content=None))
 
     def upload_head(self, key: str) -> HeadRes:
         url = f"{self.opts.base_url}/upload/head?key={requests.utils.quote(key)}"
-        return _jsonfetch(self.opts, "GET", url, headers=_headers(self.opts, content=None))
+        return self._fetch("GET", url, headers=_headers(self.opts, content=None))
+
+    def upload_verify(self, key: str, sha256: Optional[str] = None, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Have the API confirm the object's SHA-256 from S3 (and record it on job_id)."""
+        url = f"{self.opts.base_url}/upload/verify"
+        body = {"key": key, "sha256": sha256, "job_id": job_id}
+        return self._fetch("POST", url, headers=_headers(self.opts), data=json.dumps(body))
 
     # ----------------- High-level multipart -----------------
-    def upload_file(self, filepath: Union[str, os.PathLike], part_size_mb: int = 64) -> Dict[str, Any]:
+    def upload_file(
+        self,
+        filepath: Union[str, os.PathLike],
+        part_size_mb: int = 64,
+        presign_window: int = 64,
+        resume: bool = False,
+    ) -> Dict[str, Any]:
         """Upload a local file via multipart and return { key, sha256, size, parts }.
 
         S3 enforces 5MB min per part; we enforce that here. Uses streaming and
-        computes the file SHA-256 up-front so the API can record it.
+        computes the file SHA-256 up-front so the API can record it. Part URLs
+        are presigned `presign_window` at a time ahead of the upload cursor.
+
+        With resume=True finished parts are recorded in a sidecar ledger
+        (`<file>.qdcp-upload.jsonl`); calling again with resume=True after a
+        failure reconciles it with list_parts() and only sends missing parts.
         """
         p = pathlib.Path(filepath).expanduser().resolve()
         if not p.is_file():
             raise FileNotFoundError(str(p))
-        size = p.stat().st_size
+        st = p.stat()
+        size = st.st_size
         sha = _sha256_file(p)
 
-        init = self.upload_init(p.name, size, sha)
-        key = init["key"]
-        upload_id = init["upload_id"]
-
         part_size = max(5, part_size_mb) * 1024 * 1024
+        ledger_path = p.with_name(p.name + LEDGER_SUFFIX)
+        done: Dict[int, Tuple[str, str]] = {}  # part -> (etag, checksum) already on S3
+        key = upload_id = None
+        ledger = None
+
+        if resume:
+            header, ledger_parts = _ledger_load(ledger_path)
+            if header and header.get("size") == size and header.get("mtime_ns") == st.st_mtime_ns and header.get("sha256") == sha:
+                try:
+                    remote = self.list_parts(header["key"], header["upload_id"])["parts"]
+                except requests.HTTPError as e:
+                    if e.response is None or e.response.status_code != 404:
+                        raise
+                else:
+                    key, upload_id = header["key"], header["upload_id"]
+                    part_size = int(header["part_size"])
+                    for rp in remote:
+                        n, etag = int(rp["PartNumber"]), rp["ETag"].strip('"')
+                        chk = rp.get("ChecksumSHA256") or ""
+                        lp = ledger_parts.get(n)
+                        if not chk and lp and lp["etag"] == etag:
+                            chk = lp["checksum"]
+                        if chk:
+                            done[n] = (etag, chk)
+                    ledger = open(ledger_path, "a", encoding="utf-8")
+
+        if upload_id is None:
+            init = self.upload_init(p.name, size, sha)
+            key = init["key"]
+            upload_id = init["upload_id"]
+            if resume:
+                ledger = open(ledger_path, "w", encoding="utf-8")
+                _ledger_write(ledger, {"name": p.name, "size": size, "mtime_ns": st.st_mtime_ns, "sha256": sha,
+                                       "part_size": part_size, "key": key, "upload_id": upload_id})
+
+        try:
+            parts = self._upload_parts(p, key, upload_id, part_size, presign_window, done, ledger)
+        finally:
+            if ledger is not None:
+                ledger.close()
+
+        self.upload_complete(key, upload_id, parts)
+        if resume:
+            ledger_path.unlink(missing_ok=True)
+        return {"key": key, "sha256": sha, "size": size, "parts": len(parts)}
+
+    def _upload_parts(
+        self,
+        p: pathlib.Path,
+        key: str,
+        upload_id: str,
+        part_size: int,
+        presign_window: int,
+        done: Dict[int, Tuple[str, str]],
+        ledger: Any,
+    ) -> List[CompletePart]:
+        size = p.stat().st_size
+        parts_total = max(1, math.ceil(size / part_size))
+        urls: Dict[int, str] = {}
         parts: List[CompletePart] = []
         sent = 0
         t0 = time.time()
-
         with open(p, "rb") as f:
             part_no = 1
             while True:
                 chunk = f.read(part_size)
                 if not chunk:
                     break
-                # get presigned url
-                presign = self.sign_part(key, upload_id, part_no)
-                url = presign["url"]
                 chk = _sha256_b64(chunk)
+                if part_no in done and done[part_no][1] == chk:
+                    # already on S3 with identical bytes (resume)
+                    parts.append({"ETag": done[part_no][0], "PartNumber": part_no})
+                    part_no += 1
+                    continue
+                done.pop(part_no, None)
+                # get presigned url (fetch the next window when we run out)
+                if part_no not in urls:
+                    nums = [n for n in range(part_no, parts_total + 1) if n not in done][: max(1, presign_window)]
+                    for sp in self.sign_parts(key, upload_id, part_numbers=nums)["parts"]:
+                        urls[int(sp["part_number"])] = sp["url"]
+                url = urls.pop(part_no)
                 # PUT to S3
-                put = requests.put(url, data=chunk, headers={"x-amz-checksum-sha256": chk}, timeout=self.opts.timeout)
+                put = self.session.put(url, data=chunk, headers={"x-amz-checksum-sha256": chk}, timeout=self.opts.timeout)
                 if put.status_code not in (200, 201):
                     raise requests.HTTPError(f"part PUT failed: {put.status_code} {put.text}")
                 etag = (put.headers.get("ETag") or "").strip('"')
                 if not etag:
                     raise RuntimeError("missing ETag on part PUT")
                 parts.append({"ETag": etag, "PartNumber": part_no})
+                if ledger is not None:
+                    _ledger_write(ledger, {"part": part_no, "etag": etag, "checksum": chk})
                 sent += len(chunk)
                 # progress (stderr)
                 elapsed = max(0.001, time.time() - t0)
@@ -222,20 +484,24 @@ class QuickDCP:
                 pct = (sent / size * 100.0) if size else 100.0
                 print(f"[qdcp] part {part_no} — {pct:.1f}% @ {int(rate/1024/1024)} MB/s", flush=True)
                 part_no += 1
-
-        self.upload_complete(key, upload_id, parts)
-        return {"key": key, "sha256": sha, "size": size, "parts": len(parts)}
+        return parts
 
 
 __all__ = [
     "QuickDCP",
     "ClientOptions",
     "RenderResponse",
+    "RenderBatchItem",
     "JobSummary",
+    "JobPage",
     "ProofInitRes",
     "ProofAckRes",
     "UploadInitRes",
     "PartSignRes",
+    "SignedPart",
+    "PartsSignRes",
     "CompletePart",
+    "UploadedPart",
+    "ListPartsRes",
     "HeadRes",
 ]
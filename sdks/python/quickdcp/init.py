@@ -4,6 +4,8 @@ QuickDCP Python SDK package (fixed)
 Usage:
     from quickdcp import QuickDCP
     qc = QuickDCP(base_url="http://localhost:8080", customer="dev", api_key="dev")
+
+    from quickdcp import AsyncQuickDCP   # needs quickdcp[async] (httpx)
 """
 from __future__ import annotations
 
@@ -11,12 +13,18 @@ from .client import (
     QuickDCP,
     ClientOptions,
     RenderResponse,
+    RenderBatchItem,
     JobSummary,
+    JobPage,
     ProofInitRes,
     ProofAckRes,
     UploadInitRes,
     PartSignRes,
+    SignedPart,
+    PartsSignRes,
     CompletePart,
+    UploadedPart,
+    ListPartsRes,
     HeadRes,
 )
 
@@ -24,13 +32,29 @@ __all__ = [
     "QuickDCP",
     "ClientOptions",
     "RenderResponse",
+    "RenderBatchItem",
     "JobSummary",
+    "JobPage",
     "ProofInitRes",
     "ProofAckRes",
     "UploadInitRes",
     "PartSignRes",
+    "SignedPart",
+    "PartsSignRes",
     "CompletePart",
+    "UploadedPart",
+    "ListPartsRes",
     "HeadRes",
 ]
+# AsyncQuickDCP is deliberately not in __all__: the package's star import
+# would resolve it through __getattr__ and require httpx at import time.
+
+
+def __getattr__(name: str):
+    # imported lazily so the sync client works without httpx installed
+    if name == "AsyncQuickDCP":
+        from .aio import AsyncQuickDCP
+        return AsyncQuickDCP
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __version__ = "0.1.0"
@@ -0,0 +1,102 @@
+-- 0021_job_claim.sql
+-- Job priority + partial index backing the SKIP LOCKED claim in /internal/next-job,
+-- and a working jobs audit trigger so the claim UPDATE can run at all.
+DO $$
+BEGIN
+    IF to_regclass('public.jobs') IS NULL THEN
+        RAISE NOTICE 'public.jobs does not exist, skipping 0021_job_claim';
+        RETURN;
+    END IF;
+
+    -- Per-job priority, seeded from queue_configs.default_priority at insert
+    IF NOT EXISTS (
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name   = 'jobs'
+          AND column_name  = 'priority'
+    ) THEN
+        ALTER TABLE public.jobs
+            ADD COLUMN priority integer NOT NULL DEFAULT 0;
+
+        IF to_regclass('public.queue_configs') IS NOT NULL THEN
+            UPDATE public.jobs j
+               SET priority = c.default_priority
+              FROM public.queue_configs c
+             WHERE c.customer_id = j.customer_id
+               AND j.status = 'QUEUED';
+        END IF;
+    END IF;
+
+    -- Claim order: highest priority first, then FIFO. Partial so the index
+    -- only holds the queue itself and stays small as history grows.
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'jobs_queued_claim_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX jobs_queued_claim_idx
+            ON public.jobs(status, priority DESC, created_at)
+            WHERE status = 'QUEUED';
+    END IF;
+END $$;
+
+-- The jobs audit trigger from 0012 reads a non-existent jobs.code column, so
+-- once attached it fails every insert/update on jobs, including the claim
+-- UPDATE above. Recreate it against the real columns:
+--   - job code is jobs.job_id
+--   - worker updates carry no qd.customer_code; fall back to the row's customer
+--   - a DELETE logs the job id in metadata (audit_logs.job_id would dangle)
+DO $$
+BEGIN
+    IF to_regprocedure('qd.qd_jobs_audit_trigger_fn()') IS NULL THEN
+        RAISE NOTICE 'qd.qd_jobs_audit_trigger_fn does not exist, skipping the 0021_job_claim trigger fix';
+        RETURN;
+    END IF;
+
+    CREATE OR REPLACE FUNCTION qd.qd_jobs_audit_trigger_fn()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $func$
+    DECLARE
+        v_customer_id uuid;
+        v_event_type  text;
+        v_row         public.jobs;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            v_event_type := 'job_insert';
+            v_row := NEW;
+        ELSIF TG_OP = 'UPDATE' THEN
+            v_event_type := 'job_update';
+            v_row := NEW;
+        ELSE
+            v_event_type := 'job_delete';
+            v_row := OLD;
+        END IF;
+
+        IF EXISTS (
+            SELECT 1 FROM pg_proc
+            WHERE proname = 'qd_customer_id'
+              AND pronamespace = 'qd'::regnamespace
+        ) THEN
+            v_customer_id := qd.qd_customer_id();
+        END IF;
+        v_customer_id := COALESCE(v_customer_id, v_row.customer_id);
+
+        PERFORM qd.qd_add_audit_log(
+            v_customer_id,
+            current_user,
+            'user',
+            v_event_type,
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE v_row.id END,
+            NULL,
+            NULL,
+            jsonb_build_object(
+                'status', v_row.status,
+                'job_code', v_row.job_id
+            )
+        );
+
+        RETURN NULL;
+    END;
+    $func$;
+END $$;
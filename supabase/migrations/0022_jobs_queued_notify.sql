@@ -0,0 +1,45 @@
+-- 0022_jobs_queued_notify.sql
+-- NOTIFY jobs_queued whenever a job becomes claimable, so long-polling
+-- /internal/next-job requests wake up instead of re-polling.
+--   * a job is inserted or moved to QUEUED
+--   * a PROCESSING job finishes (frees a max_concurrent_jobs slot)
+DO $$
+BEGIN
+    IF to_regclass('public.jobs') IS NULL THEN
+        RAISE NOTICE 'public.jobs does not exist, skipping 0022_jobs_queued_notify';
+        RETURN;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_proc
+        WHERE proname = 'qd_jobs_queued_notify_fn'
+          AND pronamespace = 'qd'::regnamespace
+    ) THEN
+        CREATE FUNCTION qd.qd_jobs_queued_notify_fn()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $func$
+        BEGIN
+            IF NEW.status = 'QUEUED'
+               AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'QUEUED') THEN
+                PERFORM pg_notify('jobs_queued', NEW.job_id);
+            ELSIF TG_OP = 'UPDATE'
+               AND OLD.status = 'PROCESSING'
+               AND NEW.status <> 'PROCESSING' THEN
+                PERFORM pg_notify('jobs_queued', '');
+            END IF;
+            RETURN NULL;
+        END;
+        $func$;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'jobs_queued_notify_trg'
+    ) THEN
+        CREATE TRIGGER jobs_queued_notify_trg
+            AFTER INSERT OR UPDATE OF status ON public.jobs
+            FOR EACH ROW
+            EXECUTE FUNCTION qd.qd_jobs_queued_notify_fn();
+    END IF;
+END $$;
@@ -0,0 +1,37 @@
+-- 0023_job_leases.sql
+-- Worker leases on PROCESSING jobs + index for the expired-lease reaper.
+--   leased_by        worker id holding the job
+--   lease_expires_at extended by /internal/heartbeat; reaper requeues past it
+--   attempts         incremented per claim; DEAD after the retry budget
+--   available_at     requeue backoff; claims skip jobs not yet due
+DO $$
+BEGIN
+    IF to_regclass('public.jobs') IS NULL THEN
+        RAISE NOTICE 'public.jobs does not exist, skipping 0023_job_leases';
+        RETURN;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name   = 'jobs'
+          AND column_name  = 'leased_by'
+    ) THEN
+        ALTER TABLE public.jobs
+            ADD COLUMN leased_by        text,
+            ADD COLUMN lease_expires_at timestamptz,
+            ADD COLUMN attempts         integer NOT NULL DEFAULT 0,
+            ADD COLUMN available_at     timestamptz;
+    END IF;
+
+    -- Reaper scans oldest-expired first, bounded per sweep
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'jobs_lease_expiry_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX jobs_lease_expiry_idx
+            ON public.jobs(lease_expires_at)
+            WHERE status = 'PROCESSING';
+    END IF;
+END $$;
@@ -0,0 +1,18 @@
+-- 0024_proofs_sha_index.sql
+-- Lookup of a proof by manifest hash (/verify/{sha}) without a table scan.
+-- Hashes are stored as lowercase hex; callers lower() the probe.
+DO $$
+BEGIN
+    IF to_regclass('public.proofs') IS NULL THEN
+        RAISE NOTICE 'public.proofs does not exist, skipping 0024_proofs_sha_index';
+        RETURN;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'proofs_manifest_sha256_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX proofs_manifest_sha256_idx
+            ON public.proofs(manifest_sha256);
+    END IF;
+END $$;
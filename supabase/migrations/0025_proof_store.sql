@@ -0,0 +1,113 @@
+-- 0025_proof_store.sql
+-- Postgres backend for api.utils.proof_backend (PROOF_STORE=postgres).
+--   proofs.record     full proof record (batch fields, inclusion path, ...);
+--                     status / manifest_sha256 / tsa_ok stay typed columns
+--   proofs.batch_id   Merkle batch membership
+--   proof_batches     Merkle batch records (leaves, root, TSQ/TSR)
+-- Proof writes from the batcher and public routes carry no qd.customer_code,
+-- so the proofs audit trigger falls back to the job's customer. A DELETE
+-- logs the proof and job ids in details (audit_logs.proof_id / job_id would
+-- dangle); one cascaded from a job delete has no customer and is not logged.
+DO $$
+BEGIN
+    IF to_regclass('public.proofs') IS NULL THEN
+        RAISE NOTICE 'public.proofs does not exist, skipping 0025_proof_store';
+        RETURN;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name   = 'proofs'
+          AND column_name  = 'record'
+    ) THEN
+        ALTER TABLE public.proofs
+            ADD COLUMN batch_id text,
+            ADD COLUMN record   jsonb NOT NULL DEFAULT '{}'::jsonb;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'proofs_batch_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX proofs_batch_idx
+            ON public.proofs(batch_id)
+            WHERE batch_id IS NOT NULL;
+    END IF;
+
+    IF to_regclass('public.proof_batches') IS NULL THEN
+        CREATE TABLE public.proof_batches (
+            batch_id    text PRIMARY KEY,
+            status      text NOT NULL DEFAULT 'OPEN',   -- OPEN | SEALED | TSA_OK
+            record      jsonb NOT NULL,
+            created_at  timestamptz NOT NULL DEFAULT now(),
+            updated_at  timestamptz NOT NULL DEFAULT now()
+        );
+    END IF;
+
+    -- Startup recovery looks for OPEN batches only
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'proof_batches_status_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX proof_batches_status_idx
+            ON public.proof_batches(status)
+            WHERE status <> 'TSA_OK';
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    IF to_regprocedure('qd.qd_proofs_audit_trigger_fn()') IS NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE OR REPLACE FUNCTION qd.qd_proofs_audit_trigger_fn()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $func$
+    DECLARE
+        v_customer_id uuid;
+        v_job_id      uuid;
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_proc
+            WHERE proname = 'qd_customer_id'
+              AND pronamespace = 'qd'::regnamespace
+        ) THEN
+            v_customer_id := qd.qd_customer_id();
+        END IF;
+
+        v_job_id := COALESCE(NEW.job_id, OLD.job_id);
+
+        IF v_customer_id IS NULL THEN
+            SELECT j.customer_id INTO v_customer_id
+            FROM public.jobs j
+            WHERE j.id = v_job_id;
+        END IF;
+
+        -- cascaded from a job delete: nothing left to attribute it to
+        IF v_customer_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        PERFORM qd.qd_add_audit_log(
+            v_customer_id,
+            current_user,
+            'user',
+            'proof_change',
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE v_job_id END,
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.id END,
+            NULL,
+            jsonb_build_object(
+                'op', TG_OP,
+                'proof_id', COALESCE(NEW.id, OLD.id),
+                'job_id', v_job_id
+            )
+        );
+
+        RETURN NULL;
+    END;
+    $func$;
+END $$;
@@ -0,0 +1,35 @@
+-- 0027_jobs_keyset_idx.sql
+-- Keyset pagination for GET /jobs: newest first by (created_at, id) within
+-- a customer, optionally filtered by status. Deep pages are a range scan
+-- starting at the cursor instead of an OFFSET. created_at becomes NOT NULL:
+-- a NULL would sort first under DESC, drop out of the (created_at, id) row
+-- comparison and could not be encoded in a cursor.
+DO $$
+BEGIN
+    IF to_regclass('public.jobs') IS NULL THEN
+        RAISE NOTICE 'public.jobs does not exist, skipping 0027_jobs_keyset_idx';
+        RETURN;
+    END IF;
+
+    UPDATE public.jobs
+       SET created_at = COALESCE(updated_at, now())
+     WHERE created_at IS NULL;
+    ALTER TABLE public.jobs ALTER COLUMN created_at SET DEFAULT now();
+    ALTER TABLE public.jobs ALTER COLUMN created_at SET NOT NULL;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'jobs_customer_created_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX jobs_customer_created_idx
+            ON public.jobs(customer_id, created_at DESC, id DESC);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'jobs_customer_status_created_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX jobs_customer_status_created_idx
+            ON public.jobs(customer_id, status, created_at DESC, id DESC);
+    END IF;
+END $$;
@@ -0,0 +1,107 @@
+-- 0028_kdm_batch_issue.sql
+-- Batch KDM issuance (POST /issue/batch) writes one kdms row per cinema
+-- certificate, grouped by kdm_batches (0014):
+--   - a job has many KDMs, so the one-row-per-job constraint from 0003 goes
+--   - kdms gains the fields the API returns (fingerprint, key, CPL, delivery)
+--   - kdm_batches gains completed_at
+--   - the kdms audit trigger falls back to the job's customer and logs
+--     DELETEs by id in details (audit_logs.kdm_id would dangle)
+DO $$
+BEGIN
+    IF to_regclass('public.kdms') IS NULL THEN
+        RAISE NOTICE 'public.kdms does not exist, skipping 0028_kdm_batch_issue';
+        RETURN;
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'kdms_job_unique'
+          AND conrelid = 'public.kdms'::regclass
+    ) THEN
+        ALTER TABLE public.kdms DROP CONSTRAINT kdms_job_unique;
+    END IF;
+    -- 0003 accepts a bare unique index of the same name as well
+    DROP INDEX IF EXISTS public.kdms_job_unique;
+
+    IF NOT EXISTS (
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name   = 'kdms'
+          AND column_name  = 'cert_fingerprint'
+    ) THEN
+        ALTER TABLE public.kdms
+            ADD COLUMN cert_fingerprint text,
+            ADD COLUMN key_id           text,
+            ADD COLUMN cpl_id           text,
+            ADD COLUMN delivered        boolean NOT NULL DEFAULT false;
+    END IF;
+
+    IF to_regclass('public.kdm_batches') IS NOT NULL AND NOT EXISTS (
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name   = 'kdm_batches'
+          AND column_name  = 'completed_at'
+    ) THEN
+        ALTER TABLE public.kdm_batches
+            ADD COLUMN completed_at timestamptz;
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    IF to_regprocedure('qd.qd_kdms_audit_trigger_fn()') IS NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE OR REPLACE FUNCTION qd.qd_kdms_audit_trigger_fn()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $func$
+    DECLARE
+        v_customer_id uuid;
+        v_job_id      uuid;
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_proc
+            WHERE proname = 'qd_customer_id'
+              AND pronamespace = 'qd'::regnamespace
+        ) THEN
+            v_customer_id := qd.qd_customer_id();
+        END IF;
+
+        v_job_id := COALESCE(NEW.job_id, OLD.job_id);
+
+        IF v_customer_id IS NULL THEN
+            SELECT j.customer_id INTO v_customer_id
+            FROM public.jobs j
+            WHERE j.id = v_job_id;
+        END IF;
+
+        -- cascaded from a job delete: nothing left to attribute it to
+        IF v_customer_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        PERFORM qd.qd_add_audit_log(
+            v_customer_id,
+            current_user,
+            'user',
+            'kdm_change',
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE v_job_id END,
+            NULL,
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.id END,
+            jsonb_build_object(
+                'op', TG_OP,
+                'kdm_id', COALESCE(NEW.id, OLD.id),
+                'batch_id', COALESCE(NEW.batch_id, OLD.batch_id),
+                'valid_from', COALESCE(NEW.valid_from, OLD.valid_from),
+                'valid_until', COALESCE(NEW.valid_until, OLD.valid_until)
+            )
+        );
+
+        RETURN NULL;
+    END;
+    $func$;
+END $$;
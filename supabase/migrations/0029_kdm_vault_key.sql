@@ -0,0 +1,22 @@
+-- 0029_kdm_vault_key.sql
+-- With KDM_ENGINE=crypto every issued KDM has signed XML in the vault
+-- bucket; kdms.vault_key is its object key (kdm/<job_id>/<kdm_id>.xml).
+-- NULL for stub-issued KDMs.
+DO $$
+BEGIN
+    IF to_regclass('public.kdms') IS NULL THEN
+        RAISE NOTICE 'public.kdms does not exist, skipping 0029_kdm_vault_key';
+        RETURN;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name   = 'kdms'
+          AND column_name  = 'vault_key'
+    ) THEN
+        ALTER TABLE public.kdms
+            ADD COLUMN vault_key text;
+    END IF;
+END $$;
@@ -0,0 +1,32 @@
+-- 0030_kdm_certificates.sql
+-- Registry of recipient (projector / IMB) certificates for KDM issuance
+-- (api.utils.kdm_certs). Keyed by cert_fingerprint as stored on kdms rows
+-- (sha256 of the PEM), so /issue and /issue/batch can reference a
+-- certificate by fingerprint and skip parsing it again. Certificates are
+-- public and shared across customers, so the table has no customer_id.
+-- Rows are written once and never updated.
+DO $$
+BEGIN
+    IF to_regclass('public.kdm_certificates') IS NULL THEN
+        CREATE TABLE public.kdm_certificates (
+            fingerprint     text PRIMARY KEY,
+            cn              text,
+            subject         text NOT NULL,
+            issuer          text NOT NULL,
+            serial          text NOT NULL,           -- decimal; can exceed bigint
+            not_before      timestamptz NOT NULL,
+            not_after       timestamptz NOT NULL,
+            public_key_der  bytea NOT NULL,          -- SubjectPublicKeyInfo
+            cert_pem        text NOT NULL,
+            created_at      timestamptz NOT NULL DEFAULT now()
+        );
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'kdm_certificates_cn_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX kdm_certificates_cn_idx
+            ON public.kdm_certificates(cn);
+    END IF;
+END $$;
@@ -0,0 +1,32 @@
+-- 0031_kdms_valid_until_idx.sql
+-- Keyset listing of KDMs (GET /kdms, GET /kdms/expiring), ordered by
+-- (valid_until, id):
+--   kdms_job_valid_until_idx   one job's KDMs, optionally in a window;
+--                              its job_id prefix replaces kdms_job_idx
+--   kdms_valid_until_idx       "what expires in the next N hours" across
+--                              all jobs, without touching manifests
+DO $$
+BEGIN
+    IF to_regclass('public.kdms') IS NULL THEN
+        RAISE NOTICE 'public.kdms does not exist, skipping 0031_kdms_valid_until_idx';
+        RETURN;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'kdms_job_valid_until_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX kdms_job_valid_until_idx
+            ON public.kdms(job_id, valid_until, id);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'kdms_valid_until_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX kdms_valid_until_idx
+            ON public.kdms(valid_until, id);
+    END IF;
+
+    DROP INDEX IF EXISTS public.kdms_job_idx;
+END $$;
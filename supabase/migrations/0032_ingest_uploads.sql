@@ -0,0 +1,33 @@
+-- 0032_ingest_uploads.sql
+-- Uploads started through /upload/init, with the SHA-256 the client claimed
+-- (at /init or /complete) and the outcome of the ingest verification that
+-- /complete starts automatically. claim_jobs skips jobs whose
+-- profile.input_key names an upload that is not VERIFIED, so an asset
+-- uploaded here is never rendered before its digest has been confirmed.
+-- Object keys are global (ingest/<filename>); 0037 records the uploading
+-- customer and scopes the gate to its jobs.
+DO $$
+BEGIN
+    IF to_regclass('public.ingest_uploads') IS NULL THEN
+        CREATE TABLE public.ingest_uploads (
+            key             text PRIMARY KEY,
+            upload_id       text,
+            size            bigint,
+            claimed_sha256  text,
+            status          text NOT NULL DEFAULT 'PENDING',  -- PENDING | VERIFIED | MISMATCH | ERROR
+            ingest          jsonb,                            -- last verification record
+            created_at      timestamptz NOT NULL DEFAULT now(),
+            updated_at      timestamptz NOT NULL DEFAULT now()
+        );
+    END IF;
+
+    -- jobs referencing an upload, for the claim gate and result fan-out
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'jobs_input_key_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX jobs_input_key_idx
+            ON public.jobs ((profile->>'input_key'))
+            WHERE (profile->>'input_key') IS NOT NULL;
+    END IF;
+END $$;
@@ -0,0 +1,19 @@
+-- 0033_kdms_job_unique_index.sql
+-- 0028 dropped kdms_job_unique only when it was a constraint; 0003 also
+-- accepts a bare unique index of that name, which still allowed a single
+-- KDM per job. Drop it for databases that already ran 0028.
+DO $$
+BEGIN
+    IF to_regclass('public.kdms') IS NULL THEN
+        RETURN;
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'kdms_job_unique'
+          AND conrelid = 'public.kdms'::regclass
+    ) THEN
+        ALTER TABLE public.kdms DROP CONSTRAINT kdms_job_unique;
+    END IF;
+    DROP INDEX IF EXISTS public.kdms_job_unique;
+END $$;
@@ -0,0 +1,15 @@
+-- 0034_jobs_created_at_not_null.sql
+-- 0027 now makes jobs.created_at NOT NULL (the GET /jobs keyset cursor
+-- cannot represent NULL); apply it to databases that already ran 0027.
+DO $$
+BEGIN
+    IF to_regclass('public.jobs') IS NULL THEN
+        RETURN;
+    END IF;
+
+    UPDATE public.jobs
+       SET created_at = COALESCE(updated_at, now())
+     WHERE created_at IS NULL;
+    ALTER TABLE public.jobs ALTER COLUMN created_at SET DEFAULT now();
+    ALTER TABLE public.jobs ALTER COLUMN created_at SET NOT NULL;
+END $$;
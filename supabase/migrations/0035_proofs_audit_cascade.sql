@@ -0,0 +1,61 @@
+-- 0035_proofs_audit_cascade.sql
+-- The proofs audit trigger from 0025 logged a proof deleted by a job delete
+-- cascade with no customer and the (gone) job id, violating
+-- audit_logs.customer_id NOT NULL and the job foreign key, so deleting any
+-- job with a proof failed. Skip such deletes (as 0028 does for kdms) and
+-- keep the job id of a logged DELETE in details only. Re-applied here for
+-- databases that already ran 0025.
+DO $$
+BEGIN
+    IF to_regprocedure('qd.qd_proofs_audit_trigger_fn()') IS NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE OR REPLACE FUNCTION qd.qd_proofs_audit_trigger_fn()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $func$
+    DECLARE
+        v_customer_id uuid;
+        v_job_id      uuid;
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_proc
+            WHERE proname = 'qd_customer_id'
+              AND pronamespace = 'qd'::regnamespace
+        ) THEN
+            v_customer_id := qd.qd_customer_id();
+        END IF;
+
+        v_job_id := COALESCE(NEW.job_id, OLD.job_id);
+
+        IF v_customer_id IS NULL THEN
+            SELECT j.customer_id INTO v_customer_id
+            FROM public.jobs j
+            WHERE j.id = v_job_id;
+        END IF;
+
+        -- cascaded from a job delete: nothing left to attribute it to
+        IF v_customer_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        PERFORM qd.qd_add_audit_log(
+            v_customer_id,
+            current_user,
+            'user',
+            'proof_change',
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE v_job_id END,
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.id END,
+            NULL,
+            jsonb_build_object(
+                'op', TG_OP,
+                'proof_id', COALESCE(NEW.id, OLD.id),
+                'job_id', v_job_id
+            )
+        );
+
+        RETURN NULL;
+    END;
+    $func$;
+END $$;
@@ -0,0 +1,66 @@
+-- 0036_jobs_audit_lease.sql
+-- /internal/heartbeat extends lease_expires_at on every in-flight job every
+-- few seconds. The jobs audit trigger (0021) logged each of those as a
+-- job_update; skip updates that change nothing but lease_expires_at /
+-- updated_at.
+DO $$
+BEGIN
+    IF to_regprocedure('qd.qd_jobs_audit_trigger_fn()') IS NULL THEN
+        RAISE NOTICE 'qd.qd_jobs_audit_trigger_fn does not exist, skipping 0036_jobs_audit_lease';
+        RETURN;
+    END IF;
+
+    CREATE OR REPLACE FUNCTION qd.qd_jobs_audit_trigger_fn()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $func$
+    DECLARE
+        v_customer_id uuid;
+        v_event_type  text;
+        v_row         public.jobs;
+    BEGIN
+        -- heartbeats only move the lease; not an auditable change
+        IF TG_OP = 'UPDATE'
+           AND to_jsonb(NEW) - 'lease_expires_at' - 'updated_at'
+             = to_jsonb(OLD) - 'lease_expires_at' - 'updated_at' THEN
+            RETURN NULL;
+        END IF;
+
+        IF TG_OP = 'INSERT' THEN
+            v_event_type := 'job_insert';
+            v_row := NEW;
+        ELSIF TG_OP = 'UPDATE' THEN
+            v_event_type := 'job_update';
+            v_row := NEW;
+        ELSE
+            v_event_type := 'job_delete';
+            v_row := OLD;
+        END IF;
+
+        IF EXISTS (
+            SELECT 1 FROM pg_proc
+            WHERE proname = 'qd_customer_id'
+              AND pronamespace = 'qd'::regnamespace
+        ) THEN
+            v_customer_id := qd.qd_customer_id();
+        END IF;
+        v_customer_id := COALESCE(v_customer_id, v_row.customer_id);
+
+        PERFORM qd.qd_add_audit_log(
+            v_customer_id,
+            current_user,
+            'user',
+            v_event_type,
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE v_row.id END,
+            NULL,
+            NULL,
+            jsonb_build_object(
+                'status', v_row.status,
+                'job_code', v_row.job_id
+            )
+        );
+
+        RETURN NULL;
+    END;
+    $func$;
+END $$;
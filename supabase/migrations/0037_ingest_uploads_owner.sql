@@ -0,0 +1,74 @@
+-- 0037_ingest_uploads_owner.sql
+-- Scope ingest verification to the customer that started the upload, and
+-- make sure no job waits forever on a verification that cannot succeed.
+--   customer_id   uploader (X-QD-Customer at /upload/init); only its jobs are
+--                 gated, updated or failed by the outcome. NULL for uploads
+--                 registered before this migration (any customer, as before)
+--   attempts      verifications that ended in ERROR (transient S3 failures)
+--   retry_at      when the reaper re-runs an ERROR verification; NULL once
+--                 the attempts are used up and the upload is FAILED
+-- status gains FAILED. A job queued against an upload that is already
+-- MISMATCH or FAILED is failed on insert with the upload's ingest record.
+DO $$
+BEGIN
+    IF to_regclass('public.ingest_uploads') IS NULL THEN
+        RAISE NOTICE 'public.ingest_uploads does not exist, skipping 0037_ingest_uploads_owner';
+        RETURN;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name   = 'ingest_uploads'
+          AND column_name  = 'customer_id'
+    ) THEN
+        ALTER TABLE public.ingest_uploads
+            ADD COLUMN customer_id uuid REFERENCES public.customers(id) ON DELETE CASCADE,
+            ADD COLUMN attempts    integer NOT NULL DEFAULT 0,
+            ADD COLUMN retry_at    timestamptz;
+    END IF;
+
+    -- ERROR verifications due for a retry, oldest first
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'ingest_uploads_retry_idx' AND relkind = 'i'
+    ) THEN
+        CREATE INDEX ingest_uploads_retry_idx
+            ON public.ingest_uploads(retry_at)
+            WHERE status = 'ERROR' AND retry_at IS NOT NULL;
+    END IF;
+
+    CREATE OR REPLACE FUNCTION qd.qd_jobs_ingest_gate_fn()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $func$
+    DECLARE
+        v_ingest jsonb;
+    BEGIN
+        IF NEW.status <> 'QUEUED' THEN
+            RETURN NEW;
+        END IF;
+
+        SELECT u.ingest INTO v_ingest
+        FROM public.ingest_uploads u
+        WHERE u.key = NEW.profile->>'input_key'
+          AND u.status IN ('MISMATCH', 'FAILED')
+          AND (u.customer_id IS NULL OR u.customer_id = NEW.customer_id);
+
+        IF FOUND THEN
+            NEW.status := 'FAIL';
+            NEW.manifest := jsonb_set(COALESCE(NEW.manifest, '{}'::jsonb), '{ingest}', COALESCE(v_ingest, 'null'::jsonb));
+        END IF;
+        RETURN NEW;
+    END;
+    $func$;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'jobs_ingest_gate_trg') THEN
+        CREATE TRIGGER jobs_ingest_gate_trg
+            BEFORE INSERT ON public.jobs
+            FOR EACH ROW
+            WHEN (NEW.profile ? 'input_key')
+            EXECUTE FUNCTION qd.qd_jobs_ingest_gate_fn();
+    END IF;
+END $$;
@@ -0,0 +1,70 @@
+"""
+Shared fixtures
+
+Database tests run against a migrated Postgres named by QD_TEST_DATABASE_URL
+(e.g. supabase start, or a scratch database with supabase/migrations
+applied) and are skipped when it is not set. They only touch customers,
+jobs and upload keys starting with "pytest-"; their jobs are queued at a
+priority above anything else so claims in a shared database pick them first.
+
+Environment
+-----------
+QD_TEST_DATABASE_URL   DSN of a migrated scratch database (unset = skip DB tests)
+"""
+import os
+
+import pytest
+
+TEST_DB_URL = os.getenv("QD_TEST_DATABASE_URL")
+
+
+def _cleanup(conn) -> None:
+    conn.execute("delete from jobs where job_id like 'pytest-%'")
+    conn.execute("delete from ingest_uploads where key like 'pytest-%'")
+    conn.execute("delete from customers where code like 'pytest-%'")
+
+
+@pytest.fixture
+def pg():
+    """psycopg connection (autocommit) to the test database."""
+    if not TEST_DB_URL:
+        pytest.skip("QD_TEST_DATABASE_URL not set")
+    psycopg = pytest.importorskip("psycopg")
+    try:
+        conn = psycopg.connect(TEST_DB_URL, autocommit=True)
+    except psycopg.OperationalError as e:
+        pytest.skip(f"test database unreachable: {e}")
+    if conn.execute("select to_regclass('public.jobs')").fetchone()[0] is None:
+        conn.close()
+        pytest.skip("test database is not migrated")
+    _cleanup(conn)
+    try:
+        yield conn
+    finally:
+        _cleanup(conn)
+        conn.close()
+
+
+@pytest.fixture
+def db(pg):
+    from api.utils.db import DB
+
+    return DB(pg)
+
+
+@pytest.fixture
+def customer(pg):
+    """Code of a fresh customer."""
+    pg.execute("insert into customers(code, name) values ('pytest-a', 'pytest-a')")
+    return "pytest-a"
+
+
+@pytest.fixture
+def queue(db, pg):
+    """queue(customer, job_ids) -> insert QUEUED jobs ahead of any other work."""
+
+    def _queue(customer, job_ids, profile=None):
+        db.insert_jobs(customer, [(j, dict(profile or {})) for j in job_ids])
+        pg.execute("update jobs set priority = 1000 where job_id = any(%s)", (list(job_ids),))
+
+    return _queue
@@ -0,0 +1,39 @@
+"""Throwaway certificates for the KDM tests."""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509.oid import NameOID
+
+
+def rsa_key(bits: int = 2048) -> rsa.RSAPrivateKey:
+    return rsa.generate_private_key(public_exponent=65537, key_size=bits)
+
+
+def cert(cn: str, key, issuer_key=None, issuer: Optional[x509.Certificate] = None, days: int = 3) -> x509.Certificate:
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+    now = datetime.now(timezone.utc)
+    return (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(issuer.subject if issuer is not None else name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=days))
+        .sign(issuer_key or key, hashes.SHA256())
+    )
+
+
+def pem(*certs: x509.Certificate) -> str:
+    return "".join(c.public_bytes(Encoding.PEM).decode() for c in certs)
+
+
+def write_signer(tmp_path, key, crt) -> tuple:
+    kp, cp = tmp_path / "signer.key", tmp_path / "signer.crt"
+    kp.write_bytes(key.private_bytes(Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    cp.write_bytes(crt.public_bytes(Encoding.PEM))
+    return str(kp), str(cp)
@@ -0,0 +1,100 @@
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from api.utils.job_repo import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("ts", [
+    datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc),
+    datetime(2026, 3, 1, 12, 0, 0, 123456, tzinfo=timezone.utc),
+    datetime(2026, 3, 1, 14, 0, 0, 1, tzinfo=timezone(timedelta(hours=2))),
+])
+def test_cursor_round_trip(ts):
+    key = (ts, str(uuid.uuid4()))
+    cur = encode_cursor(key)
+    assert "=" not in cur and "/" not in cur and "+" not in cur
+    assert decode_cursor(cur) == key
+
+
+@pytest.mark.parametrize("bad", [
+    "",
+    "not-base64!",
+    encode_cursor((datetime.now(timezone.utc), str(uuid.uuid4())))[:-3],
+    "WyIyMDI2LTAxLTAxIiwgIm5vdC1hLXV1aWQiXQ",  # ["2026-01-01", "not-a-uuid"]
+    "eyJhIjogMX0",  # {"a": 1}
+])
+def test_malformed_cursor_is_value_error(bad):
+    with pytest.raises(ValueError, match="invalid cursor"):
+        decode_cursor(bad)
+
+
+def test_job_pages_via_cursor(db, pg, customer, queue):
+    ids = [f"pytest-c{i}" for i in range(7)]
+    queue(customer, ids)
+    # pairs share a created_at so the id tiebreak is exercised
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i, job_id in enumerate(ids):
+        pg.execute("update jobs set created_at = %s where job_id = %s", (base + timedelta(seconds=i // 2), job_id))
+
+    seen, after = [], None
+    while True:
+        rows = db.list_jobs(customer, 3, ("job_id",), after=after)
+        seen += [r["job_id"] for r in rows]
+        if len(rows) < 3:
+            break
+        after = decode_cursor(encode_cursor(rows[-1]["_key"]))
+    assert sorted(seen) == sorted(ids) and len(seen) == len(set(seen))
+    order = pg.execute(
+        "select job_id from jobs where job_id = any(%s) order by created_at desc, id desc", (ids,)
+    ).fetchall()
+    assert seen == [r[0] for r in order]
+
+
+def test_kdm_pages_via_cursor(db, pg, customer, queue, monkeypatch):
+    from api.routes import kdm as kdm_routes
+
+    queue(customer, ["pytest-k0", "pytest-k1"])
+    jobs = dict(pg.execute("select job_id, id from jobs where job_id like 'pytest-k%'").fetchall())
+    # pairs share a valid_until so the id tiebreak is exercised
+    base = datetime(2027, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        (uuid.uuid4(), jobs[f"pytest-k{i % 2}"], None, f"SCR-{i}", f"fp{i}", "key", None,
+         base - timedelta(days=1), base + timedelta(hours=i // 2), None)
+        for i in range(9)
+    ]
+    db.kdm_copy(None, rows)
+
+    @contextmanager
+    def session(*_):
+        yield db
+
+    monkeypatch.setattr(kdm_routes, "session", session)
+    seen, cursor = [], None
+    while True:
+        page = kdm_routes._page(customer, 4, cursor)
+        seen += [i.kdm_id for i in page.items]
+        assert page.next_cursor is None or len(page.items) == 4
+        if page.next_cursor is None:
+            break
+        assert decode_cursor(page.next_cursor) == (
+            datetime.fromisoformat(page.items[-1].valid_until.replace("Z", "+00:00")), page.items[-1].kdm_id
+        )
+        cursor = page.next_cursor
+    expected = sorted(rows, key=lambda r: (r[8], str(r[0])))
+    assert seen == [str(r[0]) for r in expected]
+
+    # filters carry through the cursor
+    first = kdm_routes._page(customer, 2, None, job_id="pytest-k1")
+    rest = kdm_routes._page(customer, 10, first.next_cursor, job_id="pytest-k1")
+    assert [i.kdm_id for i in first.items + rest.items] == [str(r[0]) for r in expected if r[1] == jobs["pytest-k1"]]
+
+
+def test_job_created_at_is_never_null(pg, customer, queue):
+    # a NULL created_at would sort first and fall out of the keyset comparison
+    psycopg = pytest.importorskip("psycopg")
+    queue(customer, ["pytest-n0"])
+    with pytest.raises(psycopg.errors.NotNullViolation):
+        pg.execute("update jobs set created_at = null where job_id = 'pytest-n0'")
@@ -0,0 +1,140 @@
+import base64
+import hashlib
+from contextlib import contextmanager
+
+import pytest
+from botocore.exceptions import ClientError
+
+DATA = b"quickdcp" * 1000
+SHA = hashlib.sha256(DATA).hexdigest()
+KEY = "pytest-ingest/feature.mxf"
+
+
+class _S3:
+    """head_object with a full-object checksum: verification reads no bytes."""
+
+    def head_object(self, **kw):
+        chk = base64.b64encode(hashlib.sha256(DATA).digest()).decode()
+        return {"ContentLength": len(DATA), "ETag": '"e1"', "ChecksumSHA256": chk}
+
+
+@pytest.fixture
+def upload_stream(db, monkeypatch):
+    from api.routes import upload_stream
+
+    @contextmanager
+    def session(customer_code=None):
+        yield db
+
+    monkeypatch.setattr(upload_stream, "session", session)
+    monkeypatch.setattr(upload_stream, "S3", _S3())
+    return upload_stream
+
+
+class _BrokenS3:
+    def head_object(self, **kw):
+        raise ClientError({"Error": {"Code": "SlowDown", "Message": "slow down"}}, "HeadObject")
+
+
+def _status(pg, job_id):
+    return pg.execute("select status, manifest->'ingest' from jobs where job_id = %s", (job_id,)).fetchone()
+
+
+def test_unverified_upload_is_not_claimed(db, customer, queue, upload_stream):
+    db.ingest_upload_init(KEY, "u1", len(DATA), SHA, customer)
+    queue(customer, ["pytest-i1"], {"input_key": KEY})
+    assert [j for j in db.claim_jobs(5) if j[0] == "pytest-i1"] == []
+
+    rec = upload_stream.verify_upload(KEY)
+    assert rec["match"] is True and rec["sha256"] == SHA
+    assert db.ingest_upload_get(KEY)["status"] == "VERIFIED"
+    assert "pytest-i1" in [j[0] for j in db.claim_jobs(5)]
+
+
+def test_claim_from_complete_is_checked(db, pg, customer, queue, upload_stream):
+    db.ingest_upload_init(KEY, "u1", len(DATA), None, customer)
+    queue(customer, ["pytest-i2"], {"input_key": KEY})
+    assert db.ingest_upload_complete(KEY, "AB" * 32, customer)["claimed_sha256"] == "ab" * 32
+
+    upload_stream._auto_verify(KEY)
+    assert db.ingest_upload_get(KEY)["status"] == "MISMATCH"
+    status, ingest = _status(pg, "pytest-i2")
+    assert status == "FAIL"
+    assert ingest["match"] is False and ingest["sha256"] == SHA
+
+
+def test_jobs_without_upload_record_are_claimable(db, customer, queue):
+    queue(customer, ["pytest-i3"], {"input_key": "pytest-ingest/external.mxf"})
+    assert "pytest-i3" in [j[0] for j in db.claim_jobs(5)]
+
+
+@pytest.fixture
+def other(pg):
+    pg.execute("insert into customers(code, name) values ('pytest-b', 'pytest-b')")
+    return "pytest-b"
+
+
+def test_caller_sha_is_reported_not_stored(db, pg, customer, queue, upload_stream):
+    from fastapi import HTTPException
+
+    db.ingest_upload_init(KEY, "u1", len(DATA), SHA, customer)
+    queue(customer, ["pytest-i4"], {"input_key": KEY})
+    with pytest.raises(HTTPException) as e:
+        upload_stream.verify_ingest(upload_stream.VerifyReq(key=KEY, sha256="00" * 32), None)
+    assert e.value.status_code == 409
+    assert db.ingest_upload_get(KEY)["status"] == "VERIFIED"
+    assert db.ingest_upload_get(KEY)["claimed_sha256"] == SHA
+    assert _status(pg, "pytest-i4")[0] == "QUEUED"
+
+
+def test_outcome_only_reaches_the_uploaders_jobs(db, pg, customer, other, queue, upload_stream):
+    db.ingest_upload_init(KEY, "u1", len(DATA), "00" * 32, customer)
+    queue(customer, ["pytest-i5"], {"input_key": KEY})
+    queue(other, ["pytest-i6"], {"input_key": KEY})
+    assert "pytest-i6" in [j[0] for j in db.claim_jobs(5)]  # not gated by someone else's upload
+    assert db.ingest_upload_complete(KEY, SHA, other) is None  # nor can they change the claim
+
+    upload_stream._auto_verify(KEY)
+    assert db.ingest_upload_get(KEY)["status"] == "MISMATCH"
+    assert _status(pg, "pytest-i5")[0] == "FAIL"
+    assert _status(pg, "pytest-i6")[0] == "PROCESSING"
+
+
+def test_job_queued_after_mismatch_fails(db, pg, customer, queue, upload_stream):
+    db.ingest_upload_init(KEY, "u1", len(DATA), "00" * 32, customer)
+    upload_stream._auto_verify(KEY)
+    queue(customer, ["pytest-i7"], {"input_key": KEY})
+    status, ingest = _status(pg, "pytest-i7")
+    assert status == "FAIL" and ingest["match"] is False
+
+
+def test_errored_verification_is_retried(db, pg, customer, queue, upload_stream, monkeypatch):
+    db.ingest_upload_init(KEY, "u1", len(DATA), SHA, customer)
+    queue(customer, ["pytest-i8"], {"input_key": KEY})
+    monkeypatch.setattr(upload_stream, "S3", _BrokenS3())
+    upload_stream._auto_verify(KEY)
+    assert db.ingest_upload_get(KEY)["status"] == "ERROR"
+    assert upload_stream.retry_errored_uploads() == []  # not due yet
+
+    pg.execute("update ingest_uploads set retry_at = now() where key = %s", (KEY,))
+    monkeypatch.setattr(upload_stream, "S3", _S3())
+    assert upload_stream.retry_errored_uploads() == [KEY]
+    assert db.ingest_upload_get(KEY)["status"] == "VERIFIED"
+    assert "pytest-i8" in [j[0] for j in db.claim_jobs(5)]
+
+
+def test_verification_gives_up_after_attempts(db, pg, customer, queue, upload_stream, monkeypatch):
+    from api.utils import db as dbm
+
+    monkeypatch.setattr(dbm, "INGEST_VERIFY_ATTEMPTS", 2)
+    monkeypatch.setattr(upload_stream, "S3", _BrokenS3())
+    db.ingest_upload_init(KEY, "u1", len(DATA), SHA, customer)
+    queue(customer, ["pytest-i9"], {"input_key": KEY})
+    upload_stream._auto_verify(KEY)
+    pg.execute("update ingest_uploads set retry_at = now() where key = %s", (KEY,))
+    upload_stream.retry_errored_uploads()
+    assert db.ingest_upload_get(KEY)["status"] == "FAILED"
+    status, ingest = _status(pg, "pytest-i9")
+    assert status == "FAIL" and "slow down" in ingest["error"]
+    queue(customer, ["pytest-i10"], {"input_key": KEY})
+    assert _status(pg, "pytest-i10")[0] == "FAIL"
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from api.utils.db import DB
+
+
+def _capped(db, queue, customer, n, cap):
+    db.conn.execute(
+        "insert into queue_configs(customer_id, max_concurrent_jobs) "
+        "select id, %s from customers where code = %s",
+        (cap, customer),
+    )
+    queue(customer, [f"pytest-{customer}-{i}" for i in range(n)])
+
+
+def _ours(claimed, customer):
+    return [c for c in claimed if c[0].startswith(f"pytest-{customer}-")]
+
+
+def _processing(pg, customer):
+    return pg.execute(
+        "select count(*) from jobs j join customers c on c.id = j.customer_id "
+        "where c.code = %s and j.status = 'PROCESSING'",
+        (customer,),
+    ).fetchone()[0]
+
+
+def test_claim_respects_cap(db, pg, customer, queue):
+    _capped(db, queue, customer, 6, cap=2)
+    assert len(_ours(db.claim_jobs(5, worker_id="w1"), customer)) == 2
+    assert _ours(db.claim_jobs(5, worker_id="w2"), customer) == []
+    assert _processing(pg, customer) == 2
+
+
+def test_concurrent_claimers_never_exceed_cap(db, pg, customer, queue):
+    psycopg = pytest.importorskip("psycopg")
+    _capped(db, queue, customer, 40, cap=3)
+    workers = 8
+    barrier = threading.Barrier(workers)
+    claimed, errors = [], []
+
+    def claim(n):
+        try:
+            with psycopg.connect(pg.info.dsn, password=pg.info.password) as conn:
+                barrier.wait()
+                with conn.transaction():
+                    claimed.extend(_ours(DB(conn).claim_jobs(2, worker_id=f"w{n}"), customer))
+        except Exception as e:  # surfaced below
+            errors.append(e)
+
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    # claimers that find the customer locked skip it, so fewer may win
+    assert 1 <= len(claimed) <= 3
+    assert _processing(pg, customer) == len(claimed)
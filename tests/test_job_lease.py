@@ -0,0 +1,102 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.routes import internal
+from api.utils import db as dbm
+
+
+def _job(pg, job_id):
+    return pg.execute(
+        "select status, leased_by from jobs where job_id = %s", (job_id,)
+    ).fetchone()
+
+
+def _expire(pg, job_id):
+    pg.execute(
+        "update jobs set lease_expires_at = now() - interval '1 second' where job_id = %s",
+        (job_id,),
+    )
+
+
+def test_lease_holder_finishes_job(db, pg, customer, queue):
+    queue(customer, ["pytest-l1"])
+    assert [j[0] for j in db.claim_jobs(1, worker_id="w1")] == ["pytest-l1"]
+    assert not db.update_job("pytest-l1", None, "PASS", worker_id="w2")
+    assert db.update_job("pytest-l1", {"ok": True}, "PASS", worker_id="w1")
+    assert _job(pg, "pytest-l1") == ("PASS", None)
+
+
+def test_late_report_after_requeue_is_rejected(db, pg, customer, queue):
+    queue(customer, ["pytest-l2"])
+    db.claim_jobs(1, worker_id="w1")
+    _expire(pg, "pytest-l2")
+    assert ("pytest-l2", "QUEUED", 1) in db.reap_expired_leases()
+    assert not db.update_job("pytest-l2", None, "PASS", worker_id="w1")
+    assert _job(pg, "pytest-l2") == ("QUEUED", None)
+
+
+def test_late_report_after_dead_letter_is_rejected(db, pg, customer, queue, monkeypatch):
+    monkeypatch.setattr(dbm, "JOB_MAX_ATTEMPTS", 1)
+    queue(customer, ["pytest-l3"])
+    db.claim_jobs(1, worker_id="w1")
+    _expire(pg, "pytest-l3")
+    assert ("pytest-l3", "DEAD", 1) in db.reap_expired_leases()
+    assert not db.update_job("pytest-l3", None, "FAIL", worker_id="w1")
+    assert _job(pg, "pytest-l3") == ("DEAD", None)
+
+
+def test_late_report_after_reclaim_is_rejected(db, pg, customer, queue):
+    queue(customer, ["pytest-l4"])
+    db.claim_jobs(1, worker_id="w1")
+    _expire(pg, "pytest-l4")
+    db.reap_expired_leases()
+    pg.execute("update jobs set available_at = null where job_id = 'pytest-l4'")
+    db.claim_jobs(1, worker_id="w2")
+    assert not db.update_job("pytest-l4", None, "FAIL", worker_id="w1")
+    assert db.update_job("pytest-l4", None, "PASS", worker_id="w2")
+
+
+def test_report_without_worker_id_still_needs_processing(db, pg, customer, queue):
+    queue(customer, ["pytest-l5", "pytest-l6"])
+    db.claim_jobs(2, worker_id="w1")
+    assert db.update_job("pytest-l5", None, "PASS")
+    assert _job(pg, "pytest-l5") == ("PASS", None)
+    _expire(pg, "pytest-l6")
+    db.reap_expired_leases()
+    assert not db.update_job("pytest-l6", None, "PASS")
+    assert _job(pg, "pytest-l6") == ("QUEUED", None)
+
+
+def test_heartbeat_extends_own_leases_only(db, pg, customer, queue):
+    queue(customer, ["pytest-l7"])
+    db.claim_jobs(1, worker_id="w1")
+    _expire(pg, "pytest-l7")
+    assert db.touch_jobs(["pytest-l7"], "w2") == []
+    assert db.touch_jobs(["pytest-l7"], "w1") == ["pytest-l7"]
+    assert "pytest-l7" not in [r[0] for r in db.reap_expired_leases()]
+
+
+def test_heartbeat_is_not_audited(db, pg, customer, queue):
+    queue(customer, ["pytest-l8"])
+    db.claim_jobs(1, worker_id="w1")
+    job = pg.execute("select id, updated_at from jobs where job_id = 'pytest-l8'").fetchone()
+
+    def audited():
+        return pg.execute("select count(*) from audit_logs where job_id = %s", (job[0],)).fetchone()[0]
+
+    before = audited()
+    db.touch_jobs(["pytest-l8"], "w1")
+    assert audited() == before
+    assert pg.execute("select updated_at from jobs where id = %s", (job[0],)).fetchone()[0] == job[1]
+    assert db.update_job("pytest-l8", None, "PASS", worker_id="w1")
+    assert audited() == before + 1
+
+
+@pytest.mark.parametrize("path", ["/internal/next-job", "/internal/update-job", "/internal/heartbeat"])
+def test_worker_id_is_required(path):
+    app = FastAPI()
+    app.include_router(internal.router)
+    app.dependency_overrides[dbm.get_db] = lambda: None
+    r = TestClient(app).post(path, json={"job_id": "pytest-x"}, headers={"x-worker-token": internal.WORKER_TOKEN})
+    assert r.status_code == 400 and "X-Worker-Id" in r.json()["detail"]
@@ -0,0 +1,29 @@
+import pytest
+
+from api.utils import kdm_certs
+from api.utils.kdm_crypto import KDMCryptoError
+from tests import pki
+
+
+@pytest.fixture(scope="module")
+def chains():
+    ca_key = pki.rsa_key()
+    ca = pki.cert("QD Test CA", ca_key)
+    leaf = pki.cert("SCR-1", pki.rsa_key(), ca_key, ca)
+    # same subject as the CA, different key: names chain but the signature does not
+    impostor = pki.cert("QD Test CA", pki.rsa_key())
+    return pki.pem(leaf, ca), pki.pem(leaf, impostor)
+
+
+def test_parse_checks_chain_signatures(chains):
+    good, forged = chains
+    assert kdm_certs.parse(good, "fp").cn == "SCR-1"
+    with pytest.raises(KDMCryptoError, match="not signed by its issuer"):
+        kdm_certs.parse(forged, "fp")
+
+
+def test_register_reports_forged_chain_per_pem(chains, monkeypatch):
+    registry = kdm_certs.CertRegistry(cache_size=0)
+    monkeypatch.setattr(registry, "_lookup", lambda fps: {})
+    (cert, err), = registry.register([chains[1]])
+    assert cert is None and "does not verify" in err
@@ -0,0 +1,134 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from api.utils import kdm_crypto as kc
+from tests import pki
+
+
+@pytest.fixture(scope="module")
+def signer_ca():
+    key = pki.rsa_key()
+    return key, pki.cert("QD Signer", key)
+
+
+@pytest.fixture
+def engine(tmp_path, signer_ca):
+    eng = kc.CryptoEngine(*pki.write_signer(tmp_path, *signer_ca), workers=1, bucket="")
+    yield eng
+    eng.close()
+
+
+@pytest.fixture
+def ctx():
+    t0 = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(minutes=1)
+    ck = kc.ContentKey(str(uuid.uuid4()), "MDIK", os.urandom(16))
+    return kc.KDMContext("pytest-kdm", str(uuid.uuid4()), "Feature", (ck,), t0, t0 + timedelta(hours=12), t0)
+
+
+def _recipient(signer_ca, cn, bits=2048):
+    skey, scert = signer_ca
+    crt = pki.cert(cn, pki.rsa_key(bits), skey, scert)
+    return kc.Recipient(str(uuid.uuid4()), cn, pki.pem(crt), f"fp-{cn}-{uuid.uuid4()}"), crt
+
+
+def _legacy_1024(signer_ca, cn):
+    """A 1024-bit certificate as registered before the key size check."""
+    r, crt = _recipient(signer_ca, cn, bits=1024)
+    key = crt.public_key().public_bytes(Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    info = kc.CertInfo(r.fingerprint, cn, cn, cn, crt.serial_number,
+                       crt.not_valid_before_utc, crt.not_valid_after_utc, key)
+    return r._replace(cert_pem="", cert=info)
+
+
+def test_small_rsa_key_rejected_at_parse(signer_ca):
+    r, _ = _recipient(signer_ca, "SCR-1024", bits=1024)
+    with pytest.raises(kc.KDMCryptoError, match="at least 2048"):
+        kc.parse_cert(r.cert_pem, r.fingerprint)
+
+
+def test_bad_recipients_fail_only_their_own_kdm(engine, signer_ca, ctx):
+    good1, _ = _recipient(signer_ca, "SCR-1")
+    good2, _ = _recipient(signer_ca, "SCR-2")
+    inline_1024, _ = _recipient(signer_ca, "SCR-3", bits=1024)
+    garbage_der = good1._replace(kdm_id=str(uuid.uuid4()), fingerprint="fp-garbage", cert_pem="",
+                                 cert=kc.parse_cert(good1.cert_pem, "fp-garbage")._replace(public_key_der=b"\x30\x00"))
+    recips = [good1, _legacy_1024(signer_ca, "SCR-4"), inline_1024, garbage_der, good2]
+
+    out = list(engine.build(ctx, recips))
+    assert [k for k, _, _ in out] == [r.kdm_id for r in recips]
+    assert out[0][1] and out[0][2] is None
+    assert out[4][1] and out[4][2] is None
+    assert "at least 2048" in out[1][2] and out[1][1] is None
+    assert "at least 2048" in out[2][2]
+    assert "public key" in out[3][2]
+
+
+def test_oaep_failure_is_a_per_kdm_error(engine, signer_ca, ctx, monkeypatch):
+    # a key that slips past the size check still only fails its own KDM
+    good, _ = _recipient(signer_ca, "SCR-OK")
+    monkeypatch.setattr(kc, "MIN_RSA_BITS", 512)
+    small = _legacy_1024(signer_ca, "SCR-OAEP")
+    out = list(engine.build(ctx, [small, good]))
+    assert out[0][1] is None and "Encryption failed" in out[0][2]
+    assert out[1][2] is None
+
+
+class _Vault:
+    def __init__(self, fail_on=None):
+        self.objects, self.fail_on = {}, fail_on
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        if self.fail_on and self.fail_on in Key:
+            raise OSError("vault unavailable")
+        self.objects[Key] = Body
+
+    def delete_objects(self, Bucket, Delete):
+        for o in Delete["Objects"]:
+            self.objects.pop(o["Key"], None)
+
+
+@pytest.fixture
+def vault_engine(engine, monkeypatch):
+    def use(vault):
+        engine.bucket = "vault"
+        engine._s3 = vault
+        monkeypatch.setattr(engine, "_upload_pool", lambda: pool)
+        return engine
+
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield use
+    pool.shutdown()
+
+
+def test_atomic_issue_uploads_nothing_when_a_recipient_fails(vault_engine, signer_ca, ctx):
+    vault = _Vault()
+    eng = vault_engine(vault)
+    good, _ = _recipient(signer_ca, "SCR-1")
+    bad, _ = _recipient(signer_ca, "SCR-2", bits=1024)
+    out = list(eng.issue(ctx, [good, bad], atomic=True))
+    assert [v for _, v, _ in out] == [None, None]
+    assert out[1][2] and vault.objects == {}
+
+    # streaming mode still stores the good one (batch issuance)
+    out = list(eng.issue(ctx, [good, bad]))
+    assert out[0][1] == f"kdm/{ctx.job_id}/{good.kdm_id}.xml" and out[1][2]
+    assert list(vault.objects) == [out[0][1]]
+
+
+def test_atomic_issue_removes_partial_upload(vault_engine, signer_ca, ctx):
+    recips = [_recipient(signer_ca, f"SCR-{i}")[0] for i in range(4)]
+    vault = _Vault(fail_on=recips[2].kdm_id)
+    eng = vault_engine(vault)
+    with pytest.raises(OSError):
+        list(eng.issue(ctx, recips, atomic=True))
+    assert vault.objects == {}
+
+    vault.fail_on = None
+    out = list(eng.issue(ctx, recips, atomic=True))
+    assert sorted(vault.objects) == sorted(v for _, v, _ in out)
@@ -0,0 +1,102 @@
+import copy
+import random
+from typing import Any
+
+import pytest
+
+from api.utils.manifest import ManifestHasher, canonical_equal, canonical_manifest_bytes, sha256_manifest
+
+# lone surrogates and mixed key types make the reference raise; the hasher must raise the same
+ALPHABET = ["a", "Z", "0", " ", '"', "\\", "\n", "\x00", "é", "e\u0301", "\u212b", "\ufb01", "\U0001f3ac", "\ud800", "\u2028"]
+
+
+class Gen:
+    def __init__(self, seed: int, alphabet=ALPHABET) -> None:
+        self.rnd = random.Random(seed)
+        self.alphabet = alphabet
+
+    def text(self) -> str:
+        return "".join(self.rnd.choice(self.alphabet) for _ in range(self.rnd.randint(0, 12)))
+
+    def value(self, depth: int = 0) -> Any:
+        rnd = self.rnd
+        kinds = ["str", "int", "float", "bool", "none"] + (["list", "dict", "tuple", "intkeys"] * 2 if depth < 4 else [])
+        k = rnd.choice(kinds)
+        if k == "str":
+            return self.text()
+        if k == "int":
+            return rnd.choice([0, 1, -1, 2 ** 70, rnd.randint(-999, 999)])
+        if k == "float":
+            return rnd.choice([0.0, -0.0, 1.0, 1e-7, 1.5e300, float("inf"), float("nan"), rnd.random()])
+        if k == "bool":
+            return rnd.choice([True, False])
+        if k == "none":
+            return None
+        if k == "list":
+            n = rnd.randint(60, 140) if depth < 2 and rnd.random() < 0.1 else rnd.randint(0, 6)
+            return [self.value(depth + 1) for _ in range(n)]
+        if k == "tuple":
+            return tuple(self.value(depth + 1) for _ in range(rnd.randint(0, 3)))
+        if k == "intkeys":
+            keys = [rnd.randint(0, 9), rnd.choice([1, 1.0, True, None, -0.0]), rnd.choice([2, "2"])]
+            return {rnd.choice(keys): self.value(depth + 1) for _ in range(rnd.randint(1, 3))}
+        return {self.text(): self.value(depth + 1) for _ in range(rnd.randint(0, 6))}
+
+
+def outcome(fn, m):
+    try:
+        return fn(m)
+    except (TypeError, ValueError) as e:
+        return type(e)
+
+
+def test_nfc_canonical_form():
+    decomposed = {"b": ["e\u0301", "x"], "a": "cafe\u0301"}
+    composed = {"a": "café", "b": ["é", "x"]}
+    assert canonical_manifest_bytes(decomposed) == canonical_manifest_bytes(composed) == '{"a":"café","b":["é","x"]}'.encode()
+    assert canonical_equal(decomposed, composed)
+    assert sha256_manifest(decomposed) == sha256_manifest(composed)
+
+
+@pytest.mark.parametrize("seed", [430, 431, 432])
+def test_hasher_matches_reference(seed):
+    gen = Gen(seed)
+    hasher = ManifestHasher(cache_size=512)
+    for _ in range(400):
+        m = gen.value()
+        want = outcome(canonical_manifest_bytes, m)
+        assert outcome(hasher.canonical_bytes, m) == want, m
+        assert outcome(hasher.canonical_bytes, m) == want, m  # warm cache
+
+
+def test_hasher_matches_reference_while_kdms_append():
+    gen = Gen(430, [c for c in ALPHABET if c != "\ud800"])
+    hasher = ManifestHasher(cache_size=512)
+    m = {"job_id": "J-1", "title": "Cafe\u0301", "kdm": [], "outputs": [gen.value() for _ in range(20)]}
+    for i in range(200):
+        m = copy.deepcopy(m)
+        m["kdm"].append({"kdm_id": str(i), "cn": gen.text(), "valid_from": "2026-01-01T00:00:00Z", "n": i, "x": 1.0 if i % 2 else 1})
+        assert outcome(hasher.canonical_bytes, m) == outcome(canonical_manifest_bytes, m)
+
+
+def test_cache_is_bounded_by_bytes():
+    hasher = ManifestHasher(cache_size=100000, cache_mb=1)
+    big = [{"file": f"reel{i}.mxf", "sha256": "ab" * 32} for i in range(40)]  # ~4 KiB: cached
+    huge = {"blob": "x" * (64 * 1024)}  # over 1 MiB / 64: rebuilt each time, never cached
+    for i in range(300):
+        m = {"job_id": f"J-{i}", "outputs": big, "huge": huge, "kdm": [{"kdm_id": str(i), "pad": "y" * 4096}]}
+        assert hasher.canonical_bytes(m) == canonical_manifest_bytes(m)
+        cache = hasher._cache
+        assert cache.weight <= cache.maxweight
+    texts = [v for _, v, _ in cache._data.values()]
+    root = canonical_manifest_bytes(m).decode()
+    assert root not in texts
+    assert all(len(t) <= hasher._entry_max for t in texts)
+    assert canonical_manifest_bytes(big).decode() in texts
+
+
+def test_cache_off():
+    m = Gen(7).value()
+    for hasher in (ManifestHasher(cache_size=0), ManifestHasher(cache_mb=0)):
+        assert hasher._cache is None
+        assert outcome(hasher.canonical_bytes, m) == outcome(canonical_manifest_bytes, m)
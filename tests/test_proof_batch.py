@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from api.utils import proof_backend, proof_batch
+from api.utils.merkle import MerkleTree
+
+
+class _CountingStore(proof_backend.MemoryProofStore):
+    def __init__(self):
+        super().__init__()
+        self.batch_saves = 0
+
+    def save_batch(self, batch):
+        self.batch_saves += 1
+        super().save_batch(batch)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    s = _CountingStore()
+    monkeypatch.setattr(proof_batch, "STORE", s)
+    monkeypatch.setattr(proof_batch, "TSA_URL", "")
+    return s
+
+
+def _sha(i):
+    return f"{i:064x}"
+
+
+def test_open_batch_is_written_once_then_on_seal(store):
+    b = proof_batch.ProofBatcher(max_leaves=300, window_s=3600)
+    for i in range(300):
+        bid, idx = b.add(f"J{i}", _sha(i))
+        assert idx == i
+    assert store.batch_saves == 2  # opened (first leaf), sealed
+    sealed = store.load_batch(bid)
+    assert sealed["status"] == "SEALED" and len(sealed["leaves"]) == 300
+    assert sealed["merkle_root"] == MerkleTree([_sha(i) for i in range(300)]).root
+
+
+def test_readd_keeps_leaf_index(store):
+    b = proof_batch.ProofBatcher(max_leaves=10, window_s=3600)
+    b.add("J0", _sha(0))
+    b.add("J1", _sha(1))
+    assert b.add("J0", _sha(7))[1] == 0
+    sealed = b.flush()
+    assert [l["sha256"] for l in sealed["leaves"]] == [_sha(7), _sha(1)]
+
+
+def test_recover_leaves_live_batches_alone(store):
+    live = proof_batch.ProofBatcher(max_leaves=100, window_s=3600, stale_s=60)
+    bid, _ = live.add("J0", _sha(0))
+    live.add("J1", _sha(1))
+
+    proof_batch.ProofBatcher(stale_s=60).recover()  # e.g. another uvicorn worker starting
+    assert store.load_batch(bid)["status"] == "OPEN"
+
+    live.add("J2", _sha(2))
+    sealed = live.flush()
+    assert sealed["merkle_root"] == MerkleTree([_sha(i) for i in range(3)]).root
+    assert store.load("J2")["merkle_root"] == sealed["merkle_root"]
+
+
+def test_recover_rebuilds_and_seals_dead_owners_batch(store):
+    dead = proof_batch.ProofBatcher(max_leaves=100, window_s=3600, stale_s=60)
+    for i in range(5):
+        bid, _ = dead.add(f"J{i}", _sha(i))
+    dead.add("J1", _sha(11))
+    # the owner stops heartbeating (process died)
+    row = store.load_batch(bid)
+    row["heartbeat_at"] = (datetime.now(timezone.utc) - timedelta(seconds=120)).isoformat()
+    store.save_batch(row)
+
+    proof_batch.ProofBatcher(stale_s=60).recover()
+    sealed = store.load_batch(bid)
+    want = [_sha(0), _sha(11), _sha(2), _sha(3), _sha(4)]
+    assert sealed["status"] == "SEALED"
+    assert [l["sha256"] for l in sealed["leaves"]] == want
+    assert sealed["merkle_root"] == MerkleTree(want).root
+    assert store.load("J3")["merkle_path"] == MerkleTree(want).path(3)
+
+
+def test_postgres_batch_members(db, customer, queue):
+    queue(customer, ["pytest-p1", "pytest-p2"])
+    for i, jid in enumerate(["pytest-p1", "pytest-p2"]):
+        assert db.proof_save(jid, {"job_id": jid, "manifest_sha256": _sha(i), "status": "BATCHED",
+                                   "batch_id": "B-pytest", "leaf_index": i})
+    members = sorted(db.proof_batch_members("B-pytest"), key=lambda r: r["leaf_index"])
+    assert [(m["job_id"], m["manifest_sha256"], m["status"]) for m in members] == [
+        ("pytest-p1", _sha(0), "BATCHED"),
+        ("pytest-p2", _sha(1), "BATCHED"),
+    ]
+
+
+def test_deleting_a_job_cascades_to_its_proof(db, pg, customer, queue):
+    queue(customer, ["pytest-p3"])
+    assert db.proof_save("pytest-p3", {"job_id": "pytest-p3", "manifest_sha256": _sha(3), "status": "BATCHED"})
+    pg.execute("delete from jobs where job_id = 'pytest-p3'")
+    assert pg.execute("select count(*) from proofs where manifest_sha256 = %s", (_sha(3),)).fetchone()[0] == 0
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+SDK = os.path.join(os.path.dirname(__file__), "..", "sdks", "python")
+
+# Run in a fresh interpreter with httpx made unimportable
+WITHOUT_HTTPX = """
+import sys
+
+class _NoHttpx:
+    def find_spec(self, name, path=None, target=None):
+        if name == "httpx" or name.startswith("httpx."):
+            raise ImportError("httpx blocked")
+
+sys.meta_path.insert(0, _NoHttpx())
+import quickdcp
+from quickdcp import *
+assert QuickDCP is quickdcp.QuickDCP
+try:
+    quickdcp.AsyncQuickDCP
+except ImportError as e:
+    assert "quickdcp[async]" in str(e)
+else:
+    raise AssertionError("AsyncQuickDCP imported without httpx")
+"""
+
+
+def test_sync_sdk_imports_without_httpx():
+    env = {**os.environ, "PYTHONPATH": os.path.abspath(SDK)}
+    r = subprocess.run([sys.executable, "-c", WITHOUT_HTTPX], env=env, capture_output=True, text=True)
+    assert r.returncode == 0, r.stderr
@@ -0,0 +1,122 @@
+"""In-process RFC-3161 (api.utils.rfc3161) against openssl ts, byte for byte."""
+import hashlib
+import secrets
+import shutil
+import subprocess
+
+import pytest
+
+from api.utils import rfc3161, tsa
+
+needs_openssl = pytest.mark.skipif(shutil.which("openssl") is None, reason="openssl not in PATH")
+
+_TSA_CNF = """\
+[ req ]
+distinguished_name = dn
+[ dn ]
+[ v3_ca ]
+basicConstraints = critical,CA:TRUE
+keyUsage = critical,keyCertSign,cRLSign
+subjectKeyIdentifier = hash
+[ v3_tsa ]
+basicConstraints = CA:FALSE
+extendedKeyUsage = critical,timeStamping
+subjectKeyIdentifier = hash
+[ tsa ]
+default_tsa = tsa_config
+[ tsa_config ]
+serial = {d}/serial
+signer_digest = sha256
+default_policy = 1.2.3.4.1
+digests = sha256
+accuracy = secs:1
+ess_cert_id_alg = {ess}
+"""
+
+
+def _run(*args: str) -> None:
+    subprocess.run(list(args), check=True, capture_output=True)
+
+
+def _ca(d, name: str, cn: str, cnf: str) -> str:
+    _run("openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", f"{d}/{name}.key",
+         "-out", f"{d}/{name}.crt", "-subj", f"/CN={cn}", "-days", "2",
+         "-config", cnf, "-extensions", "v3_ca")
+    return (d / f"{name}.crt").read_text()
+
+
+def _flip_tst_byte(tsr: bytes) -> bytes:
+    """Corrupt the TSTInfo serial number so signature/digest checks must fail."""
+    tok = rfc3161._parse_token(tsr)
+    off = tsr.find(tok.tst_der)
+    f = rfc3161._read(tok.tst_der).children()
+    i = off + f[3].body  # serialNumber content
+    return tsr[:i] + bytes([tsr[i] ^ 0x01]) + tsr[i + 1:]
+
+
+@pytest.fixture(scope="module", params=["sha1", "sha256"])
+def tsa_pki(request, tmp_path_factory):
+    """Mock CA -> TSA certificate; ess_cert_id_alg per param."""
+    d = tmp_path_factory.mktemp(f"tsa-{request.param}")
+    cnf = f"{d}/tsa.cnf"
+    (d / "tsa.cnf").write_text(_TSA_CNF.format(d=d, ess=request.param))
+    (d / "serial").write_text("01\n")
+    ca_pem = _ca(d, "ca", "QuickDCP Test CA", cnf)
+    _run("openssl", "req", "-new", "-newkey", "rsa:2048", "-nodes", "-keyout", f"{d}/tsa.key",
+         "-out", f"{d}/tsa.csr", "-subj", "/CN=QuickDCP Test TSA", "-config", cnf)
+    _run("openssl", "x509", "-req", "-in", f"{d}/tsa.csr", "-CA", f"{d}/ca.crt", "-CAkey", f"{d}/ca.key",
+         "-CAcreateserial", "-out", f"{d}/tsa.crt", "-days", "2",
+         "-extfile", cnf, "-extensions", "v3_tsa")
+    return d, cnf, ca_pem, _ca(d, "other", "Other CA", cnf)
+
+
+@needs_openssl
+def test_tsq_bytes_match_openssl():
+    for _ in range(25):
+        sha = hashlib.sha256(secrets.token_bytes(32)).hexdigest()
+        assert rfc3161.build_tsq(sha) == tsa.openssl_build_tsq(sha), sha
+
+
+@needs_openssl
+@pytest.mark.parametrize("token", [False, True], ids=["response", "token"])
+def test_tsr_verify_matches_openssl(tsa_pki, token):
+    d, cnf, ca_pem, other_ca = tsa_pki
+    sha = hashlib.sha256(secrets.token_bytes(32)).hexdigest()
+    (d / "req.tsq").write_bytes(rfc3161.build_tsq(sha))
+    cmd = ["openssl", "ts", "-reply", "-config", cnf, "-queryfile", f"{d}/req.tsq",
+           "-signer", f"{d}/tsa.crt", "-inkey", f"{d}/tsa.key", "-out", f"{d}/resp.tsr"]
+    if token:
+        cmd.append("-token_out")
+    _run(*cmd)
+    tsr = (d / "resp.tsr").read_bytes()
+
+    cases = {
+        "good": (tsr, sha, ca_pem, True),
+        "wrong digest": (tsr, hashlib.sha256(b"other").hexdigest(), ca_pem, False),
+        "untrusted CA": (tsr, sha, other_ca, False),
+        "tampered": (_flip_tst_byte(tsr), sha, ca_pem, False),
+    }
+    for name, (blob, digest, anchors, want) in cases.items():
+        got = {}
+        for impl, fn in (("inprocess", rfc3161.verify_tsr), ("openssl", tsa.openssl_verify_tsr)):
+            try:
+                fn(blob, digest, anchors)
+                got[impl] = True
+            except (rfc3161.TSRVerifyError, tsa.TSAVerifyError):
+                got[impl] = False
+        assert got["inprocess"] == got["openssl"] == want, (name, got)
+
+
+@needs_openssl
+def test_malformed_ca_pem_is_a_verify_error(tsa_pki):
+    d, cnf, ca_pem, _ = tsa_pki
+    sha = hashlib.sha256(b"manifest").hexdigest()
+    (d / "req.tsq").write_bytes(rfc3161.build_tsq(sha))
+    _run("openssl", "ts", "-reply", "-config", cnf, "-queryfile", f"{d}/req.tsq",
+         "-signer", f"{d}/tsa.crt", "-inkey", f"{d}/tsa.key", "-out", f"{d}/resp.tsr")
+    tsr = (d / "resp.tsr").read_bytes()
+    bad = ca_pem.replace("\n", "\n!", 3)
+    with pytest.raises(rfc3161.TSRVerifyError, match="invalid CA certificate"):
+        rfc3161.verify_tsr(tsr, sha, bad)
+    with pytest.raises(tsa.TSAVerifyError):
+        tsa._inprocess_verify(tsr, sha, bad)
@@ -0,0 +1,42 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.routes import verify
+from api.utils import proof_backend
+from api.utils.lru import TTLCache
+
+SHA = "ab" * 32
+
+
+@pytest.fixture
+def store(monkeypatch):
+    s = proof_backend.MemoryProofStore()
+    monkeypatch.setattr(verify, "STORE", s)
+    monkeypatch.setattr(verify, "_CACHE", TTLCache(maxsize=16, ttl=verify.PENDING_MAX_AGE))
+    return s
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(verify.router, prefix="/verify")
+    return TestClient(app)
+
+
+def test_valid_is_cached_for_a_bounded_time_only(store, client):
+    rec = store.init("pytest-v1", SHA)
+    store.save("pytest-v1", {**rec, "status": "TSA_OK", "tsa_ok": True})
+    r = client.get("/verify/pytest-v1")
+    assert r.json()["status"] == "VALID"
+    # a VALID proof can be reset by /proof/init, so it must not be immutable
+    assert r.headers["cache-control"] == f"public, max-age={verify.VALID_MAX_AGE}"
+    assert verify.VALID_MAX_AGE <= 3600
+
+    assert client.get("/verify/pytest-v1", headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+
+    store.save("pytest-v1", {**rec, "status": "PENDING", "tsa_ok": False})
+    verify._CACHE.clear()
+    r = client.get("/verify/pytest-v1")
+    assert r.json()["status"] == "PENDING"
+    assert r.headers["cache-control"] == f"public, max-age={verify.PENDING_MAX_AGE}"
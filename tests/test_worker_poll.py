@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from worker import worker
+
+
+class _Resp:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = body
+        self.ok = 200 <= status_code < 300
+
+    def json(self):
+        import json
+
+        return json.loads(self.text)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(worker.time, "sleep", slept.append)
+    monkeypatch.setitem(worker._ERRORS, "streak", 0)
+    return slept
+
+
+def test_error_response_is_not_a_job(monkeypatch, sleeps):
+    body = '{"detail": [{"loc": ["query", "wait"], "msg": "too large"}]}'
+    monkeypatch.setattr(worker.SESSION, "post", lambda *a, **k: _Resp(422, body))
+    payload = worker.fetch_next_job(max_jobs=1)
+    assert payload["status"] == "HTTP_ERROR" and payload["code"] == 422
+    assert worker.normalize_jobs(payload) == []
+    assert len(sleeps) == 1
+
+
+def test_error_backoff_grows_and_resets(monkeypatch, sleeps):
+    monkeypatch.setattr(worker.random, "uniform", lambda a, b: 1.0)
+    for _ in range(8):
+        worker.normalize_jobs({"status": "HTTP_ERROR", "code": 503, "body": ""})
+    assert sleeps == [1, 2, 4, 8, 16, 32, 60, 60]
+    assert worker.normalize_jobs({"status": "EMPTY"}) == []
+    worker.normalize_jobs({"status": "HTTP_ERROR", "code": 503, "body": ""})
+    assert sleeps[-1] == 1
+
+
+def test_next_job_clamps_long_wait(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from api.routes import internal
+
+    monkeypatch.setattr(internal, "get_listener", lambda: None)
+    monkeypatch.setattr(internal, "_claim", lambda n, w: [("pytest-j1", {}, "c1")])
+    app = FastAPI()
+    app.include_router(internal.router)
+    r = TestClient(app).post(
+        "/internal/next-job",
+        params={"wait": internal.MAX_LONG_POLL_S * 10, "max_jobs": 1},
+        headers={"x-worker-token": internal.WORKER_TOKEN, "x-worker-id": "w1"},
+    )
+    assert r.status_code == 200
+    assert r.json() == [{"job_id": "pytest-j1", "profile": {}, "customer_id": "c1"}]
+
+
+def test_long_poll_is_sliced(monkeypatch):
+    seen = {}
+
+    def post(url, params=None, headers=None, timeout=None):
+        seen.update(params=params, timeout=timeout)
+        return _Resp(200, "[]")
+
+    monkeypatch.setattr(worker.SESSION, "post", post)
+    monkeypatch.setattr(worker, "LONG_POLL_S", 25.0)
+    monkeypatch.setattr(worker, "POLL_SLICE_S", 5.0)
+    assert worker.fetch_next_job(max_jobs=2) == {"status": "OK", "data": []}
+    assert seen["params"] == {"wait": 5.0, "max_jobs": 2}
+    assert seen["timeout"] == (10, 15.0)
@@ -5,16 +5,41 @@ QuickDCP Worker (robust version)
 Continuously polls the API for jobs, handles all known weird responses,
 and safely processes jobs without ever crashing.
 
+Jobs are fetched with a long-poll (the API parks the request until a
+jobs_queued notification or LONG_POLL_S elapses) over a keep-alive
+session, and the next job is requested as soon as the current one ends.
+
+Up to WORKER_CONCURRENCY jobs run at once: each job is driven by a thread
+(I/O steps, result reporting) and hands its CPU-bound render/QC steps to a
+process pool. The API enforces queue_configs.max_concurrent_jobs per
+customer at claim time across all workers, so a wide worker never lets one
+tenant take the whole pool. SIGTERM stops claiming and drains in-flight
+jobs before exiting; long-polls are issued in POLL_SLICE_S slices so an
+idle worker notices the signal within one slice instead of holding a
+claim request open for the full LONG_POLL_S. Error responses from the API
+back off exponentially (up to a minute) instead of being retried
+immediately.
+
 Environment:
-  API_BASE       = http://quickdcp-api:8080 (Docker)
-  WORKER_TOKEN   = dev
-  POLL_MS        = 1000
+  API_BASE            = http://quickdcp-api:8080 (Docker)
+  WORKER_TOKEN        = dev
+  WORKER_ID           = <hostname>-<pid>
+  WORKER_CONCURRENCY  = 1
+  HEARTBEAT_S         = 15     (keep well under the API's QD_JOB_LEASE_S)
+  LONG_POLL_S         = 25     (0 disables long-polling)
+  POLL_SLICE_S        = 5      (longest single long-poll request; bounds how
+                                long SIGTERM waits on an idle poll)
+  POLL_MS             = 1000   (idle sleep, only used when LONG_POLL_S=0)
 """
 
 import os
+import signal
+import socket
+import threading
 import time
 import json
 import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 import requests
 
@@ -26,6 +51,14 @@ import requests
 API_BASE = os.environ.get("API_BASE", "http://quickdcp-api:8080")
 WORKER_TOKEN = os.environ.get("WORKER_TOKEN", "dev")
 POLL_MS = int(os.environ.get("POLL_MS", "1000"))
+LONG_POLL_S = float(os.environ.get("LONG_POLL_S", "25"))
+POLL_SLICE_S = float(os.environ.get("POLL_SLICE_S", "5"))
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+CONCURRENCY = max(1, int(os.environ.get("WORKER_CONCURRENCY", "1")))
+HEARTBEAT_S = float(os.environ.get("HEARTBEAT_S", "15"))
+
+# One keep-alive connection to the API for the worker's lifetime
+SESSION = requests.Session()
 
 
 def log(msg: str) -> None:
@@ -36,16 +69,28 @@ def log(msg: str) -> None:
 # HTTP
 # ---------------------------------------------------------------------------
 
-def fetch_next_job() -> Dict[str, Any]:
+def _headers() -> Dict[str, str]:
+    return {"x-worker-token": WORKER_TOKEN, "x-worker-id": WORKER_ID}
+
+
+def fetch_next_job(max_jobs: Optional[int] = None) -> Dict[str, Any]:
     """Call next-job endpoint and normalize all result shapes."""
 
     url = f"{API_BASE}/jobs/internal/next-job"
+    params: Dict[str, Any] = {}
+    # Short slices: the main loop re-checks DRAINING between requests
+    wait = min(LONG_POLL_S, POLL_SLICE_S) if POLL_SLICE_S > 0 else LONG_POLL_S
+    if wait > 0:
+        params["wait"] = wait
+    if max_jobs is not None:
+        params["max_jobs"] = max_jobs
 
     try:
-        resp = requests.post(
+        resp = SESSION.post(
             url,
-            headers={"x-worker-token": WORKER_TOKEN},
-            timeout=10,
+            params=params or None,
+            headers=_headers(),
+            timeout=(10, wait + 10),
         )
     except Exception as e:
         return {"status": "NETWORK_ERROR", "error": str(e)}
@@ -54,6 +99,11 @@ def fetch_next_job() -> Dict[str, Any]:
     if resp.status_code == 401:
         return {"status": "BAD_TOKEN"}
 
+    # Any other error (422, 5xx, proxy pages): never mistake the body for a job
+    if not resp.ok:
+        body = resp.text.strip().replace("\n", " ")[:500]
+        return {"status": "HTTP_ERROR", "code": resp.status_code, "body": body}
+
     # API uses 200 ALWAYS, even for “no job”
     # Content-type always application/json
     try:
@@ -78,92 +128,275 @@ def fetch_next_job() -> Dict[str, Any]:
     return {"status": "OK", "data": data}
 
 
+def send_heartbeat(job_ids: List[str]) -> Optional[List[str]]:
+    """Report in-flight jobs; returns the job ids the API still has us on."""
+    try:
+        resp = SESSION.post(
+            f"{API_BASE}/jobs/internal/heartbeat",
+            headers=_headers(),
+            json={"worker_id": WORKER_ID, "job_ids": job_ids},
+            timeout=10,
+        )
+        if resp.status_code != 200:
+            log(f"heartbeat rejected: HTTP {resp.status_code}")
+            return None
+        return list(resp.json().get("jobs", []))
+    except Exception as e:
+        log(f"heartbeat error: {e}")
+        return None
+
+
+def report_job(job_id: str, status: str) -> None:
+    """Mark a job finished (PASS/FAIL); retried a few times."""
+    for attempt in range(1, 4):
+        try:
+            resp = SESSION.post(
+                f"{API_BASE}/jobs/internal/update-job",
+                headers=_headers(),
+                json={"job_id": job_id, "status": status},
+                timeout=10,
+            )
+            if resp.status_code == 200:
+                return
+            if resp.status_code == 409:
+                log(f"update-job {job_id}: lease lost, result dropped")
+                return
+            log(f"update-job {job_id} → HTTP {resp.status_code}")
+        except Exception as e:
+            log(f"update-job {job_id} error: {e}")
+        time.sleep(attempt)
+
+
 # ---------------------------------------------------------------------------
 # NORMALIZER
 # ---------------------------------------------------------------------------
 
-def normalize_job(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    """Convert raw API responses into a clean single job dict."""
+# Consecutive HTTP errors from next-job (reset by any good response)
+_ERRORS = {"streak": 0}
+ERROR_BACKOFF_MAX_S = 60.0
+
+
+def _error_backoff() -> float:
+    """Exponential backoff with jitter: 1s, 2s, 4s ... ERROR_BACKOFF_MAX_S."""
+    _ERRORS["streak"] += 1
+    delay = min(ERROR_BACKOFF_MAX_S, 2.0 ** (_ERRORS["streak"] - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def normalize_jobs(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Convert raw API responses into a clean list of job dicts."""
 
     st = payload.get("status")
+    if st in ("OK", "EMPTY"):
+        _ERRORS["streak"] = 0
 
     if st == "EMPTY":
-        return None
+        return []
 
     if st == "BAD_TOKEN":
         log("invalid WORKER_TOKEN — worker cannot continue")
         time.sleep(2)
-        return None
+        return []
 
     if st == "NETWORK_ERROR":
         log(f"network error: {payload.get('error')}")
         time.sleep(1)
-        return None
+        return []
 
     if st == "BAD_JSON":
         log(f"non-JSON response from API: {payload.get('body')}")
         time.sleep(1)
-        return None
+        return []
+
+    if st == "HTTP_ERROR":
+        delay = _error_backoff()
+        log(f"API error {payload.get('code')}: {payload.get('body')} (retry in {delay:.0f}s)")
+        time.sleep(delay)
+        return []
 
     # status == OK
     data = payload.get("data")
 
     # dict → good job
     if isinstance(data, dict):
-        return data
+        return [data]
 
-    # list → expected either [job] or garbage
+    # list → expected list-of-dicts or garbage
     if isinstance(data, list):
-        if len(data) == 0:
-            return None
+        jobs = []
+        for item in data:
+            if not isinstance(item, dict):
+                log(f"list item is not a dict: {item!r}")
+                continue
+            jobs.append(item)
+        return jobs
 
-        first = data[0]
+    # unknown garbage
+    log(f"weird API payload ignored: {data!r}")
+    return []
 
-        if not isinstance(first, dict):
-            log(f"first list item is not a dict: {first!r}")
-            return None
 
-        return first
+def normalize_job(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Convert raw API responses into a clean single job dict."""
+    jobs = normalize_jobs(payload)
+    return jobs[0] if jobs else None
+
+
+# ---------------------------------------------------------------------------
+# IN-FLIGHT TRACKING / HEARTBEAT
+# ---------------------------------------------------------------------------
+
+class InFlight:
+    """Thread-safe accounting of jobs this worker is running."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job["job_id"]] = {
+                "customer_id": job.get("customer_id"),
+                "started": time.time(),
+            }
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._jobs)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._jobs)
 
-    # unknown garbage
-    log(f"weird API payload ignored: {data!r}")
-    return None
+
+IN_FLIGHT = InFlight()
+DRAINING = threading.Event()
+SLOT_FREED = threading.Event()
+
+
+def _ignore_signals() -> None:
+    # Pool children must not die on SIGTERM/SIGINT: the parent drains them.
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
 
 
 # ---------------------------------------------------------------------------
-# MAIN LOOP
+# JOB STEPS
 # ---------------------------------------------------------------------------
 
-def process_job(job: Dict[str, Any]):
-    """Placeholder processing logic."""
+def render_step(job: Dict[str, Any]) -> Dict[str, Any]:
+    """CPU-bound encode placeholder (runs in the process pool)."""
+    time.sleep(1)  # Simulated work
+    return {"job_id": job.get("job_id"), "outputs": {}}
+
+
+def qc_step(job: Dict[str, Any], render: Dict[str, Any]) -> Dict[str, Any]:
+    """CPU-bound QC placeholder (runs in the process pool)."""
+    return {"ok": True}
+
+
+def process_job(job: Dict[str, Any], cpu: Optional[ProcessPoolExecutor] = None) -> str:
+    """Placeholder processing logic; returns the final status.
+
+    I/O steps run on the calling thread, CPU steps go to `cpu` when given.
+    """
     jid = job.get("job_id", "unknown")
     log(f"processing job {jid}")
 
-    # Simulated work
-    time.sleep(1)
+    def run(fn, *args):
+        return cpu.submit(fn, *args).result() if cpu else fn(*args)
 
-    # Normally you would POST results here
+    # Normally: download input (I/O) → render (CPU) → QC (CPU) → upload (I/O)
+    render = run(render_step, job)
+    qc = run(qc_step, job, render)
+    return "PASS" if qc.get("ok") else "FAIL"
 
 
-def main():
-    log(f"start api={API_BASE} token='{WORKER_TOKEN}'")
+def run_job(job: Dict[str, Any], cpu: ProcessPoolExecutor) -> None:
+    """Thread-pool entry: process, report, release the slot."""
+    jid = job["job_id"]
+    try:
+        status = process_job(job, cpu)
+    except Exception as e:
+        log(f"job {jid} failed: {e}")
+        status = "FAIL"
+    try:
+        report_job(jid, status)
+        log(f"job {jid} → {status}")
+    finally:
+        IN_FLIGHT.remove(jid)
+        SLOT_FREED.set()
+
 
+def heartbeat_loop() -> None:
+    """Heartbeat every in-flight job until the worker exits."""
     while True:
-        payload = fetch_next_job()
-        job = normalize_job(payload)
+        time.sleep(HEARTBEAT_S)
+        ids = IN_FLIGHT.ids()
+        if not ids:
+            if DRAINING.is_set():
+                return
+            continue
+        held = send_heartbeat(ids)
+        if held is not None:
+            for jid in set(ids) - set(held):
+                log(f"job {jid} no longer held by this worker (lease lost)")
+
+
+# ---------------------------------------------------------------------------
+# MAIN LOOP
+# ---------------------------------------------------------------------------
+
+def _on_sigterm(signum, frame) -> None:
+    log(f"signal {signum}: draining {IN_FLIGHT.count()} in-flight job(s)")
+    DRAINING.set()
+    SLOT_FREED.set()
 
-        if job is None:
-            time.sleep(POLL_MS / 1000)
+
+def main():
+    log(f"start api={API_BASE} id={WORKER_ID} concurrency={CONCURRENCY}")
+
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    signal.signal(signal.SIGINT, _on_sigterm)
+
+    cpu = ProcessPoolExecutor(max_workers=CONCURRENCY, initializer=_ignore_signals)
+    io = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="job")
+    threading.Thread(target=heartbeat_loop, name="heartbeat", daemon=True).start()
+
+    while not DRAINING.is_set():
+        free = CONCURRENCY - IN_FLIGHT.count()
+        if free <= 0:
+            # Wait for a running job to finish before claiming more
+            SLOT_FREED.wait(1.0)
+            SLOT_FREED.clear()
             continue
 
-        # Ensure job_id exists
-        if "job_id" not in job:
-            log(f"job missing job_id: {job}")
-            time.sleep(POLL_MS / 1000)
+        payload = fetch_next_job(max_jobs=free)
+        jobs = normalize_jobs(payload)
+
+        if not jobs:
+            # Long-poll already waited server-side; only sleep in poll mode
+            if LONG_POLL_S <= 0:
+                time.sleep(POLL_MS / 1000)
             continue
 
-        process_job(job)
-        time.sleep(POLL_MS / 1000)
+        for job in jobs:
+            # Ensure job_id exists
+            if "job_id" not in job:
+                log(f"job missing job_id: {job}")
+                continue
+            # Claimed jobs are ours even if a drain started meanwhile
+            IN_FLIGHT.add(job)
+            io.submit(run_job, job, cpu)
+
+    # Graceful drain: finish everything already claimed
+    io.shutdown(wait=True)
+    cpu.shutdown(wait=True)
+    log("drained; exiting")
 
 
 if __name__ == "__main__":